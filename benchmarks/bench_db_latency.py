@@ -0,0 +1,146 @@
+"""
+Benchmark API read latency while the monitor writes back a full cycle.
+
+Runs the same workload against a default SQLite engine (rollback journal,
+no busy timeout) and against the tuned engine from app.db.database, then
+prints read latency percentiles and the number of failed reads for each.
+
+Usage:
+    python benchmarks/bench_db_latency.py [--devices 2000] [--readers 4] [--duration 10] [--change-rate 0.01]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import statistics
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker, joinedload
+from app.db.database import Base, create_db_engine
+from app.db.models import Device, Alert
+
+
+def populate(engine, device_count):
+    """Create the schema and insert the test fleet with some alert history."""
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.bulk_insert_mappings(Device, [
+        {"id": i, "name": f"device-{i}", "ip": f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+         "type": "server", "status": "online", "packet_loss": 0.0, "jitter": 0.0, "uptime": 0.0}
+        for i in range(1, device_count + 1)
+    ])
+    session.bulk_insert_mappings(Alert, [
+        {"device_id": random.randint(1, device_count), "severity": "critical", "type": "Connectivity",
+         "message": f"alert {i}", "status": random.choice(["active", "resolved"])}
+        for i in range(device_count * 5)
+    ])
+    session.commit()
+    session.close()
+
+
+def monitor_cycles(Session, device_count, change_rate, stop):
+    """
+    Write back full monitor cycles until stopped, as update_devices_status
+    does: one transaction per cycle, with a bulk UPDATE of every device,
+    the resolution of the alerts of the devices back online and an alert
+    for every device gone offline (`change_rate` of the fleet changes
+    status every cycle).
+    """
+    statuses = {i: "online" for i in range(1, device_count + 1)}
+    cycles = 0
+    while not stop.is_set():
+        changed = random.sample(range(1, device_count + 1), int(device_count * change_rate))
+        for i in changed:
+            statuses[i] = "offline" if statuses[i] == "online" else "online"
+        session = Session()
+        try:
+            session.bulk_update_mappings(Device, [
+                {"id": i, "status": status, "packet_loss": random.random() * 10,
+                 "jitter": random.random(), "uptime": cycles / 120 if status == "online" else 0}
+                for i, status in statuses.items()
+            ])
+            recovered = [i for i in changed if statuses[i] == "online"]
+            if recovered:
+                session.query(Alert).filter(Alert.device_id.in_(recovered), Alert.status == "active").update(
+                    {"status": "resolved"}, synchronize_session=False
+                )
+            session.bulk_insert_mappings(Alert, [
+                {"device_id": i, "severity": "critical", "type": "Connectivity",
+                 "message": "bench", "status": "active"}
+                for i in changed if statuses[i] == "offline"
+            ])
+            session.commit()
+        except Exception:
+            session.rollback()
+        finally:
+            session.close()
+        cycles += 1
+    return cycles
+
+
+def reader(Session, stop, latencies, errors):
+    """Issue the API's device status count and alert page queries, recording latency."""
+    while not stop.is_set():
+        session = Session()
+        started = time.perf_counter()
+        try:
+            session.query(Device.status, func.count(Device.id)).group_by(Device.status).all()
+            session.query(Alert).options(joinedload(Alert.device)).filter(
+                Alert.status == "active"
+            ).order_by(Alert.timestamp.desc(), Alert.id.desc()).limit(100).all()
+            latencies.append((time.perf_counter() - started) * 1000)
+        except Exception:
+            errors.append(1)
+        finally:
+            session.close()
+
+
+def run(label, engine, args):
+    populate(engine, args.devices)
+    Session = sessionmaker(bind=engine)
+    stop = threading.Event()
+    latencies, errors, cycles = [], [], []
+
+    threads = [threading.Thread(target=reader, args=(Session, stop, latencies, errors)) for _ in range(args.readers)]
+    threads.append(threading.Thread(target=lambda: cycles.append(monitor_cycles(Session, args.devices, args.change_rate, stop))))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    if latencies:
+        ordered = sorted(latencies)
+        pct = lambda p: ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+        print(f"{label:>8}: {len(latencies)} reads, {len(errors)} failed, {cycles[0]} write cycles | "
+              f"p50 {statistics.median(ordered):.1f} ms, p95 {pct(95):.1f} ms, "
+              f"p99 {pct(99):.1f} ms, max {ordered[-1]:.1f} ms")
+    else:
+        print(f"{label:>8}: no successful reads, {len(errors)} failed, {cycles[0]} write cycles")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--change-rate", type=float, default=0.01, help="fraction of the devices changing status every cycle")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        default_url = f"sqlite:///{os.path.join(tmp, 'default.db')}"
+        tuned_url = f"sqlite:///{os.path.join(tmp, 'tuned.db')}"
+        # The engine configuration netwatch used before the tuning
+        run("default", create_engine(default_url, connect_args={"check_same_thread": False}), args)
+        run("tuned", create_db_engine(tuned_url), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import os
+import json
+import gzip
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+import httpx
+from app.monitor import run_scheduler, shutdown_event
+from app.registry import DeviceRegistry, DeviceRecord, DEVICE_FIELDS
+from app.settings import settings_store
+
+# Server the agent reports to, and the name its devices are assigned to (Device.agent)
+AGENT_SERVER = os.getenv("NETWATCH_AGENT_SERVER", "http://127.0.0.1:8000")
+AGENT_NAME = os.getenv("NETWATCH_AGENT_NAME", socket.gethostname())
+# Shared secret expected by the server in the X-Agent-Token header, if any
+AGENT_TOKEN = os.getenv("NETWATCH_AGENT_TOKEN", "")
+# Directory of the result batches waiting for the server, and its size limit
+AGENT_SPOOL_DIR = os.getenv("NETWATCH_AGENT_SPOOL_DIR", os.path.join("data", "agent-spool"))
+AGENT_SPOOL_MAX_BYTES = int(os.getenv("NETWATCH_AGENT_SPOOL_MAX_BYTES", str(100 * 1024 * 1024)))
+# Interval (in seconds) between two shipments of results to the server
+SHIP_INTERVAL = 10
+# Maximum number of results per shipment
+SHIP_BATCH_SIZE = 5000
+# Timeout (in seconds) of the requests to the server
+REQUEST_TIMEOUT = 10
+# Device attributes that change the way a device is probed
+PROBE_FIELDS = tuple(field for field in DEVICE_FIELDS if field not in ("status", "packet_loss", "jitter", "uptime"))
+
+
+class ResultSpool:
+    """
+    Directory of compressed result batches that could not be sent yet.
+
+    Batches are files named after their creation time, so they are
+    replayed in order. When the spool exceeds `max_bytes`, the oldest
+    batches are dropped.
+    """
+
+    def __init__(self, directory: str = AGENT_SPOOL_DIR, max_bytes: int = AGENT_SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def pending(self):
+        """Paths of the spooled batches, oldest first."""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".json.gz"))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def save(self, payload: bytes) -> None:
+        path = os.path.join(self.directory, f"{time.time_ns()}.json.gz")
+        with open(path + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+
+        paths = self.pending()
+        total = sum(os.path.getsize(p) for p in paths)
+        while total > self.max_bytes and len(paths) > 1:
+            oldest = paths.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            logging.warning(f"Result spool full, dropped {os.path.basename(oldest)}")
+
+
+class Agent:
+    """
+    Probe the devices assigned to this agent and report to the server.
+
+    The device list and the settings are pulled from the server API every
+    SETTINGS_RELOAD_INTERVAL. Probe results are collected from the monitor
+    loop, and shipped every SHIP_INTERVAL as gzip-compressed JSON batches
+    to POST /api/agent/results. Batches that cannot be delivered are
+    spooled on disk, and replayed in order once the server is back.
+    """
+
+    def __init__(self, server: str = AGENT_SERVER, name: str = AGENT_NAME, token: str = AGENT_TOKEN,
+                 spool: ResultSpool = None):
+        self.name = name
+        self.client = httpx.Client(
+            base_url=server, timeout=REQUEST_TIMEOUT, headers={"X-Agent-Token": token} if token else {}
+        )
+        self.spool = spool or ResultSpool()
+        self.inventory = DeviceRegistry()
+        self.inventory.loaded = True
+        self._results = []
+        self._lock = threading.Lock()
+
+    def sync(self):
+        """
+        Pull the settings and the assigned devices from the server.
+
+        Returns:
+            The current settings snapshot (unchanged if the server is unreachable)
+        """
+        try:
+            response = self.client.get("/api/settings")
+            response.raise_for_status()
+            settings = settings_store.publish(response.json())
+            response = self.client.get("/api/devices", params={"agent": self.name})
+            response.raise_for_status()
+            devices = response.json()["devices"]
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            logging.warning(f"Cannot sync with the server: {e}")
+            return settings_store.current
+
+        known = {record.id: record for record in self.inventory.records()}
+        changed = []
+        for device in devices:
+            record = DeviceRecord(**device)
+            previous = known.pop(record.id, None)
+            if previous is None or any(getattr(previous, f) != getattr(record, f) for f in PROBE_FIELDS):
+                changed.append(record)
+        self.inventory.upsert_records(changed)
+        for device_id in known:
+            self.inventory.remove(device_id)
+        if changed or known:
+            logging.info(f"Device list synced: {len(changed)} added or changed, {len(known)} removed")
+        return settings
+
+    def collect(self, results, settings) -> None:
+        """Queue a batch of probe results for the next shipment (the `write` of the monitor loop)."""
+        with self._lock:
+            self._results.extend(results)
+
+    def _post(self, payload: bytes) -> None:
+        response = self.client.post(
+            "/api/agent/results", content=payload,
+            headers={
+                "Content-Type": "application/json", "Content-Encoding": "gzip",
+                # Lets the server move the result timestamps to its own clock
+                "X-Agent-Time": repr(time.time())
+            }
+        )
+        if response.status_code in (400, 413, 422):
+            # Retrying a batch the server rejects would block the ones after it
+            logging.error(f"Server rejected a batch of results ({response.status_code}): {response.text}")
+            return
+        response.raise_for_status()
+
+    def ship(self) -> None:
+        """Replay the spooled batches, then send the collected results, spooling what can't be sent."""
+        with self._lock:
+            results, self._results = self._results, []
+        payloads = [
+            gzip.compress(json.dumps({"agent": self.name, "results": results[i:i + SHIP_BATCH_SIZE]}).encode())
+            for i in range(0, len(results), SHIP_BATCH_SIZE)
+        ]
+        try:
+            for path in self.spool.pending():
+                with open(path, "rb") as f:
+                    self._post(f.read())
+                os.remove(path)
+                logging.info(f"Replayed spooled results {os.path.basename(path)}")
+            while payloads:
+                self._post(payloads[0])
+                payloads.pop(0)
+        except httpx.HTTPError as e:
+            logging.warning(f"Cannot send results to the server, spooling them: {e}")
+            for payload in payloads:
+                self.spool.save(payload)
+
+    def run_shipper(self) -> None:
+        """Ship the results every SHIP_INTERVAL until shutdown."""
+        while not shutdown_event.wait(SHIP_INTERVAL):
+            self.ship()
+
+    def run(self) -> None:
+        """Run the agent until shutdown (or interrupted)."""
+        logging.info(f"Starting agent {self.name}, reporting to {self.client.base_url}")
+        shipper = threading.Thread(target=self.run_shipper, daemon=True)
+        shipper.start()
+        try:
+            while not shutdown_event.is_set():
+                try:
+                    asyncio.run(run_scheduler(self.inventory, self.collect, agent=self.name, load_settings=self.sync))
+                except Exception as e:
+                    logging.error(f"Error in agent monitoring: {e}")
+                    shutdown_event.wait(5)
+        except KeyboardInterrupt:
+            logging.info("Agent interrupted.")
+        finally:
+            shutdown_event.set()
+            shipper.join()
+            self.ship()
+            self.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Probe devices locally and report the results to a netwatch server.")
+    parser.add_argument("--server", default=AGENT_SERVER, help="URL of the netwatch server")
+    parser.add_argument("--name", default=AGENT_NAME, help="Agent name, as set in the agent field of its devices")
+    parser.add_argument("--token", default=AGENT_TOKEN, help="Shared agent token of the server")
+    parser.add_argument("--spool-dir", default=AGENT_SPOOL_DIR, help="Directory of the results waiting for the server")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    Agent(args.server, args.name, args.token, ResultSpool(args.spool_dir)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import math
+import time
+import threading
+import numpy as np
+
+# Metrics with a baseline: name -> (label, unit, smallest deviation from the median worth an alert)
+# (packet loss has its own threshold alert in the monitor)
+BASELINE_METRICS = {
+    "latency": ("latency", " ms", 5.0),
+    "jitter": ("jitter", " ms", 5.0),
+}
+# Histogram buckets: [0, BUCKET_MIN), then growing by BUCKET_GROWTH (the last one is open-ended)
+BUCKET_COUNT = 24
+BUCKET_MIN = 0.1
+BUCKET_GROWTH = 1.6
+# Histograms of every metric: one per hour of the day, and one over all hours
+HOURS = 24
+ALL_HOURS = HOURS
+# Samples a histogram needs before it serves as a baseline
+MIN_SAMPLES = 30
+# Counts are halved when one reaches this limit, so older samples fade out
+MAX_COUNT = np.iinfo(np.uint16).max
+# A value is anomalous above ANOMALY_FACTOR times the ANOMALY_QUANTILE of its baseline...
+ANOMALY_QUANTILE = 0.99
+ANOMALY_FACTOR = 1.5
+# ...for ANOMALY_PERSISTENCE consecutive samples
+ANOMALY_PERSISTENCE = 3
+# Consecutive anomalous samples after which they are learned (the new normal of a changed link)
+ANOMALY_ADAPTATION = 120
+
+# Upper edge of every bucket
+BUCKET_EDGES = np.array([BUCKET_MIN * BUCKET_GROWTH ** i for i in range(BUCKET_COUNT - 1)] + [math.inf])
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+
+def bucket_of(value: float) -> int:
+    """Histogram bucket of a value."""
+    if value < BUCKET_MIN:
+        return 0
+    return min(1 + int(math.log(value / BUCKET_MIN) / _LOG_GROWTH), BUCKET_COUNT - 1)
+
+
+def quantile(histogram, q: float) -> float:
+    """Quantile of a histogram, as the upper edge of its bucket (over-estimated by at most BUCKET_GROWTH)."""
+    cumulative = np.cumsum(histogram)
+    return float(BUCKET_EDGES[np.searchsorted(cumulative, q * cumulative[-1])])
+
+
+def median(histogram) -> float:
+    """Median of a histogram, 0 when it falls in the first bucket (values below BUCKET_MIN)."""
+    value = quantile(histogram, 0.5)
+    return 0.0 if value == BUCKET_EDGES[0] else value
+
+
+class DeviceBaseline:
+    """Histograms (metric × hour × bucket) and anomaly streaks of a device, 2.4 KB in all."""
+
+    __slots__ = ("counts", "streaks")
+
+    def __init__(self):
+        self.counts = np.zeros((len(BASELINE_METRICS), HOURS + 1, BUCKET_COUNT), dtype=np.uint16)
+        self.streaks = [0] * len(BASELINE_METRICS)
+
+    def histogram(self, metric: int, hour: int):
+        """Baseline of a metric at an hour: its histogram, or the all-hours one while it has too few samples."""
+        for histogram in (self.counts[metric, hour], self.counts[metric, ALL_HOURS]):
+            if histogram.sum() >= MIN_SAMPLES:
+                return histogram
+        return None
+
+
+class BaselineEngine:
+    """
+    Learn what is normal for every device, and spot deviations from it.
+
+    The latency and jitter of every device are recorded in
+    log-scale histograms, one per hour of the day (plus one over all
+    hours, used until the hourly one has MIN_SAMPLES samples), so daily
+    patterns such as a busy link in the evening are part of the baseline.
+    Recording a sample and checking it are O(1), and the memory used per
+    device is fixed. A value more than ANOMALY_FACTOR times the
+    ANOMALY_QUANTILE of its baseline (and significantly above its median)
+    is anomalous; ANOMALY_PERSISTENCE anomalous samples in a row are
+    reported once. Anomalous samples are not learned, unless they go on
+    for ANOMALY_ADAPTATION samples.
+    """
+
+    def __init__(self):
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def forget(self, device_id) -> None:
+        with self._lock:
+            self._devices.pop(device_id, None)
+
+    def observe(self, device_id, values: dict, timestamp: float = None):
+        """
+        Check the metrics of a probe result against the baselines of the device, then learn them.
+
+        Args:
+            device_id: ID of the device
+            values: Values of the BASELINE_METRICS (missing or None when not measured)
+            timestamp: Time of the probe (UNIX timestamp), now if not given
+
+        Returns:
+            List of (metric name, value, median, quantile) of the metrics that just became anomalous
+        """
+        hour = time.localtime(timestamp).tm_hour
+        anomalies = []
+        with self._lock:
+            baseline = self._devices.get(device_id)
+            if baseline is None:
+                baseline = self._devices[device_id] = DeviceBaseline()
+            for metric, (name, (_, _, min_deviation)) in enumerate(BASELINE_METRICS.items()):
+                value = values.get(name)
+                if value is None or math.isnan(value):
+                    continue
+                histogram = baseline.histogram(metric, hour)
+                anomalous = False
+                if histogram is not None:
+                    usual = median(histogram)
+                    upper = quantile(histogram, ANOMALY_QUANTILE)
+                    anomalous = value > upper * ANOMALY_FACTOR and value - usual >= min_deviation
+                baseline.streaks[metric] = baseline.streaks[metric] + 1 if anomalous else 0
+                if baseline.streaks[metric] == ANOMALY_PERSISTENCE:
+                    anomalies.append((name, value, usual, upper))
+                if 0 < baseline.streaks[metric] < ANOMALY_ADAPTATION:
+                    continue
+
+                bucket = bucket_of(value)
+                for counts in (baseline.counts[metric, hour], baseline.counts[metric, ALL_HOURS]):
+                    if counts[bucket] == MAX_COUNT:
+                        counts >>= 1
+                    counts[bucket] += 1
+        return anomalies
+
+    def snapshot(self, device_id, timestamp: float = None):
+        """Median and quantile of the current baselines of a device (None while still learning)."""
+        hour = time.localtime(timestamp).tm_hour
+        with self._lock:
+            baseline = self._devices.get(device_id)
+            if baseline is None:
+                return None
+            result = {}
+            for metric, name in enumerate(BASELINE_METRICS):
+                histogram = baseline.histogram(metric, hour)
+                if histogram is None:
+                    result[name] = None
+                    continue
+                usual, upper = median(histogram), quantile(histogram, ANOMALY_QUANTILE)
+                result[name] = {
+                    "median": usual if math.isfinite(usual) else None,
+                    "upper": upper if math.isfinite(upper) else None,
+                    "samples": int(histogram.sum())
+                }
+            return result
+
+
+# Shared baselines, fed by the monitor with every probe result
+device_baselines = BaselineEngine()
@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+import codecs
+
+# Number of devices validated and inserted per transaction
+BULK_BATCH_SIZE = 500
+# Maximum number of row errors reported by an import
+MAX_REPORTED_ERRORS = 1000
+# Columns of a CSV export (the import ignores the calculated ones)
+EXPORT_COLUMNS = (
+    "id", "name", "ip", "type", "status", "mac_address", "owner",
+    "packet_loss", "jitter", "uptime", "custom_alerts", "check_interval",
+    "probe_type", "probe_target", "agent"
+)
+
+
+async def iter_lines(chunks):
+    """
+    Split a stream of byte chunks into decoded text lines.
+
+    Yields:
+        Tuples of (line number, line without its line terminator)
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    line_number = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            line_number += 1
+            yield line_number, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield line_number + 1, pending.rstrip("\r")
+
+
+def _normalize(record: dict) -> dict:
+    """Turn empty CSV cells into missing values and split the custom alerts."""
+    record = {key: value for key, value in record.items() if value not in ("", None)}
+    alerts = record.get("custom_alerts")
+    if isinstance(alerts, str):
+        record["custom_alerts"] = [alert.strip() for alert in alerts.split(",") if alert.strip()]
+    return record
+
+
+async def parse_device_stream(chunks, fmt: str = "csv"):
+    """
+    Parse devices from a streamed CSV (with a header line) or NDJSON body.
+
+    Lines are parsed as they arrive, so the body is never held in memory.
+    Blank lines are skipped. A CSV field may not span several lines.
+
+    Yields:
+        Tuples of (line number, record dict, None) or (line number, None, error message)
+    """
+    header = None
+    async for line_number, line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Expected a JSON object"
+                continue
+        else:
+            row = next(csv.reader([line]))
+            if header is None:
+                header = [column.strip().lower() for column in row]
+                continue
+            if len(row) > len(header):
+                yield line_number, None, f"Expected at most {len(header)} fields, got {len(row)}"
+                continue
+            record = dict(zip(header, row))
+        yield line_number, _normalize(record), None
+
+
+def format_csv_rows(rows, header: bool = False) -> str:
+    """Format rows of EXPORT_COLUMNS values as CSV text, optionally preceded by the header."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
@@ -1,14 +1,14 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func, tuple_, and_, or_
 from .models import Device, Setting, Alert
+from app.registry import device_registry, DeviceRecord
 import time
 from functools import lru_cache
 from typing import Dict, List, Optional, Tuple, Any
 
 # Cache for database query results
 _db_cache = {
-    'settings': {},
-    'settings_timestamp': 0,
     'devices_count': 0,
     'devices_timestamp': 0,
     'alerts_count': {},
@@ -37,8 +37,6 @@ def invalidate_cache(cache_key: Optional[str] = None) -> None:
     else:
         # Invalidate all cache entries
         _db_cache = {
-            'settings': {},
-            'settings_timestamp': 0,
             'devices_count': 0,
             'devices_timestamp': 0,
             'alerts_count': {},
@@ -50,6 +48,105 @@ def get_devices(db: Session):
     """Retrieve all devices from the database."""
     return db.query(Device).all()
 
+# Columns the device list can be sorted by, each indexed together with the ID
+# (the ID by the primary key, the IP, which is unique, by its own index)
+DEVICE_SORT_COLUMNS = {
+    "id": Device.id,
+    "name": Device.name,
+    "ip": Device.ip,
+    "type": Device.type,
+    "owner": Device.owner,
+    "status": Device.status,
+    "custom_alerts": Device.custom_alerts,
+    "packet_loss": Device.packet_loss,
+    "jitter": Device.jitter,
+    "uptime": Device.uptime,
+}
+
+def filter_devices(
+    query, status: str = None, device_type: str = None, owner: str = None, ip_prefix: str = None, agent: str = None
+):
+    """Apply the device list filters to a query.
+    
+    The IP prefix is matched with a range condition rather than LIKE, so
+    that the unique index on the IP can be used.
+    """
+    if status is not None:
+        query = query.filter(Device.status == status)
+    if device_type is not None:
+        query = query.filter(Device.type == device_type)
+    if owner is not None:
+        query = query.filter(Device.owner == owner)
+    if agent is not None:
+        query = query.filter(Device.agent == agent)
+    if ip_prefix:
+        upper_bound = ip_prefix[:-1] + chr(ord(ip_prefix[-1]) + 1)
+        query = query.filter(Device.ip >= ip_prefix, Device.ip < upper_bound)
+    return query
+
+def _apply_device_cursor(query, column, descending: bool, after: Optional[Tuple[Any, int]]):
+    """Restrict a sorted device query to the rows after a (sort value, id) cursor.
+    
+    NULL sort values come first in ascending order and last in descending
+    order, as they do natively in SQLite.
+    """
+    if after is None:
+        return query
+    value, device_id = after
+    if descending:
+        if value is None:
+            return query.filter(column.is_(None), Device.id < device_id)
+        return query.filter(or_(tuple_(column, Device.id) < (value, device_id), column.is_(None)))
+    if value is None:
+        return query.filter(or_(and_(column.is_(None), Device.id > device_id), column.isnot(None)))
+    return query.filter(tuple_(column, Device.id) > (value, device_id))
+
+def get_devices_page(
+    db: Session,
+    limit: Optional[int] = 100,
+    sort: str = "name",
+    descending: bool = False,
+    after: Optional[Tuple[Any, int]] = None,
+    **filters
+):
+    """Retrieve a page of devices, filtered and sorted in SQL.
+    
+    Args:
+        db: Database session
+        limit: Maximum number of devices to return, or None for all
+        sort: Sort column, one of DEVICE_SORT_COLUMNS
+        descending: If True, sort in descending order
+        after: Optional (sort value, id) keyset cursor; only the devices after it are returned
+        **filters: status, device_type, owner and ip_prefix filters (see filter_devices)
+        
+    Returns:
+        List of Device objects
+    """
+    column = DEVICE_SORT_COLUMNS[sort]
+    query = filter_devices(db.query(Device), **filters)
+    query = _apply_device_cursor(query, column, descending, after)
+    if descending:
+        query = query.order_by(column.desc().nulls_last(), Device.id.desc())
+    else:
+        query = query.order_by(column.asc().nulls_first(), Device.id.asc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def count_devices(db: Session, **filters) -> int:
+    """Count the devices matching the device list filters (see filter_devices)."""
+    return filter_devices(db.query(func.count(Device.id)), **filters).scalar()
+
+def count_devices_by_type(db: Session) -> Dict[str, int]:
+    """Count devices grouped by type in a single query."""
+    query = db.query(Device.type, func.count(Device.id)).group_by(Device.type)
+    return {device_type: count for device_type, count in query}
+
+def count_devices_by_status(db: Session) -> Dict[str, int]:
+    """Count devices grouped by their raw status value in a single query."""
+    query = db.query(Device.status, func.count(Device.id)).group_by(Device.status)
+    return {status: count for status, count in query}
+
 def get_device(db: Session, device_id: int):
     """Retrieve a specific device by its ID."""
     return db.query(Device).filter(Device.id == device_id).first()
@@ -92,8 +189,86 @@ def create_device(db: Session, device_data: dict):
     db.commit()
     db.refresh(device)
     invalidate_cache('devices_count')
+    # Notify the monitor's device registry
+    device_registry.upsert(device)
     return device
 
+def create_devices(db: Session, devices_data: List[dict]):
+    """Create a batch of devices in a single transaction.
+    
+    Devices whose IP is already used (in the database or earlier in the
+    batch) are skipped. The rows are inserted with one multi-row INSERT;
+    if it still hits a constraint (e.g. a concurrent insert), the batch is
+    retried one device at a time.
+    
+    Args:
+        db: Database session
+        devices_data: List of dictionaries containing device attributes
+        
+    Returns:
+        Tuple of (number of devices created, {index in devices_data: error message})
+    """
+    errors = {}
+    ips = [data["ip"] for data in devices_data]
+    existing = set()
+    for start in range(0, len(ips), 500):
+        rows = db.query(Device.ip).filter(Device.ip.in_(ips[start:start + 500]))
+        existing.update(row.ip for row in rows)
+    
+    pending = []
+    for index, data in enumerate(devices_data):
+        if data["ip"] in existing:
+            errors[index] = f"A device with IP {data['ip']} already exists"
+            continue
+        existing.add(data["ip"])
+        pending.append((index, Device(**data)))
+    if not pending:
+        return 0, errors
+    
+    try:
+        db.add_all(device for _, device in pending)
+        db.flush()
+        records = [DeviceRecord.from_model(device) for _, device in pending]
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        records = []
+        for index, data in pending:
+            try:
+                device = Device(**devices_data[index])
+                db.add(device)
+                db.flush()
+                records.append(DeviceRecord.from_model(device))
+                db.commit()
+            except IntegrityError as e:
+                db.rollback()
+                errors[index] = f"Constraint violation: {e.orig}"
+    
+    invalidate_cache('devices_count')
+    # Notify the monitor's device registry
+    device_registry.upsert_records(records)
+    return len(records), errors
+
+def iter_devices(db: Session, batch_size: int = 500):
+    """Yield all devices ordered by ID, loading them in batches with keyset pagination.
+    
+    Each batch is a separate short query, so no long-running read
+    transaction is held while the caller streams the devices.
+    
+    Args:
+        db: Database session
+        batch_size: Number of devices loaded per query
+    """
+    last_id = 0
+    while True:
+        batch = db.query(Device).filter(Device.id > last_id).order_by(Device.id).limit(batch_size).all()
+        if not batch:
+            return
+        yield from batch
+        last_id = batch[-1].id
+        db.expunge_all()
+        db.rollback()
+
 def update_device(db: Session, device_id: int, device_data: dict):
     """Update an existing device's attributes.
     
@@ -112,6 +287,7 @@ def update_device(db: Session, device_id: int, device_data: dict):
         setattr(device, key, value)
     db.commit()
     db.refresh(device)
+    device_registry.upsert(device)
     return device
 
 def delete_device(db: Session, device_id: int):
@@ -129,25 +305,15 @@ def delete_device(db: Session, device_id: int):
         db.delete(device)
         db.commit()
         invalidate_cache('devices_count')
+        device_registry.remove(device_id)
         return True
     return False
 
-# Settings CRUD operations with caching
+# Settings CRUD operations (cached and typed by app.settings.settings_store)
 def get_all_settings(db: Session):
-    """Retrieve all settings from the database with caching."""
-    global _db_cache
-    
-    # Return cached settings if valid
-    if _is_cache_valid('settings'):
-        return _db_cache['settings']
-    
-    # Query database and update cache
+    """Retrieve all settings from the database as raw string values."""
     settings = db.query(Setting).all()
-    settings_dict = {setting.key: setting.value for setting in settings}
-    _db_cache['settings'] = settings_dict
-    _db_cache['settings_timestamp'] = time.time()
-    
-    return settings_dict
+    return {setting.key: setting.value for setting in settings}
 
 def get_setting(db: Session, key: str):
     """Retrieve a specific setting by its key.
@@ -159,11 +325,6 @@ def get_setting(db: Session, key: str):
     Returns:
         The setting value or None if not found
     """
-    # First try to get from cache
-    if _is_cache_valid('settings') and key in _db_cache['settings']:
-        return _db_cache['settings'][key]
-    
-    # If not in cache or cache invalid, query database
     setting = db.query(Setting).filter(Setting.key == key).first()
     return setting.value if setting else None
 
@@ -181,9 +342,23 @@ def get_setting_with_default(db: Session, key: str, default_value: str):
     setting = get_setting(db, key)
     return setting if setting is not None else default_value
 
+def _dialect_insert(db: Session):
+    """Return the dialect-specific insert construct supporting ON CONFLICT, if any."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
 def upsert_setting(db: Session, key: str, value: str, description: str = None):
     """Create or update a setting.
     
+    Uses a native INSERT ... ON CONFLICT on PostgreSQL and SQLite, so that
+    concurrent API instances can't race between the lookup and the insert.
+    
     Args:
         db: Database session
         key: The setting key
@@ -193,20 +368,32 @@ def upsert_setting(db: Session, key: str, value: str, description: str = None):
     Returns:
         The created or updated setting
     """
-    setting = db.query(Setting).filter(Setting.key == key).first()
-    if setting:
-        setting.value = value
-        if description:
-            setting.description = description
+    insert = _dialect_insert(db)
+    if insert is not None:
+        stmt = insert(Setting).values(key=key, value=value, description=description)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Setting.key],
+            set_={
+                "value": stmt.excluded.value,
+                # Keep the existing description unless a new one is given
+                "description": func.coalesce(func.nullif(stmt.excluded.description, ""), Setting.description)
+            }
+        )
+        db.execute(stmt)
+        db.commit()
+        setting = db.get(Setting, key, populate_existing=True)
     else:
-        setting = Setting(key=key, value=value, description=description)
-        db.add(setting)
-    
-    db.commit()
-    db.refresh(setting)
-    
-    # Invalidate settings cache
-    invalidate_cache('settings')
+        setting = db.query(Setting).filter(Setting.key == key).first()
+        if setting:
+            setting.value = value
+            if description:
+                setting.description = description
+        else:
+            setting = Setting(key=key, value=value, description=description)
+            db.add(setting)
+        
+        db.commit()
+        db.refresh(setting)
     
     return setting
 
@@ -224,12 +411,17 @@ def delete_setting(db: Session, key: str):
     if setting:
         db.delete(setting)
         db.commit()
-        invalidate_cache('settings')
         return True
     return False
 
 # Alert CRUD operations with optimized queries
-def get_alerts(db: Session, skip: int = 0, limit: int = 100, status: str = None, exclude_resolved: bool = False, include_history: bool = False):
+def _apply_alert_cursor(query, before: Optional[Tuple[Any, int]]):
+    """Restrict an alert query to the rows strictly older than a (timestamp, id) cursor."""
+    if before is not None:
+        query = query.filter(tuple_(Alert.timestamp, Alert.id) < tuple(before))
+    return query
+
+def get_alerts(db: Session, skip: int = 0, limit: int = 100, status: str = None, exclude_resolved: bool = False, include_history: bool = False, before: Optional[Tuple[Any, int]] = None):
     """
     Retrieve alerts from the database with optional filtering and pagination.
     
@@ -240,11 +432,12 @@ def get_alerts(db: Session, skip: int = 0, limit: int = 100, status: str = None,
         status: Optional filter for alert status (active, resolved)
         exclude_resolved: If True, exclude alerts with status="resolved"
         include_history: If True, include resolved alerts (for history view)
+        before: Optional (timestamp, id) keyset cursor; only older alerts are returned
         
     Returns:
-        List of Alert objects
+        List of Alert objects, with their device loaded in the same query
     """
-    query = db.query(Alert)
+    query = db.query(Alert).options(joinedload(Alert.device))
     
     # Apply filters
     if status:
@@ -256,11 +449,12 @@ def get_alerts(db: Session, skip: int = 0, limit: int = 100, status: str = None,
         pass
         
     # Always sort by timestamp, with most recent first
-    query = query.order_by(Alert.timestamp.desc())
+    query = _apply_alert_cursor(query, before)
+    query = query.order_by(Alert.timestamp.desc(), Alert.id.desc())
     
     return query.offset(skip).limit(limit).all()
 
-def get_alert_history(db: Session, days_back: int = 30, skip: int = 0, limit: int = 100):
+def get_alert_history(db: Session, days_back: int = 30, skip: int = 0, limit: int = 100, before: Optional[Tuple[Any, int]] = None):
     """
     Retrieve alert history including resolved alerts.
     
@@ -269,9 +463,10 @@ def get_alert_history(db: Session, days_back: int = 30, skip: int = 0, limit: in
         days_back: Number of days to look back for history
         skip: Number of records to skip (for pagination)
         limit: Maximum number of records to return
+        before: Optional (timestamp, id) keyset cursor; only older alerts are returned
         
     Returns:
-        List of Alert objects
+        List of Alert objects, with their device loaded in the same query
     """
     from datetime import datetime, timedelta
     
@@ -279,10 +474,11 @@ def get_alert_history(db: Session, days_back: int = 30, skip: int = 0, limit: in
     cutoff_date = datetime.now() - timedelta(days=days_back)
     
     # Get all alerts (both active and resolved) from the cutoff date
-    query = db.query(Alert).filter(Alert.timestamp >= cutoff_date)
+    query = db.query(Alert).options(joinedload(Alert.device)).filter(Alert.timestamp >= cutoff_date)
     
     # Order by timestamp, most recent first
-    query = query.order_by(Alert.timestamp.desc())
+    query = _apply_alert_cursor(query, before)
+    query = query.order_by(Alert.timestamp.desc(), Alert.id.desc())
     
     return query.offset(skip).limit(limit).all()
 
@@ -295,9 +491,9 @@ def get_alert(db: Session, alert_id: int):
         alert_id: ID of the alert to retrieve
         
     Returns:
-        Alert object or None if not found
+        Alert object (with its device loaded) or None if not found
     """
-    return db.query(Alert).filter(Alert.id == alert_id).first()
+    return db.query(Alert).options(joinedload(Alert.device)).filter(Alert.id == alert_id).first()
 
 def create_alert(db: Session, alert_data: dict):
     """
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
-from sqlalchemy.sql import func
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship
 from app.db.database import Base
 
 class Device(Base):
@@ -10,6 +11,20 @@ class Device(Base):
     that is tracked and updated by the monitoring system.
     """
     __tablename__ = "devices"
+    __table_args__ = (
+        # Filters of the device list
+        Index("ix_devices_status_id", "status", "id"),
+        Index("ix_devices_type_id", "type", "id"),
+        Index("ix_devices_owner_id", "owner", "id"),
+        # Devices probed by each remote agent
+        Index("ix_devices_agent_id", "agent", "id"),
+        # Sort orders of the device list (keyset pagination)
+        Index("ix_devices_name_id", "name", "id"),
+        Index("ix_devices_packet_loss_id", "packet_loss", "id"),
+        Index("ix_devices_jitter_id", "jitter", "id"),
+        Index("ix_devices_uptime_id", "uptime", "id"),
+        Index("ix_devices_custom_alerts_id", "custom_alerts", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -22,6 +37,10 @@ class Device(Base):
     jitter = Column(Float, default=0.0)                 # Calculated by monitor
     uptime = Column(Float, default=0.0)                 # Calculated by monitor
     custom_alerts = Column(String, nullable=True)       # Comma-separated values
+    check_interval = Column(Integer, nullable=True)     # Probe interval in seconds, None = global setting
+    probe_type = Column(String, nullable=True)          # icmp (default), tcp, http or dns
+    probe_target = Column(String, nullable=True)        # TCP port, HTTP URL or path, or DNS name to resolve
+    agent = Column(String, nullable=True)               # Name of the remote agent probing it, None = this server
 
 class Setting(Base):
     """
@@ -44,10 +63,20 @@ class Alert(Base):
     have connectivity issues or other monitored conditions.
     """
     __tablename__ = "alerts"
+    __table_args__ = (
+        # Alert lists filtered by status and ordered by time
+        Index("ix_alerts_status_timestamp", "status", "timestamp", "id"),
+        # Unfiltered history ordered by time (keyset pagination)
+        Index("ix_alerts_timestamp_id", "timestamp", "id"),
+        # Duplicate checks and auto-resolution in the monitor
+        Index("ix_alerts_device_status_type", "device_id", "status", "type"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(Integer, ForeignKey("devices.id"), nullable=False)
-    timestamp = Column(DateTime, default=func.now(), nullable=False)
+    # Set in Python rather than by the database: SQLite's CURRENT_TIMESTAMP has no fractional
+    # seconds, so its values would not compare as text with the bound keyset cursors
+    timestamp = Column(DateTime, default=datetime.now, nullable=False)
     severity = Column(String, nullable=False)  # critical, warning, info
     type = Column(String, nullable=False)  # Connectivity, Performance, System
     message = Column(String, nullable=False)
@@ -55,4 +84,6 @@ class Alert(Base):
     status = Column(String, default="active", nullable=False)  # active, acknowledged, resolved
     resolved_at = Column(DateTime, nullable=True)
     duration = Column(String, nullable=True)
-    resolution_note = Column(String, nullable=True)
\ No newline at end of file
+    resolution_note = Column(String, nullable=True)
+    
+    device = relationship("Device")  # Eager-loaded by the alert list queries
\ No newline at end of file
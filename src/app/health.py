@@ -0,0 +1,134 @@
+import time
+from collections import deque
+
+# Consecutive failed probes before an online device is reported offline
+DOWN_THRESHOLD = 2
+# Consecutive successful probes before an offline device is reported online
+UP_THRESHOLD = 2
+# Status changes within FLAP_WINDOW seconds that make a device flapping
+FLAP_THRESHOLD = 4
+FLAP_WINDOW = 600
+# Upper bound (in seconds) of the probe interval of a device that stays down
+BACKOFF_MAX = 900
+
+
+class DeviceHealth:
+    """Debounced reachability state of a device."""
+
+    __slots__ = ("status", "failures", "successes", "transitions", "flapping")
+
+    def __init__(self, status: str):
+        self.status = status
+        self.failures = 0
+        self.successes = 0
+        self.transitions = deque(maxlen=FLAP_THRESHOLD)
+        self.flapping = False
+
+    @property
+    def confirmed(self) -> bool:
+        """False while a status change is observed but not yet confirmed."""
+        if self.status == "online":
+            return self.failures == 0
+        if self.status == "offline":
+            return self.successes == 0
+        return True
+
+
+class HealthTracker:
+    """
+    Apply hysteresis, flap detection and backoff to the probe outcomes.
+
+    A device changes status only after `down_threshold` consecutive failed
+    probes (or `up_threshold` successful ones), each pending change being
+    confirmed by a quick re-check. A device changing status `flap_threshold`
+    times within `flap_window` seconds is flapping until it has been stable
+    for `flap_window` seconds. Devices that stay down are probed with an
+    exponential backoff, capped at `backoff_max` seconds.
+    """
+
+    def __init__(
+        self,
+        down_threshold: int = DOWN_THRESHOLD,
+        up_threshold: int = UP_THRESHOLD,
+        flap_threshold: int = FLAP_THRESHOLD,
+        flap_window: float = FLAP_WINDOW,
+        backoff_max: float = BACKOFF_MAX
+    ):
+        self.down_threshold = down_threshold
+        self.up_threshold = up_threshold
+        self.flap_threshold = flap_threshold
+        self.flap_window = flap_window
+        self.backoff_max = backoff_max
+        self._devices = {}
+
+    def get(self, device) -> DeviceHealth:
+        """Health of a device, initialized from its last known status."""
+        health = self._devices.get(device.id)
+        if health is None:
+            health = self._devices[device.id] = DeviceHealth(device.status)
+        return health
+
+    def forget(self, device_id) -> None:
+        """Forget a device that is no longer monitored."""
+        self._devices.pop(device_id, None)
+
+    def is_down(self, device) -> bool:
+        """True if the device is confirmed offline (it is not worth retrying)."""
+        health = self._devices.get(device.id)
+        return health is not None and health.status == "offline" and health.confirmed
+
+    def observe(self, device, reachable: bool, now: float = None):
+        """
+        Record the outcome of a probe.
+
+        Returns:
+            Tuple of (debounced status, flapping state change: True when the
+            device started flapping, False when it stopped, None otherwise)
+        """
+        now = time.time() if now is None else now
+        health = self.get(device)
+        if reachable:
+            health.successes += 1
+            health.failures = 0
+            new_status = "online" if health.status != "online" and (
+                health.successes >= self.up_threshold or health.status not in ("online", "offline")
+            ) else None
+        else:
+            health.failures += 1
+            health.successes = 0
+            new_status = "offline" if health.status != "offline" and (
+                health.failures >= self.down_threshold or health.status not in ("online", "offline")
+            ) else None
+
+        flap_change = None
+        if new_status is not None:
+            if health.status in ("online", "offline"):
+                health.transitions.append(now)
+            health.status = new_status
+            if (not health.flapping and len(health.transitions) >= self.flap_threshold
+                    and now - health.transitions[0] <= self.flap_window):
+                health.flapping = flap_change = True
+        # Only a confirmed outcome ends flapping, as unconfirmed ones are not written back
+        if (health.flapping and flap_change is None and health.confirmed and health.transitions
+                and now - health.transitions[-1] > self.flap_window):
+            health.flapping = False
+            health.transitions.clear()
+            flap_change = False
+        return health.status, flap_change
+
+    def next_delay(self, device, interval: float, confirm_delay: float):
+        """
+        Delay (in seconds) before the next probe of a device, or None for its regular interval.
+
+        Pending status changes are re-checked after `confirm_delay`; devices
+        down for longer are probed with an exponential backoff.
+        """
+        health = self._devices.get(device.id)
+        if health is None:
+            return None
+        if not health.confirmed:
+            return min(confirm_delay, interval)
+        if health.status == "offline":
+            extra_failures = max(health.failures - self.down_threshold, 0)
+            return min(interval * 2 ** min(extra_failures, 32), max(self.backoff_max, interval))
+        return None
@@ -0,0 +1,84 @@
+import logging
+from typing import Optional
+from app.streaming import EventHub
+
+# Number of structured log records kept in memory
+LOG_BUFFER_SIZE = 10000
+
+
+class LogBufferHandler(logging.Handler):
+    """
+    Logging handler keeping structured records in a bounded ring buffer.
+
+    Each record carries its level, formatted line and, when logged with
+    `extra={"device_id": ..., "ip": ..., "event": ...}`, the device it is
+    about and the kind of event. Records are published through an EventHub,
+    so they can be both queried and streamed to SSE clients.
+    """
+
+    def __init__(self, capacity: int = LOG_BUFFER_SIZE):
+        super().__init__()
+        self.hub = EventHub(history=capacity, maxsize=1000)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line = self.format(record)  # Also sets record.message
+            self.hub.publish({
+                "timestamp": record.created,
+                "level": record.levelname,
+                "levelno": record.levelno,
+                "device_id": getattr(record, "device_id", None),
+                "ip": getattr(record, "ip", None),
+                "event": getattr(record, "event", None),
+                "message": record.message,
+                "line": line
+            })
+        except Exception:
+            self.handleError(record)
+
+    def query(self, filters: "LogFilter", limit: int = 500):
+        """Return the most recent buffered records matching the filters, oldest first."""
+        matches = [record for _, record in self.hub.snapshot() if filters.matches(record)]
+        return matches[-limit:] if limit else []
+
+
+class LogFilter:
+    """Server-side filter for structured log records."""
+
+    def __init__(
+        self,
+        level: Optional[str] = None,
+        device_id: Optional[int] = None,
+        ip: Optional[str] = None,
+        event: Optional[str] = None,
+        text: Optional[str] = None
+    ):
+        self.levelno = logging.getLevelName(level.upper()) if level else None
+        if not isinstance(self.levelno, int):
+            self.levelno = None
+        self.device_id = device_id
+        self.ip = ip
+        self.event = event
+        self.text = text.lower() if text else None
+
+    @property
+    def active(self) -> bool:
+        """True if at least one filter is set."""
+        return any(v is not None for v in (self.levelno, self.device_id, self.ip, self.event, self.text))
+
+    def matches(self, record: dict) -> bool:
+        if self.levelno is not None and record["levelno"] < self.levelno:
+            return False
+        if self.device_id is not None and record["device_id"] != self.device_id:
+            return False
+        if self.ip is not None and record["ip"] != self.ip:
+            return False
+        if self.event is not None and record["event"] != self.event:
+            return False
+        if self.text is not None and self.text not in record["message"].lower():
+            return False
+        return True
+
+
+# Shared handler, installed by the application's logger setup
+log_buffer = LogBufferHandler()
@@ -0,0 +1,164 @@
+import os
+import asyncio
+import logging
+import threading
+from app.streaming import Broadcaster
+
+try:
+    # Native file change notifications (inotify on Linux), shipped with uvicorn[standard]
+    from watchfiles import awatch
+    # watchfiles logs every change at INFO level: writing that to the watched
+    # log file would trigger another change, endlessly
+    logging.getLogger("watchfiles").setLevel(logging.WARNING)
+except ImportError:
+    awatch = None
+
+# Polling interval (in seconds) when file notifications are not available
+POLL_INTERVAL = 0.5
+# Block size used when reading the log file backwards
+REVERSE_BLOCK_SIZE = 8192
+
+
+def read_last_lines(path: str, count: int, end: int = None):
+    """
+    Read the last `count` lines of a file by seeking backwards from `end`.
+
+    Args:
+        path: File to read
+        count: Maximum number of lines to return
+        end: Byte offset to read up to, defaults to the end of the file
+
+    Returns:
+        List of lines without their line terminators
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        position = size if end is None else min(end, size)
+        data = b""
+        # One more line than needed, since the first one may be partial
+        while position > 0 and data.count(b"\n") <= count:
+            size = min(REVERSE_BLOCK_SIZE, position)
+            position -= size
+            f.seek(position)
+            data = f.read(size) + data
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    if position > 0:
+        lines = lines[1:]
+    return lines[-count:] if count else []
+
+
+class LogTailer:
+    """
+    Follow a log file and share its new lines with every SSE client.
+
+    The tailer keeps the file open at a byte offset and only reads the bytes
+    appended since the previous read. On truncation (size below the offset)
+    it starts over; on rotation (a new inode at the same path) it finishes
+    the rotated file and then follows the new one from its beginning.
+    Changes are detected with file notifications when available, by
+    polling otherwise.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.broadcaster = Broadcaster(maxsize=1000)
+        self._file = None
+        self._partial = b""
+        self._read_lock = threading.Lock()
+        # Offset up to which lines have been published (updated on the event loop)
+        self.published_offset = 0
+
+    def _read_available(self):
+        """Read what is left in the open file, handling truncation."""
+        if os.fstat(self._file.fileno()).st_size < self._file.tell():
+            # Truncated in place: start over
+            self._file.seek(0)
+            self._partial = b""
+        return self._file.read()
+
+    def _read_new(self):
+        """
+        Read the complete lines appended since the last call (runs in a worker thread).
+
+        Returns:
+            Tuple of (new lines, offset of the end of the last complete line)
+        """
+        with self._read_lock:
+            data = b""
+            if self._file is not None:
+                data = self._read_available()
+            try:
+                rotated = self._file is None or os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+            except FileNotFoundError:
+                rotated = False
+            if rotated:
+                # Finish the rotated file above, then follow the new one from its start
+                if self._file is not None:
+                    self._file.close()
+                self._file = open(self.path, "rb")
+                data += self._read_available()
+
+            if self._file is None:
+                return [], 0
+            data = self._partial + data
+            complete, _, self._partial = data.rpartition(b"\n")
+            lines = complete.decode("utf-8", errors="replace").splitlines() if complete else []
+            return lines, self._file.tell() - len(self._partial)
+
+    def start_at_end(self):
+        """Skip the current content of the file, only following what is appended from now on."""
+        _, self.published_offset = self._read_new()
+
+    def close(self):
+        with self._read_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    async def _changes(self):
+        """Yield whenever the log file may have changed."""
+        if awatch is not None:
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                async for _ in awatch(directory, debounce=50, step=50):
+                    yield
+                return
+            except Exception as e:
+                logging.warning(f"File notifications unavailable for {self.path}, polling instead: {e}")
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            yield
+
+    async def run(self):
+        """Publish the lines appended to the log file until cancelled."""
+        await asyncio.to_thread(self.start_at_end)
+        try:
+            async for _ in self._changes():
+                try:
+                    lines, offset = await asyncio.to_thread(self._read_new)
+                except Exception as e:
+                    logging.error(f"Error tailing log file: {e}")
+                    continue
+                self.published_offset = offset
+                if lines:
+                    self.broadcaster.publish(lines)
+        finally:
+            self.close()
+
+    def subscribe(self, replay_lines: int):
+        """
+        Subscribe to the new lines, with the last `replay_lines` already published.
+
+        Returns:
+            Tuple of (list of replayed lines, queue of line batches)
+        """
+        queue = self.broadcaster.subscribe(replay_latest=False)
+        replay = read_last_lines(self.path, replay_lines, end=self.published_offset)
+        return replay, queue
+
+    def unsubscribe(self, queue):
+        self.broadcaster.unsubscribe(queue)
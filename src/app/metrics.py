@@ -0,0 +1,351 @@
+import os
+import math
+import time
+import struct
+import bisect
+import logging
+import threading
+from datetime import datetime
+from app.db.database import db_folder
+
+# Directory holding one append-only sample file per device (and per rollup tier)
+METRICS_DIR = os.path.join(db_folder, "metrics")
+
+# Fixed-size little-endian raw sample record:
+# timestamp (float64), rtt min/avg/max in ms, packet loss %, jitter in ms (float32), status (uint8)
+RECORD = struct.Struct("<dfffffB3x")
+
+# Fixed-size little-endian rollup record:
+# bucket start (float64), sample count (uint32), rtt min/avg/max/p95 in ms,
+# packet loss %, jitter in ms, availability % (float32)
+ROLLUP_RECORD = struct.Struct("<dIfffffff")
+
+STATUS_CODES = {"offline": 0, "online": 1}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# Raw samples retention (seconds)
+RAW_RETENTION = 2 * 86400
+
+# Rollup tiers from finest to coarsest: (name, bucket size in seconds, retention in seconds).
+# Each tier is aggregated from the previous one (the first from the raw samples).
+ROLLUP_TIERS = [
+    ("1m", 60, 8 * 86400),
+    ("1h", 3600, 90 * 86400),
+    ("1d", 86400, 730 * 86400),
+]
+
+# Minimum number of points a tier must provide for a time range to be served from it
+MIN_POINTS = 60
+
+# Expired records are only compacted away once they exceed this fraction of the retention,
+# so that files are not rewritten on every rollup
+COMPACTION_SLACK = 0.1
+
+
+class _Timestamps:
+    """Lazy, read-only sequence over the timestamps of a record file (for bisect)."""
+
+    def __init__(self, f, count, record_size):
+        self.f = f
+        self.count = count
+        self.record_size = record_size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        self.f.seek(index * self.record_size)
+        return struct.unpack("<d", self.f.read(8))[0]
+
+
+def _read_records(path, record, from_time=0, to_time=math.inf):
+    """Read the records of a file whose timestamp lies within [from_time, to_time]."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+    with f:
+        # Ignore a trailing record that may still be being written
+        count = os.fstat(f.fileno()).st_size // record.size
+        timestamps = _Timestamps(f, count, record.size)
+        start = bisect.bisect_left(timestamps, from_time)
+        end = bisect.bisect_right(timestamps, to_time, lo=start)
+        f.seek(start * record.size)
+        data = f.read((end - start) * record.size)
+    return list(record.iter_unpack(data))
+
+
+def _last_timestamp(path, record):
+    """Return the timestamp of the last complete record of a file, or None if empty."""
+    try:
+        with open(path, "rb") as f:
+            count = os.fstat(f.fileno()).st_size // record.size
+            if not count:
+                return None
+            f.seek((count - 1) * record.size)
+            return struct.unpack("<d", f.read(8))[0]
+    except FileNotFoundError:
+        return None
+
+
+def _append(path, data: bytes) -> None:
+    """Append data to a record file, creating its directory on first use."""
+    try:
+        f = open(path, "ab")
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, "ab")
+    with f:
+        f.write(data)
+
+
+def _expire(path, record, cutoff, slack):
+    """Drop the records older than `cutoff` once they are older than `cutoff - slack`."""
+    try:
+        with open(path, "rb") as f:
+            count = os.fstat(f.fileno()).st_size // record.size
+            if not count or struct.unpack("<d", f.read(8))[0] >= cutoff - slack:
+                return
+            start = bisect.bisect_left(_Timestamps(f, count, record.size), cutoff)
+            f.seek(start * record.size)
+            data = f.read((count - start) * record.size)
+    except FileNotFoundError:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _percentile(values, pct):
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _aggregate(bucket, rows):
+    """
+    Aggregate rollup rows (raw samples are passed as single-sample rows) into one bucket.
+
+    RTT statistics only consider the reachable share of the samples. The p95
+    of a coarser tier is the 95th percentile of the p95 of its children.
+    """
+    count = sum(row[1] for row in rows)
+    online = [row for row in rows if row[8] > 0]
+    online_weights = [row[1] * row[8] / 100 for row in online]
+    online_total = sum(online_weights)
+    return (
+        bucket,
+        count,
+        min((row[2] for row in online), default=0.0),
+        sum(row[3] * w for row, w in zip(online, online_weights)) / online_total if online_total else 0.0,
+        max((row[4] for row in online), default=0.0),
+        _percentile([row[5] for row in online], 95),
+        sum(row[6] * row[1] for row in rows) / count,
+        sum(row[7] * row[1] for row in rows) / count,
+        sum(row[8] * row[1] for row in rows) / count,
+    )
+
+
+def _raw_as_rollup(values):
+    """Convert a raw sample record into a single-sample rollup row."""
+    timestamp, rtt_min, rtt_avg, rtt_max, packet_loss, jitter, status = values
+    availability = 100.0 if status == STATUS_CODES["online"] else 0.0
+    return (timestamp, 1, rtt_min, rtt_avg, rtt_max, rtt_avg, packet_loss, jitter, availability)
+
+
+class MetricsStore:
+    """
+    Append-only store of per-probe metrics samples with rollup tiers.
+
+    Every device has its own file of fixed-size packed records in
+    chronological order per tier, so a time range is located with a binary
+    search on the file and read with a single sequential scan, without
+    touching other devices' samples. A rollup pass aggregates the raw
+    samples into 1-minute, 1-hour and 1-day buckets and expires the
+    records that fall out of each tier's retention. Samples older than
+    the last one of their device are dropped, since they would break the
+    chronological order. Directories are created on the first write.
+    """
+
+    def __init__(self, directory: str = METRICS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # Timestamp of the last raw sample of every device written to so far
+        self._last = {}
+
+    def _path(self, device_id: int, tier: str = "raw") -> str:
+        if tier == "raw":
+            return os.path.join(self.directory, f"{int(device_id)}.bin")
+        return os.path.join(self.directory, tier, f"{int(device_id)}.bin")
+
+    def append(self, samples) -> None:
+        """
+        Append a batch of samples.
+
+        Args:
+            samples: Iterable of dicts with device_id, timestamp, status,
+                packet_loss, jitter, rtt_min, rtt_avg and rtt_max
+        """
+        with self._lock:
+            dropped = 0
+            for sample in sorted(samples, key=lambda sample: sample["timestamp"]):
+                device_id = sample["device_id"]
+                path = self._path(device_id)
+                if device_id not in self._last:
+                    self._last[device_id] = _last_timestamp(path, RECORD)
+                last = self._last[device_id]
+                if last is not None and sample["timestamp"] < last:
+                    dropped += 1
+                    continue
+                try:
+                    _append(path, _pack(sample))
+                    self._last[device_id] = sample["timestamp"]
+                except OSError as e:
+                    logging.error(f"Error writing metrics for device {device_id}: {e}")
+            if dropped:
+                logging.warning(f"Dropped {dropped} metrics samples older than the last ones of their device")
+
+    def read(self, device_id: int, from_time: float = 0, to_time: float = None, tier: str = "raw"):
+        """
+        Read the samples of a device within a time range.
+
+        Args:
+            device_id: ID of the device
+            from_time: Start of the range (UNIX timestamp, inclusive)
+            to_time: End of the range (UNIX timestamp, inclusive), defaults to now
+            tier: "raw" or the name of a rollup tier ("1m", "1h", "1d")
+
+        Returns:
+            List of sample dicts in chronological order
+        """
+        to_time = time.time() if to_time is None else to_time
+        if tier == "raw":
+            return [_unpack(values) for values in _read_records(self._path(device_id), RECORD, from_time, to_time)]
+        return [
+            _unpack_rollup(values)
+            for values in _read_records(self._path(device_id, tier), ROLLUP_RECORD, from_time, to_time)
+        ]
+
+    def query(self, device_id: int, from_time: float, to_time: float = None):
+        """
+        Read a time range from the coarsest tier that still serves it.
+
+        A tier qualifies when its retention covers the range and it yields
+        at least MIN_POINTS buckets over it; the raw samples are used otherwise.
+
+        Returns:
+            Tuple of (tier name, list of sample dicts)
+        """
+        to_time = time.time() if to_time is None else to_time
+        span = max(to_time - from_time, 0)
+        tier = "raw"
+        for name, bucket, retention in ROLLUP_TIERS:
+            if retention >= span and bucket * MIN_POINTS <= span:
+                tier = name
+        return tier, self.read(device_id, from_time, to_time, tier)
+
+    def rollup(self, now: float = None) -> None:
+        """
+        Aggregate every device's complete buckets into the rollup tiers
+        and expire the records outside each tier's retention.
+        """
+        now = time.time() if now is None else now
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        device_ids = [int(name[:-4]) for name in names if name.endswith(".bin") and name[:-4].isdigit()]
+        for device_id in device_ids:
+            try:
+                self._rollup_device(device_id, now)
+            except Exception as e:
+                logging.error(f"Error rolling up metrics for device {device_id}: {e}")
+
+    def _rollup_device(self, device_id, now):
+        source_path, source_record = self._path(device_id), RECORD
+        for name, bucket, retention in ROLLUP_TIERS:
+            path = self._path(device_id, name)
+            last_bucket = _last_timestamp(path, ROLLUP_RECORD)
+            start = last_bucket + bucket if last_bucket is not None else 0
+            # Only complete buckets are rolled up
+            end = math.floor(now / bucket) * bucket
+
+            rows = _read_records(source_path, source_record, start, end)
+            if source_record is RECORD:
+                rows = [_raw_as_rollup(values) for values in rows]
+
+            buckets = {}
+            for row in rows:
+                if row[0] < end:
+                    buckets.setdefault(math.floor(row[0] / bucket) * bucket, []).append(row)
+
+            if buckets:
+                data = b"".join(
+                    ROLLUP_RECORD.pack(*_aggregate(key, buckets[key])) for key in sorted(buckets)
+                )
+                with self._lock:
+                    _append(path, data)
+
+            with self._lock:
+                _expire(path, ROLLUP_RECORD, now - retention, retention * COMPACTION_SLACK)
+            source_path, source_record = path, ROLLUP_RECORD
+
+        with self._lock:
+            _expire(self._path(device_id), RECORD, now - RAW_RETENTION, RAW_RETENTION * COMPACTION_SLACK)
+
+    def delete(self, device_id: int) -> None:
+        """Delete all the samples of a device, in every tier."""
+        with self._lock:
+            self._last.pop(device_id, None)
+            for tier in ["raw"] + [name for name, _, _ in ROLLUP_TIERS]:
+                try:
+                    os.remove(self._path(device_id, tier))
+                except FileNotFoundError:
+                    pass
+
+
+def _pack(sample) -> bytes:
+    return RECORD.pack(
+        sample["timestamp"],
+        sample.get("rtt_min") or 0.0,
+        sample.get("rtt_avg") or 0.0,
+        sample.get("rtt_max") or 0.0,
+        sample.get("packet_loss") or 0.0,
+        sample.get("jitter") or 0.0,
+        STATUS_CODES.get(sample.get("status"), 0)
+    )
+
+
+def _unpack(values) -> dict:
+    timestamp, rtt_min, rtt_avg, rtt_max, packet_loss, jitter, status = values
+    return {
+        "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+        "status": STATUS_NAMES.get(status, "offline"),
+        "rtt_min": rtt_min,
+        "rtt_avg": rtt_avg,
+        "rtt_max": rtt_max,
+        "packet_loss": packet_loss,
+        "jitter": jitter
+    }
+
+
+def _unpack_rollup(values) -> dict:
+    timestamp, count, rtt_min, rtt_avg, rtt_max, rtt_p95, packet_loss, jitter, availability = values
+    return {
+        "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+        "samples": count,
+        "rtt_min": rtt_min,
+        "rtt_avg": rtt_avg,
+        "rtt_max": rtt_max,
+        "rtt_p95": rtt_p95,
+        "packet_loss": packet_loss,
+        "jitter": jitter,
+        "availability": availability
+    }
+
+
+# Shared store used by the monitor and the API
+metrics_store = MetricsStore()
@@ -2,127 +2,163 @@ import os
 import time
 import json
 import logging
+import asyncio
 import threading
-import concurrent.futures
+import numpy as np
 from datetime import datetime
-from collections import defaultdict, deque
-from ping3 import ping
+from collections import deque
+from app.probe import PROBE_TYPES, Ping3Probe, ProbeUnavailable, MAX_IN_FLIGHT
+from app.scheduler import ProbeScheduler, ProbeSlots
+from app.health import HealthTracker
+from app.registry import device_registry
+from app.settings import settings_store
+from app.metrics import metrics_store
+from app.stats import fleet_stats
+from app.baseline import device_baselines, BASELINE_METRICS
+from app.streaming import EventHub
 from app.db.database import SessionLocal
 from app.db.models import Device, Alert
 from app.db import crud
 
 # Global shutdown event to gracefully terminate monitoring
 shutdown_event = threading.Event()
-# Global cache for settings to reduce database reads
-settings_cache = {}
-settings_cache_time = 0
 # Alert notification queue
 alert_queue = deque(maxlen=100)
+# Real-time alert events, published from the monitor thread to the SSE clients
+alert_hub = EventHub()
 # Device status cache to detect changes
 device_status_cache = {}
-# Metrics history for trend analysis (limited size circular buffer)
-metrics_history = defaultdict(lambda: deque(maxlen=10))
+# Interval (in seconds) between two rollups of the persisted metrics history
+ROLLUP_INTERVAL = 60
+# Interval (in seconds) between two write-backs of the probe results
+FLUSH_INTERVAL = 1
+# Interval (in seconds) between two reloads of the settings
+SETTINGS_RELOAD_INTERVAL = 30
+# Random shift of every probe, as a fraction of the device's probe interval
+SCHEDULE_JITTER = 0.1
 
-def load_settings(force_refresh=False):
-    """Load monitoring settings from the database with caching."""
-    global settings_cache, settings_cache_time
-    
-    # Return cached settings if fresh (less than 5 minutes old)
-    current_time = time.time()
-    if not force_refresh and settings_cache and (current_time - settings_cache_time < 300):
-        return settings_cache
-    
-    default_settings = {
-        "ping_timeout": "3",
-        "log_level": "INFO",
-        "check_interval": "30",
-        "retry_interval": "1",
-        "max_retries": "3",
-        "parallel_pings": "True",  # New setting for parallelization
-        "ping_count": "3",         # New setting to control ping count
-        "cache_ttl": "300"         # TTL for cache in seconds
-    }
-    
-    db = SessionLocal()
-    try:
-        # Retrieve all settings from the database
-        settings = crud.get_all_settings(db)
-        
-        # If settings are empty (first run), initialize with defaults
-        if not settings:
-            # Set default settings in the database
-            for key, value in default_settings.items():
-                descriptions = {
-                    "ping_timeout": "Maximum time (in seconds) to wait for a ping response",
-                    "log_level": "Verbosity of system logs (DEBUG, INFO, WARN, ERROR)",
-                    "check_interval": "Delay (in seconds) between monitoring cycles",
-                    "retry_interval": "Waiting time (in seconds) between retry attempts",
-                    "max_retries": "Number of ping attempts before marking a device offline",
-                    "parallel_pings": "Enable parallel pinging of devices (True/False)",
-                    "ping_count": "Number of pings to send per device for metrics calculation",
-                    "cache_ttl": "Time to live (in seconds) for cached data"
-                }
-                crud.upsert_setting(db, key, value, descriptions.get(key, ""))
-            settings = default_settings
-            
-        # Convert string values to appropriate types
-        result = {}
-        for key, value in settings.items():
-            if key in ["ping_timeout", "check_interval", "retry_interval", "max_retries", "ping_count", "cache_ttl"]:
-                try:
-                    result[key] = int(value)
-                except (ValueError, TypeError):
-                    result[key] = int(default_settings.get(key, "0"))
-            elif key == "parallel_pings":
-                result[key] = value.lower() == "true"
-            else:
-                result[key] = value
-        
-        # Update cache
-        settings_cache = result
-        settings_cache_time = current_time
-        
-        return result
-    except Exception as e:
-        logging.error(f"Error loading settings from database: {e}")
-        # Fallback to default settings if database access fails
-        return {k: (int(v) if k in ["ping_timeout", "check_interval", "retry_interval", "max_retries", "ping_count", "cache_ttl"] 
-                   else (v.lower() == "true" if k == "parallel_pings" else v)) 
-                for k, v in default_settings.items()}
-    finally:
-        db.close()
+def log_context(device_id, ip=None, event=None):
+    """Build the `extra` of a log record about a device, for the structured log buffer."""
+    return {"device_id": device_id, "ip": ip, "event": event}
 
-def load_devices():
-    """Load all devices from the database for monitoring."""
-    db = SessionLocal()
+def _forget_device_stats(device_id, record):
+    """Release the rolling statistics and baselines of a removed device."""
+    if record is None:
+        fleet_stats.forget(device_id)
+        device_baselines.forget(device_id)
+
+device_registry.subscribe(_forget_device_stats)
+
+def load_devices(inventory=device_registry):
+    """Return the records of all monitored devices, loading the device registry on first use."""
     try:
-        devices = db.query(Device).all()
-        return [{
-            "id": device.id,
-            "name": device.name, 
-            "ip": device.ip,
-            "type": device.type,
-            "status": device.status,
-            "packet_loss": device.packet_loss,
-            "jitter": device.jitter
-        } for device in devices]
+        return inventory.load()
     except Exception as e:
         logging.error(f"Error loading devices from database: {e}")
         return []
-    finally:
-        db.close()
+
+# Maximum number of bound parameters per IN (...) clause
+BATCH_SIZE = 500
+
+def _chunks(items, size=BATCH_SIZE):
+    """Yield successive slices of `items` with at most `size` elements."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def make_result(device, status, packet_loss=None, jitter=None, ping_times=None):
+    """Build the probe result record consumed by update_devices_status."""
+    rtts = [t * 1000 for t in ping_times] if ping_times else []  # Convert to ms
+    return {
+        "device_id": device.id,
+        "ip": device.ip,
+        "status": status,
+        "packet_loss": packet_loss,
+        "jitter": jitter,
+        "rtt_min": min(rtts) if rtts else None,
+        "rtt_avg": sum(rtts) / len(rtts) if rtts else None,
+        "rtt_max": max(rtts) if rtts else None,
+        "timestamp": time.time()
+    }
+
+def record_metrics(results, timestamp=None):
+    """Append probe results to the metrics store, timestamped when probed (or `timestamp`)."""
+    timestamp = timestamp or time.time()
+    try:
+        metrics_store.append({"timestamp": timestamp, **result} for result in results)
+    except Exception as e:
+        logging.error(f"Error recording metrics: {e}")
 
 def update_device_status(device_id, ip, new_status, packet_loss=None, jitter=None):
-    """Update the status of a device in the database by its IP, along with metrics."""
-    global device_status_cache, metrics_history
+    """Update the status of a single device, along with metrics."""
+    update_devices_status([{
+        "device_id": device_id,
+        "ip": ip,
+        "status": new_status,
+        "packet_loss": packet_loss,
+        "jitter": jitter
+    }])
+
+def update_devices_status(results, settings=None):
+    """
+    Write back a batch of probe results in a single transaction.
+    
+    Device rows are read with one query per batch of IDs, updated with a
+    bulk UPDATE, and the alerts raised by the batch are inserted in the
+    same transaction.
+    
+    Args:
+        results: List of result records (see make_result)
+        settings: Settings snapshot, the current one if not given
+    """
+    global device_status_cache
+    
+    if not results:
+        return
+    settings = settings or settings_store.current
+    check_interval = settings.check_interval
     
     db = SessionLocal()
     try:
-        device = db.query(Device).filter(Device.id == device_id).first()
-        if not device:
-            device = db.query(Device).filter(Device.ip == ip).first()
+        # Current state of every probed device, from the registry when loaded
+        device_ids = [result["device_id"] for result in results]
+        if device_registry.loaded:
+            devices = device_registry.get_many(device_ids)
+        else:
+            devices = {}
+            for chunk in _chunks(device_ids):
+                rows = db.query(
+                    Device.id, Device.name, Device.ip, Device.status, Device.uptime
+                ).filter(Device.id.in_(chunk))
+                devices.update((row.id, row) for row in rows)
+        
+        # Rolling statistics of the whole batch, in one vectorized pass
+        stats = fleet_stats.update(
+            [result["device_id"] if result["device_id"] in devices else None for result in results],
+            [result.get("rtt_avg") for result in results],
+            [result["packet_loss"] for result in results],
+            [result["jitter"] for result in results]
+        )
+        
+        mappings = []
+        changed_keys = []
+        recovered_ids = []
+        stabilized_ids = []
+        pending_alerts = []
+        for i, result in enumerate(results):
+            device = devices.get(result["device_id"])
+            if device is None:
+                logging.error(f"Device with IP {result['ip']} not found for status update.")
+                continue
+            
+            new_status = result["status"]
+            packet_loss = result["packet_loss"]
+            jitter = result["jitter"]
+            if new_status == "online" and not np.isnan(stats["jitter"][i]):
+                # RFC 3550 jitter across the successive probes of the device,
+                # also recorded as the jitter of the result in the metrics history
+                jitter = result["jitter"] = float(stats["jitter"][i])
+            flapping = result.get("flapping", False)
             
-        if device:
             # Store the previous status to detect changes
             previous_status = device.status
             previous_key = f"{device.id}:{previous_status}"
@@ -134,76 +170,144 @@ def update_device_status(device_id, ip, new_status, packet_loss=None, jitter=Non
                 device_status_cache.get(previous_key) != current_key
             )
             
-            # Update device status and metrics
-            device.status = new_status
+            mapping = {"id": device.id, "status": new_status}
             if packet_loss is not None:
-                device.packet_loss = packet_loss
-                # Store in history for trend analysis
-                metrics_history[f"{device.id}:packet_loss"].append(packet_loss)
+                mapping["packet_loss"] = packet_loss
             if jitter is not None:
-                device.jitter = jitter
-                # Store in history for trend analysis
-                metrics_history[f"{device.id}:jitter"].append(jitter)
+                mapping["jitter"] = jitter
             
             # Update the device's uptime if it's online
             if new_status == "online":
-                # Increment the uptime counter (assuming check_interval is in seconds)
-                settings = load_settings()
-                check_interval = settings.get("check_interval", 30)
-                device.uptime = device.uptime + (check_interval / 3600)  # Convert to hours
+                # Increment the uptime counter by the device's probe interval (in seconds)
+                interval = result.get("interval") or check_interval
+                mapping["uptime"] = (device.uptime or 0) + (interval / 3600)  # Convert to hours
                 
                 # If device has transitioned from offline to online, resolve any active alerts
-                if previous_status == "offline":
-                    # Auto-resolve any active connectivity alerts for this device
-                    auto_resolve_alerts(db, device)
+                # (unless it is flapping: then wait until it is stable)
+                if (previous_status == "offline" and not flapping) or result.get("flap_change") is False:
+                    recovered_ids.append(device.id)
                     
             elif new_status == "offline" and previous_status == "online":
                 # Reset uptime counter when device goes offline
-                device.uptime = 0
-                
+                mapping["uptime"] = 0
+            
+            if new_status == "offline" and result.get("flap_change") is False:
+                # Stable again, but offline: only the flapping alert is over
+                stabilized_ids.append(device.id)
+            
+            mappings.append(mapping)
+            
             # Generate alerts for status changes or concerning metrics
+            # (a link that stopped flapping while offline was never reported offline)
+            if new_status == "offline" and not flapping and (status_changed or result.get("flap_change") is False):
+                # Create a critical alert when device goes offline
+                pending_alerts.append({
+                    "device_id": device.id,
+                    "severity": "critical",
+                    "type": "Connectivity",
+                    "message": f"Device {device.name} is offline",
+                    "description": f"The device at {device.ip} is no longer responding to ping requests."
+                })
             if status_changed:
-                if new_status == "offline":
-                    # Create a critical alert when device goes offline
-                    create_alert(db, device.id, "critical", "Connectivity", 
-                                f"Device {device.name} is offline",
-                                f"The device at {device.ip} is no longer responding to ping requests.")
-                # Removed creation of info alert when a device comes back online
-                # The history will be available in the alert history
-                
-                # Update cache with the new status
-                device_status_cache[current_key] = time.time()
+                # Remember the new status, cached once the alerts are created
+                changed_keys.append(current_key)
+            
+            # A single alert for a flapping link instead of one per status change
+            if result.get("flap_change"):
+                pending_alerts.append({
+                    "device_id": device.id,
+                    "severity": "warning",
+                    "type": "Connectivity",
+                    "message": f"Device {device.name} is flapping",
+                    "description": f"The device at {device.ip} keeps going offline and back online. "
+                                   f"Connectivity alerts are suppressed until it is stable."
+                })
             
             # Check for high packet loss if device is online
-            if new_status == "online" and packet_loss is not None and packet_loss > 10:
+            if new_status == "online" and result.get("confirmed", True) and packet_loss is not None and packet_loss > 10:
                 # Check trend - alert only if packet loss is consistently high or increasing
-                history = metrics_history.get(f"{device.id}:packet_loss", [])
-                # Need at least 2 points to establish a trend
-                if len(history) >= 2 and history[-2] <= packet_loss:
-                    create_alert(db, device.id, "warning", "Performance", 
-                               f"High packet loss detected: {packet_loss:.1f}%",
-                               f"Device {device.name} ({device.ip}) is experiencing significant packet loss.")
+                # over the statistics window (at least 2 points to establish a trend)
+                if stats["samples"][i] >= 2 and (stats["rolling_loss"][i] > 10 or stats["loss_slope"][i] >= 0):
+                    pending_alerts.append({
+                        "device_id": device.id,
+                        "severity": "warning",
+                        "type": "Performance",
+                        "message": f"High packet loss detected: {packet_loss:.1f}%",
+                        "description": f"Device {device.name} ({device.ip}) is experiencing significant packet loss."
+                    })
             
-            db.commit()
-        else:
-            logging.error(f"Device with IP {ip} not found for status update.")
+            # Check for deviations from the usual latency and jitter of the device at this time of day
+            if new_status == "online" and result.get("confirmed", True):
+                values = {"latency": result.get("rtt_avg"), "jitter": jitter}
+                for metric, value, median, upper in device_baselines.observe(device.id, values, result.get("timestamp")):
+                    label, unit, _ = BASELINE_METRICS[metric]
+                    pending_alerts.append({
+                        "device_id": device.id,
+                        "severity": "warning",
+                        "type": "Performance",
+                        "message": f"Unusual {label} detected: {value:.1f}{unit}",
+                        "description": f"Device {device.name} ({device.ip}) has an unusual {label} of {value:.1f}{unit}, "
+                                       f"usually about {median:.1f}{unit} at this time of day "
+                                       f"(99th percentile {upper:.1f}{unit})."
+                    })
+        
+        db.bulk_update_mappings(Device, mappings)
+        resolved_ids = auto_resolve_alerts(db, recovered_ids, {i: devices[i].name for i in recovered_ids})
+        resolved_ids |= auto_resolve_alerts(
+            db, stabilized_ids, {i: devices[i].name for i in stabilized_ids},
+            criteria=(Alert.message.like("% is flapping"),),
+            note="Automatically resolved - device is no longer flapping"
+        )
+        new_alerts = create_alerts(db, pending_alerts)
+        db.commit()
+        device_registry.update_status(mappings)
+        
+        # Update cache with the new statuses
+        now = time.time()
+        for key in changed_keys:
+            device_status_cache[key] = now
+        
+        if resolved_ids:
+            _drop_queued_alerts(resolved_ids)
+        if new_alerts:
+            crud.invalidate_cache('alerts_count')
+            _queue_alerts(new_alerts)
     except Exception as e:
         logging.error(f"Error updating device status: {e}")
         db.rollback()
     finally:
         db.close()
 
-def auto_resolve_alerts(db, device):
-    """Automatically resolve active alerts when a device comes back online."""
-    try:
-        # Find all active alerts for this device
+def auto_resolve_alerts(db, device_ids, device_names=None, criteria=(),
+                        note="Automatically resolved - device is back online"):
+    """
+    Automatically resolve active alerts when devices come back online.
+    
+    The changes are flushed but not committed, so they are part of the
+    caller's transaction.
+    
+    Args:
+        db: Database session
+        device_ids: IDs of the devices whose alerts are resolved
+        device_names: Names of the devices, for the log messages
+        criteria: Extra filters restricting the alerts resolved
+        note: Resolution note of the alerts
+    
+    Returns:
+        Set of the IDs of the resolved alerts
+    """
+    device_names = device_names or {}
+    resolved = set()
+    current_time = datetime.now()
+    
+    for chunk in _chunks(list(device_ids)):
+        # Find all active alerts for these devices
         active_alerts = db.query(Alert).filter(
-            Alert.device_id == device.id,
-            Alert.status == "active"
+            Alert.device_id.in_(chunk),
+            Alert.status == "active",
+            *criteria
         ).all()
         
-        current_time = datetime.now()
-        
         # Resolve each alert and calculate incident duration
         for alert in active_alerts:
             # Calculate incident duration
@@ -219,163 +323,324 @@ def auto_resolve_alerts(db, device):
             alert.status = "resolved"
             alert.resolved_at = current_time
             alert.duration = duration_formatted
-            alert.resolution_note = "Automatically resolved - device is back online"
-            
-            logging.info(f"Auto-resolved alert '{alert.message}' for {device.name}. Duration: {duration_formatted}")
+            alert.resolution_note = note
+            resolved.add(alert.id)
             
-        db.commit()
-        
-        # Clear from notification queue
-        global alert_queue
-        alert_queue = deque([a for a in alert_queue if not (a['device_id'] == device.id)], maxlen=100)
-        
-    except Exception as e:
-        logging.error(f"Error auto-resolving alerts: {e}")
-        db.rollback()
+            device_name = device_names.get(alert.device_id, alert.device_id)
+            logging.info(f"Auto-resolved alert '{alert.message}' for {device_name}. Duration: {duration_formatted}",
+                         extra=log_context(alert.device_id, event="alert"))
+    
+    db.flush()
+    return resolved
 
-def create_alert(db, device_id, severity, alert_type, message, description=None):
-    """Create a new alert in the database and add to notification queue."""
-    try:
-        # Check if there's already an active alert of the same type for this device
-        existing_alert = db.query(Alert).filter(
-            Alert.device_id == device_id,
-            Alert.type == alert_type,
-            Alert.message == message,
-            Alert.status == "active"
-        ).first()
+def _drop_queued_alerts(alert_ids):
+    """Remove the given (resolved) alerts from the notification queue."""
+    global alert_queue
+    alert_queue = deque([a for a in alert_queue if a['id'] not in alert_ids], maxlen=100)
+
+def _queue_alerts(alerts):
+    """Add newly created alerts to the notification queue for real-time updates."""
+    for alert in alerts:
+        entry = {
+            "id": alert.id,
+            "device_id": alert.device_id,
+            "severity": alert.severity,
+            "message": alert.message,
+            "timestamp": time.time()
+        }
+        alert_queue.append(entry)
+        alert_hub.publish(entry)
+        logging.info(f"Alert created successfully: {alert.severity} - {alert.message}",
+                     extra=log_context(alert.device_id, event="alert"))
+
+def create_alerts(db, alerts):
+    """
+    Insert a batch of alerts, skipping those that duplicate an active alert.
+    
+    The new rows are flushed (so they get their IDs) but not committed.
+    
+    Args:
+        db: Database session
+        alerts: List of dicts with device_id, severity, type, message, description
         
+    Returns:
+        List of the newly created Alert instances
+    """
+    if not alerts:
+        return []
+    
+    # Look up the active alerts of the same devices in one query
+    existing = set()
+    for chunk in _chunks(list({alert["device_id"] for alert in alerts})):
+        rows = db.query(Alert.device_id, Alert.type, Alert.message).filter(
+            Alert.device_id.in_(chunk),
+            Alert.status == "active"
+        )
+        existing.update((row.device_id, row.type, row.message) for row in rows)
+    
+    new_alerts = []
+    for alert_data in alerts:
+        key = (alert_data["device_id"], alert_data["type"], alert_data["message"])
         # Don't create duplicate alerts if there's an active one
-        if existing_alert:
-            logging.info(f"Alert already exists for device {device_id}, not creating a new one")
-            return
+        if key in existing:
+            logging.info(f"Alert already exists for device {alert_data['device_id']}, not creating a new one")
+            continue
+        existing.add(key)
         
         # Clean the device status cache to allow creation of
         # new alerts even if a similar alert was recently resolved
-        for key in list(device_status_cache.keys()):
-            if str(device_id) in key:
-                logging.info(f"Removing key from cache: {key}")
-                del device_status_cache[key]
+        prefix = f"{alert_data['device_id']}:"
+        for key in [k for k in device_status_cache if k.startswith(prefix)]:
+            logging.info(f"Removing key from cache: {key}")
+            del device_status_cache[key]
         
-        # Create the new alert
-        alert_data = {
+        logging.info(f"Creating new alert: {alert_data['message']} for device {alert_data['device_id']}",
+                     extra=log_context(alert_data["device_id"], event="alert"))
+        new_alerts.append(Alert(status="active", **alert_data))
+    
+    if new_alerts:
+        db.add_all(new_alerts)
+        db.flush()
+    return new_alerts
+
+def create_alert(db, device_id, severity, alert_type, message, description=None):
+    """Create a new alert in the database and add to notification queue."""
+    try:
+        new_alerts = create_alerts(db, [{
             "device_id": device_id,
             "severity": severity,
             "type": alert_type,
             "message": message,
-            "description": description,
-            "status": "active"
-        }
-        
-        logging.info(f"Creating new alert: {message} for device {device_id}")
-        new_alert = crud.create_alert(db, alert_data)
-        
-        # Add to notification queue for real-time updates
-        if new_alert:
-            alert_queue.append({
-                "id": new_alert.id,
-                "device_id": device_id,
-                "severity": severity,
-                "message": message,
-                "timestamp": time.time()
-            })
-            
-            logging.info(f"Alert created successfully: {severity} - {message}")
-        else:
-            logging.error(f"Error creating alert for device {device_id}")
+            "description": description
+        }])
+        db.commit()
+        if new_alerts:
+            crud.invalidate_cache('alerts_count')
+            _queue_alerts(new_alerts)
     except Exception as e:
         logging.error(f"Error creating alert: {e}")
+        db.rollback()
+
+def calculate_metrics(ping_times, ping_count):
+    """Calculate packet loss (%) and jitter (ms) from the successful ping times."""
+    packet_loss_pct = (ping_count - len(ping_times)) * (100 / ping_count) if ping_count else 0
+    
+    # Calculate jitter if we have at least 2 successful pings
+    jitter = 0
+    if len(ping_times) >= 2:
+        # Simple jitter calculation (standard deviation)
+        mean = sum(ping_times) / len(ping_times)
+        variance = sum((t - mean) ** 2 for t in ping_times) / len(ping_times)
+        jitter = variance ** 0.5 * 1000  # Convert to ms
+    return max(packet_loss_pct, 0), jitter
 
-def ping_device(device, settings):
-    """Ping a single device and calculate metrics."""
-    name = device["name"]
-    ip = device["ip"]
-    device_id = device["id"]
-    ping_timeout = settings.get("ping_timeout", 1)
-    retry_interval = settings.get("retry_interval", 5)
-    max_retries = settings.get("max_retries", 3)
-    ping_count = settings.get("ping_count", 3)
-    
-    retries = 0
-    packet_loss_pct = 0
-    ping_times = []
-    
-    # Perform multiple pings to calculate metrics
-    for _ in range(ping_count):
-        response = ping(ip, timeout=ping_timeout)
-        if response:
-            ping_times.append(response)
+async def probe_device_async(probe, device, settings):
+    """
+    Probe a single device with its probe type and calculate metrics.
+    
+    Returns:
+        The probe result record for the device
+    """
+    name = device.name
+    ip = device.ip
+    ping_timeout = settings.ping_timeout
+    retry_interval = settings.retry_interval
+    max_retries = settings.max_retries
+    ping_count = settings.ping_count
     
+    ping_times = await probe.measure(device, count=ping_count, timeout=ping_timeout)
     if ping_times:
-        # Calculate packet loss percentage
-        packet_loss_pct = (ping_count - len(ping_times)) * (100 / ping_count)
-        
-        # Calculate jitter if we have at least 2 successful pings
-        jitter = 0
-        if len(ping_times) >= 2:
-            # Simple jitter calculation (standard deviation)
-            mean = sum(ping_times) / len(ping_times)
-            variance = sum((t - mean) ** 2 for t in ping_times) / len(ping_times)
-            jitter = variance ** 0.5 * 1000  # Convert to ms
-        
-        # Device is responding, mark as online
-        status = "online"
-        logging.info(f"{name} ({ip}) is {status}")
-        update_device_status(device_id, ip, status, packet_loss_pct, jitter)
-        return True
-    else:
-        # Start retry logic
-        while retries < max_retries:
-            status = f"offline, retrying ({retries + 1})"
-            logging.info(f"{name} ({ip}) is {status}")
-            retries += 1
-            if retries < max_retries:
-                time.sleep(retry_interval)
-                response = ping(ip, timeout=ping_timeout)
-                if response:
-                    # Device responded during retries
-                    status = "online"
-                    logging.info(f"{name} ({ip}) is {status}")
-                    update_device_status(device_id, ip, status, 75, 0)  # High packet loss but responding
-                    return True
-        
-        # Device is not responding after all retries
-        final_status = "offline"
-        logging.info(f"{name} ({ip}) is {final_status}")
-        update_device_status(device_id, ip, final_status, 100, 0)  # 100% packet loss when offline
-        return False
+        packet_loss_pct, jitter = calculate_metrics(ping_times, ping_count)
+        logging.info(f"{name} ({ip}) is online", extra=log_context(device.id, ip, "status"))
+        return make_result(device, "online", packet_loss_pct, jitter, ping_times)
+    
+    # Retry logic, without holding a thread while waiting
+    for attempt in range(1, max_retries + 1):
+        logging.info(f"{name} ({ip}) is offline, retrying ({attempt})", extra=log_context(device.id, ip, "retry"))
+        if attempt >= max_retries:
+            break
+        await asyncio.sleep(retry_interval)
+        if await probe.measure(device, count=1, timeout=ping_timeout):
+            logging.info(f"{name} ({ip}) is online", extra=log_context(device.id, ip, "status"))
+            return make_result(device, "online", 75, 0)  # High packet loss but responding
+    
+    details = probe.details.get(device.id)
+    logging.info(f"{name} ({ip}) is offline" + (f" ({details})" if details else ""), extra=log_context(device.id, ip, "status"))
+    return make_result(device, "offline", 100, 0)  # 100% packet loss when offline
 
-def ping_devices_parallel(devices, settings):
-    """Ping multiple devices in parallel using a thread pool."""
-    device_count = len(devices)
-    if device_count == 0:
-        return
-        
-    # Determine max workers - don't create more threads than needed
-    # Also cap at 10 threads to avoid overwhelming the system
-    max_workers = min(device_count, 10)
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all ping tasks
-        future_to_device = {
-            executor.submit(ping_device, device, settings): device 
-            for device in devices
-        }
-        
-        # Process results as they complete
-        for future in concurrent.futures.as_completed(future_to_device):
-            device = future_to_device[future]
-            try:
-                future.result()  # Get the ping result
-            except Exception as e:
-                logging.error(f"Error monitoring device {device['name']}: {e}")
+async def open_probes():
+    """
+    Open one probe of every probe type, shared by all the devices of that type.
+    
+    ICMP falls back to ping3 in worker threads when no ICMP socket can be opened.
+    
+    Returns:
+        Dictionary of probe type name -> Probe
+    """
+    probes = {}
+    for name, probe_class in PROBE_TYPES.items():
+        probe = probe_class()
+        try:
+            await probe.open()
+        except ProbeUnavailable as e:
+            logging.warning(f"{e}. Falling back to threaded pinging.")
+            probe = Ping3Probe()
+        probes[name] = probe
+    return probes
+
+def apply_health(health, device, result, interval, now=None):
+    """
+    Pass a probe result through the health tracker.
+    
+    The result gets the debounced status and the flapping state of the
+    device. Results that are not confirmed yet (e.g. the first failed probe
+    of an online device) are not written back: their status would
+    contradict their measurements, and the device is re-checked shortly.
+    
+    Returns:
+        The result to write back, or None while unconfirmed
+    """
+    status, flap_change = health.observe(device, result["status"] == "online", now)
+    device_health = health.get(device)
+    if flap_change is not None:
+        result["flap_change"] = flap_change
+        logging.warning(f"{device.name} ({device.ip}) {'is flapping' if flap_change else 'is stable again'}",
+                        extra=log_context(device.id, device.ip, "status"))
+    if not device_health.confirmed:
+        return None
+    result.update(status=status, confirmed=True, flapping=device_health.flapping, interval=interval)
+    return result
 
-def ping_devices_sequential(devices, settings):
-    """Ping devices sequentially."""
-    for device in devices:
+def write_results(results, settings):
+    """Persist a batch of probe results: device status, alerts and metrics history."""
+    # Status first: it sets the jitter of the results to the rolling jitter of their devices
+    update_devices_status(results, settings)
+    record_metrics(results)
+
+async def run_scheduler(inventory=device_registry, write=write_results, agent=None, load_settings=settings_store.load):
+    """
+    Probe every device when it is due, until shutdown.
+    
+    Devices come from `inventory` (the device registry, or the shard of a
+    worker process), loaded once and then followed through its change
+    notifications; only the devices assigned to `agent` (None for this
+    server) are probed. Settings are (re)loaded with `load_settings`,
+    which publishes them to the settings_store.
+    
+    Devices are kept in a ProbeScheduler, so each one is probed at its
+    own interval (Device.check_interval, or the check_interval setting)
+    with the probes spread over time. Setting changes are applied as soon
+    as a new settings_store version shows up.
+    Probes run concurrently with the probe type of each device
+    (Device.probe_type: ICMP on a shared socket by default, TCP connect,
+    HTTP or DNS), each type having its own concurrency limit, and their
+    results are passed to `write` (write_results by default) in batches
+    every FLUSH_INTERVAL.
+    
+    Outcomes go through a HealthTracker: status changes are confirmed by a
+    quick re-check (unconfirmed outcomes are not written back), flapping
+    devices get a single alert, and devices that stay down are probed
+    without retries and with an exponential backoff.
+    """
+    settings = await asyncio.to_thread(load_settings)
+    scheduler = ProbeScheduler(settings.check_interval, SCHEDULE_JITTER)
+    health = HealthTracker()
+    probe_types = await open_probes()
+    
+    def pool_size(settings):
+        # Use parallel or sequential pinging based on settings
+        return MAX_IN_FLIGHT if settings.parallel_pings else 1
+    
+    results = []
+    probes = set()
+    slots = ProbeSlots(pool_size(settings))
+    flush_task = None
+    next_reload = next_flush = 0
+    
+    def apply_change(device_id, record):
+        if record is None or (record.agent or None) != agent:
+            scheduler.remove(device_id)
+            health.forget(device_id)
+        else:
+            scheduler.add(record)
+    
+    # Inventory changes are notified from the API threads
+    loop = asyncio.get_running_loop()
+    def on_device_change(device_id, record):
+        loop.call_soon_threadsafe(apply_change, device_id, record)
+    
+    inventory.subscribe(on_device_change)
+    devices = await asyncio.to_thread(load_devices, inventory)
+    if not devices:
+        logging.warning("No devices to monitor yet.")
+    scheduler.sync([record for record in inventory.records() if (record.agent or None) == agent])
+    
+    async def probe(device, settings):
         try:
-            ping_device(device, settings)
+            # Retrying a device known to be down only wastes probe capacity
+            probe_settings = settings.replace(max_retries=0) if health.is_down(device) else settings
+            device_probe = probe_types.get(device.probe_type or "icmp")
+            if device_probe is None:
+                raise ValueError(f"Unknown probe type {device.probe_type!r}")
+            async with slots:
+                result = await probe_device_async(device_probe, device, probe_settings)
+            
+            interval = scheduler.interval_for(device)
+            result = apply_health(health, device, result, interval)
+            if result is not None:
+                results.append(result)
+            
+            delay = health.next_delay(device, interval, settings.retry_interval)
+            if delay is not None:
+                scheduler.reschedule(device.id, delay)
         except Exception as e:
-            logging.error(f"Error monitoring device {device['name']}: {e}")
+            logging.error(f"Error monitoring device {device.name}: {e}", extra=log_context(device.id, device.ip, "error"))
+        finally:
+            scheduler.finished(device.id)
+    
+    try:
+        while not shutdown_event.is_set():
+            now = time.monotonic()
+            if now >= next_reload:
+                # Pick up settings changed by other processes
+                await asyncio.to_thread(load_settings)
+                # Clean up old cache entries periodically
+                clear_old_cache_entries()
+                next_reload = now + SETTINGS_RELOAD_INTERVAL
+            
+            # Apply the settings changed since the last scheduling decision
+            if settings_store.current.version != settings.version:
+                settings = settings_store.current
+                scheduler.set_default_interval(settings.check_interval)
+                await slots.resize(pool_size(settings))
+                logging.info(f"Monitoring settings updated (version {settings.version})")
+            
+            for device in scheduler.pop_due(now):
+                task = asyncio.create_task(probe(device, settings))
+                probes.add(task)
+                task.add_done_callback(probes.discard)
+            
+            if results and now >= next_flush and (flush_task is None or flush_task.done()):
+                batch = results[:]
+                results.clear()
+                flush_task = asyncio.create_task(asyncio.to_thread(write, batch, settings))
+                next_flush = now + FLUSH_INTERVAL
+            
+            # Sleep until the next due probe, waking up regularly to flush and check shutdown
+            next_due = scheduler.next_due()
+            delay = FLUSH_INTERVAL if next_due is None else min(next_due - now, FLUSH_INTERVAL)
+            await asyncio.sleep(max(delay, 0.01))
+    finally:
+        inventory.unsubscribe(on_device_change)
+        for task in list(probes):
+            task.cancel()
+        await asyncio.gather(*probes, return_exceptions=True)
+        if flush_task is not None:
+            await asyncio.gather(flush_task, return_exceptions=True)
+        if results:
+            await asyncio.to_thread(write, results, settings)
+        for device_probe in probe_types.values():
+            await device_probe.close()
 
 def get_latest_alerts(limit=10):
     """Get the most recent alerts from the notification queue."""
@@ -384,8 +649,7 @@ def get_latest_alerts(limit=10):
 def clear_old_cache_entries():
     """Clean up old cache entries."""
     current_time = time.time()
-    settings = load_settings()
-    cache_ttl = settings.get("cache_ttl", 300)
+    cache_ttl = settings_store.current.cache_ttl
     
     # Clean up device status cache
     expired_keys = [k for k, v in device_status_cache.items() 
@@ -393,39 +657,30 @@ def clear_old_cache_entries():
     for key in expired_keys:
         del device_status_cache[key]
 
+def run_metrics_rollup():
+    """Periodically roll up the metrics history into coarser tiers until shutdown."""
+    while not shutdown_event.wait(ROLLUP_INTERVAL):
+        try:
+            started = time.time()
+            metrics_store.rollup()
+            logging.debug(f"Metrics rollup completed in {time.time() - started:.2f} seconds")
+        except Exception as e:
+            logging.error(f"Error rolling up metrics: {e}")
+
 def start_monitor():
-    """Start the device monitoring cycle."""
-    logging.info("Starting device monitoring cycle...")
+    """Start the device monitoring scheduler."""
+    logging.info("Starting device monitoring...")
+    
+    # Roll up the metrics history in the background
+    threading.Thread(target=run_metrics_rollup, daemon=True).start()
+    
     while not shutdown_event.is_set():
         try:
-            devices = load_devices()
-            settings = load_settings()
-            
-            if not devices:
-                logging.error("No devices found in this cycle.")
-            else:
-                # Clean up old cache entries periodically
-                clear_old_cache_entries()
-                
-                # Use parallel or sequential pinging based on settings
-                if settings.get("parallel_pings", True):
-                    ping_devices_parallel(devices, settings)
-                else:
-                    ping_devices_sequential(devices, settings)
-                    
-            check_interval = settings.get("check_interval", 60)
-            logging.info(f"Cycle completed. Waiting {check_interval} seconds before next cycle...")
-            
-            # Use a loop with short sleeps to check shutdown more frequently
-            for _ in range(check_interval):
-                if shutdown_event.is_set():
-                    break
-                time.sleep(1)
-                
+            asyncio.run(run_scheduler())
         except Exception as e:
-            logging.error(f"Error in monitoring cycle: {e}")
+            logging.error(f"Error in monitoring scheduler: {e}")
             # Wait a bit before trying again after an error
-            time.sleep(5)
+            shutdown_event.wait(5)
 
 def stop_monitor():
     """Signal the monitor to stop."""
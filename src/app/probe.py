@@ -0,0 +1,524 @@
+import os
+import sys
+import time
+import socket
+import struct
+import asyncio
+import logging
+import itertools
+import ipaddress
+import httpx
+from ping3 import ping
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+# Payload appended to every echo request (56 bytes, like the classic ping)
+ECHO_PAYLOAD = b"netwatch" * 7
+# Upper bound of echo requests waiting for a reply at the same time
+MAX_IN_FLIGHT = 4096
+# Receive buffer large enough to absorb a burst of replies from a big fleet
+RECV_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class ProbeUnavailable(Exception):
+    """Raised when no ICMP socket can be opened on this host."""
+
+
+def _checksum(data: bytes) -> int:
+    """Compute the RFC 1071 internet checksum of an ICMP packet."""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _open_icmp_socket():
+    """
+    Open a non-blocking ICMP socket.
+
+    Tries an unprivileged datagram ICMP socket first (Linux with
+    net.ipv4.ping_group_range, macOS) and falls back to a raw socket,
+    which requires root or CAP_NET_RAW.
+
+    Returns:
+        Tuple of (socket, is_raw)
+    """
+    errors = []
+    for sock_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        if sock_type == socket.SOCK_DGRAM and sys.platform == "win32":
+            continue
+        try:
+            sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+        except OSError as e:
+            errors.append(e)
+            continue
+        sock.setblocking(False)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+        except OSError:
+            pass
+        return sock, sock_type == socket.SOCK_RAW
+    raise ProbeUnavailable(f"Unable to open an ICMP socket: {errors[-1] if errors else 'unsupported platform'}")
+
+
+class ICMPProber:
+    """
+    Asyncio ICMP echo engine multiplexing every request over one socket.
+
+    Echo requests are matched to replies by (source address, sequence number)
+    and, on raw sockets, by identifier as well. Datagram ICMP sockets have
+    their identifier rewritten by the kernel and only ever receive their own
+    replies, so the identifier check is skipped there.
+
+    Usage:
+        async with ICMPProber() as prober:
+            rtts = await prober.ping_many(["10.0.0.1", "10.0.0.2"])
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT):
+        self.sock = None
+        self.raw = False
+        self.ident = os.getpid() & 0xFFFF
+        self._sequence = itertools.count()
+        self._pending = {}
+        self._loop = None
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open(self):
+        """Open the socket and register it with the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self.sock, self.raw = _open_icmp_socket()
+        self._loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def close(self):
+        """Unregister and close the socket, cancelling pending requests."""
+        if self.sock is None:
+            return
+        try:
+            self._loop.remove_reader(self.sock.fileno())
+        finally:
+            self.sock.close()
+            self.sock = None
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+    def _on_readable(self):
+        """Drain every datagram currently queued on the socket."""
+        while self.sock is not None:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logging.debug(f"ICMP receive error: {e}")
+                return
+            received = time.perf_counter()
+
+            # Raw sockets (and datagram sockets on some platforms) include
+            # the IPv4 header; an echo reply never starts with 0x4X.
+            if data and data[0] >> 4 == 4:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+
+            icmp_type, _, _, ident, sequence = struct.unpack("!BBHHH", data[:8])
+            if icmp_type != ICMP_ECHO_REPLY or (self.raw and ident != self.ident):
+                continue
+
+            entry = self._pending.pop((addr[0], sequence), None)
+            if entry is None:
+                continue
+            future, sent_at = entry
+            if not future.done():
+                future.set_result(received - sent_at)
+
+    def _build_packet(self, sequence: int) -> bytes:
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, self.ident, sequence)
+        checksum = _checksum(header + ECHO_PAYLOAD)
+        return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, self.ident, sequence) + ECHO_PAYLOAD
+
+    async def echo(self, address: str, timeout: float):
+        """
+        Send a single echo request and wait for its reply.
+
+        Args:
+            address: Numeric IPv4 address of the target
+            timeout: Seconds to wait for the reply
+
+        Returns:
+            Round-trip time in seconds, or None on timeout or send error
+        """
+        async with self._slots:
+            sequence = next(self._sequence) & 0xFFFF
+            key = (address, sequence)
+            future = self._loop.create_future()
+            self._pending[key] = (future, time.perf_counter())
+            try:
+                await self._loop.sock_sendto(self.sock, self._build_packet(sequence), (address, 0))
+                return await asyncio.wait_for(future, timeout)
+            except (asyncio.TimeoutError, OSError):
+                return None
+            finally:
+                self._pending.pop(key, None)
+
+    async def ping(self, address: str, count: int = 3, timeout: float = 3, interval: float = 0.2):
+        """
+        Send `count` echo requests spaced `interval` seconds apart.
+
+        Requests are not serialized on their replies, so the whole exchange
+        takes about (count - 1) * interval + timeout in the worst case.
+
+        Returns:
+            List of round-trip times (seconds) of the replies received
+        """
+        async def delayed_echo(delay):
+            if delay:
+                await asyncio.sleep(delay)
+            return await self.echo(address, timeout)
+
+        results = await asyncio.gather(*(delayed_echo(i * interval) for i in range(count)))
+        return [rtt for rtt in results if rtt is not None]
+
+    async def ping_many(self, hosts, count: int = 3, timeout: float = 3, interval: float = 0.2):
+        """
+        Ping many hosts concurrently.
+
+        Args:
+            hosts: Iterable of IP addresses or hostnames
+            count: Number of echo requests per host
+            timeout: Seconds to wait for each reply
+            interval: Seconds between consecutive requests to the same host
+
+        Returns:
+            Dictionary mapping each host to its list of round-trip times
+        """
+        hosts = list(dict.fromkeys(hosts))
+        addresses = await resolve_many(hosts)
+
+        async def probe(host):
+            address = addresses.get(host)
+            if address is None:
+                return host, []
+            return host, await self.ping(address, count, timeout, interval)
+
+        return dict(await asyncio.gather(*(probe(host) for host in hosts)))
+
+
+async def resolve_many(hosts):
+    """
+    Resolve hostnames to IPv4 addresses concurrently.
+
+    Returns:
+        Dictionary mapping each host to its address, or None if unresolvable
+    """
+    loop = asyncio.get_running_loop()
+
+    async def resolve(host):
+        try:
+            return host, str(ipaddress.IPv4Address(host))
+        except ValueError:
+            pass
+        try:
+            info = await loop.getaddrinfo(host, None, family=socket.AF_INET)
+            return host, info[0][4][0]
+        except (OSError, IndexError) as e:
+            logging.debug(f"Unable to resolve {host}: {e}")
+            return host, None
+
+    return dict(await asyncio.gather(*(resolve(host) for host in hosts)))
+
+
+def icmp_available() -> bool:
+    """Check whether an ICMP socket can be opened with the current privileges."""
+    try:
+        sock, _ = _open_icmp_socket()
+    except ProbeUnavailable:
+        return False
+    sock.close()
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Probe types
+# ---------------------------------------------------------------------------
+# Verify the certificates of HTTPS probes; set to False for devices addressed
+# by IP or with self-signed certificates
+HTTP_VERIFY_TLS = os.getenv("NETWATCH_HTTP_PROBE_VERIFY_TLS", "True").lower() == "true"
+
+
+class Probe:
+    """
+    Base class of the probe types, selected per device by Device.probe_type.
+
+    A probe measures how long one attempt at reaching a device takes, e.g.
+    an ICMP echo or a TCP connect. Every probe type has its own concurrency
+    limit, on top of the monitor's global one. Subclasses implement
+    `attempt`, and `open`/`close` when they hold shared resources.
+    """
+
+    name = None
+    # Attempts of this probe type running at the same time
+    concurrency = 256
+
+    def __init__(self, concurrency: int = None):
+        self.limit = asyncio.Semaphore(concurrency or self.concurrency)
+        # Details of the last attempt on each device (e.g. HTTP status), for the logs
+        self.details = {}
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @classmethod
+    def check_target(cls, target: str) -> None:
+        """Raise ValueError if `target` is not a valid Device.probe_target for this probe type."""
+
+    async def attempt(self, device, timeout: float):
+        """
+        Make one attempt at reaching a device.
+
+        Returns:
+            The round-trip time in seconds, or None on failure
+        """
+        raise NotImplementedError
+
+    async def measure(self, device, count: int = 3, timeout: float = 3, interval: float = 0.2):
+        """
+        Make `count` attempts, `interval` seconds apart.
+
+        Returns:
+            List of the round-trip times (in seconds) of the successful attempts
+        """
+        async def delayed_attempt(delay):
+            await asyncio.sleep(delay)
+            async with self.limit:
+                try:
+                    return await asyncio.wait_for(self.attempt(device, timeout), timeout)
+                except (OSError, ValueError, asyncio.TimeoutError) as e:
+                    # ValueError: probe target invalid for this probe type (e.g. stored before validation)
+                    self.details[device.id] = {"error": str(e) or type(e).__name__}
+                    return None
+
+        results = await asyncio.gather(*(delayed_attempt(i * interval) for i in range(count)))
+        return [rtt for rtt in results if rtt is not None]
+
+
+class ICMPProbe(Probe):
+    """ICMP echo over the shared ICMPProber socket (the default probe type)."""
+
+    name = "icmp"
+    concurrency = MAX_IN_FLIGHT
+
+    def __init__(self, concurrency: int = None):
+        super().__init__(concurrency)
+        self.prober = ICMPProber()
+
+    async def open(self):
+        self.prober.open()
+
+    async def close(self):
+        self.prober.close()
+
+    async def measure(self, device, count: int = 3, timeout: float = 3, interval: float = 0.2):
+        results = await self.prober.ping_many([device.ip], count=count, timeout=timeout, interval=interval)
+        return results.get(device.ip, [])
+
+
+class Ping3Probe(Probe):
+    """ICMP echo with ping3 in worker threads, when no ICMP socket can be opened."""
+
+    name = "icmp"
+    concurrency = 10
+
+    async def attempt(self, device, timeout: float):
+        return await asyncio.to_thread(ping, device.ip, timeout=timeout) or None
+
+
+class TCPProbe(Probe):
+    """TCP connect to the port given in Device.probe_target (80 by default)."""
+
+    name = "tcp"
+
+    @classmethod
+    def check_target(cls, target: str) -> None:
+        if not (target.isdigit() and 1 <= int(target) <= 65535):
+            raise ValueError(f"TCP probe target must be a port number (1-65535), got {target!r}")
+
+    async def attempt(self, device, timeout: float):
+        port = int(device.probe_target or 80)
+        started = time.perf_counter()
+        _, writer = await asyncio.open_connection(device.ip, port)
+        rtt = time.perf_counter() - started
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return rtt
+
+
+class HTTPProbe(Probe):
+    """
+    HTTP(S) GET of Device.probe_target: a URL, or a path on http://<ip>.
+
+    Requests go through one shared httpx client, which keeps connections
+    alive between probes. Responses with a status below 400 are
+    successes. The details record the status and, for new connections,
+    the TCP connect and TLS handshake times.
+    """
+
+    name = "http"
+    concurrency = 64
+
+    def __init__(self, concurrency: int = None):
+        super().__init__(concurrency)
+        self.client = None
+
+    async def open(self):
+        # Don't log every probe request
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self.client = httpx.AsyncClient(verify=HTTP_VERIFY_TLS, limits=limits, follow_redirects=False)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    @classmethod
+    def check_target(cls, target: str) -> None:
+        if target.startswith("/"):
+            return
+        try:
+            url = httpx.URL(target)
+        except httpx.InvalidURL:
+            url = None
+        if url is None or url.scheme not in ("http", "https") or not url.host:
+            raise ValueError(f"HTTP probe target must be an http(s):// URL or a /path, got {target!r}")
+
+    @staticmethod
+    def url(device) -> str:
+        target = device.probe_target or "/"
+        if target.startswith("/"):
+            return f"http://{device.ip}{target}"
+        return target
+
+    async def attempt(self, device, timeout: float):
+        timings = {}
+
+        async def trace(event, info):
+            # e.g. "connection.start_tls.started", "connection.start_tls.complete"
+            timings[event] = time.perf_counter()
+
+        started = time.perf_counter()
+        try:
+            response = await self.client.get(self.url(device), timeout=timeout, extensions={"trace": trace})
+        except httpx.HTTPError as e:
+            self.details[device.id] = {"error": str(e) or type(e).__name__}
+            return None
+        rtt = time.perf_counter() - started
+
+        details = {"status": response.status_code, "latency_ms": rtt * 1000}
+        for step in ("connect_tcp", "start_tls"):
+            if f"connection.{step}.complete" in timings:
+                duration = timings[f"connection.{step}.complete"] - timings[f"connection.{step}.started"]
+                details[f"{step.replace('start_', '')}_ms"] = duration * 1000
+        self.details[device.id] = details
+        return rtt if response.status_code < 400 else None
+
+
+class _DNSClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, query_id: int, future: asyncio.Future):
+        self.query_id = query_id
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if len(data) >= 12 and struct.unpack("!H", data[:2])[0] == self.query_id and not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+class DNSProbe(Probe):
+    """
+    DNS query sent to the device, a DNS server on port 53.
+
+    Queries the A record of Device.probe_target ("localhost" by default).
+    Any well-formed answer, including NXDOMAIN, counts as a success since
+    the server is responding; SERVFAIL and REFUSED are failures.
+    """
+
+    name = "dns"
+    concurrency = 128
+    port = 53
+
+    @classmethod
+    def check_target(cls, target: str) -> None:
+        labels = target.strip(".").split(".")
+        try:
+            valid = len(target) <= 253 and all(0 < len(label.encode("idna")) <= 63 for label in labels)
+        except UnicodeError:
+            valid = False
+        if not valid or any(char in label for label in labels for char in " /:@"):
+            raise ValueError(f"DNS probe target must be a host name, got {target!r}")
+
+    @staticmethod
+    def build_query(query_id: int, name: str) -> bytes:
+        header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)  # Recursion desired
+        labels = b"".join(bytes([len(label)]) + label.encode("idna") for label in name.strip(".").split(".") if label)
+        return header + labels + b"\x00" + struct.pack("!HH", 1, 1)  # A record, IN class
+
+    async def attempt(self, device, timeout: float):
+        loop = asyncio.get_running_loop()
+        query_id = int.from_bytes(os.urandom(2), "big")
+        future = loop.create_future()
+        started = time.perf_counter()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DNSClientProtocol(query_id, future), remote_addr=(device.ip, self.port)
+        )
+        try:
+            transport.sendto(self.build_query(query_id, device.probe_target or "localhost"))
+            response = await future
+        finally:
+            transport.close()
+        rtt = time.perf_counter() - started
+
+        flags = struct.unpack("!H", response[2:4])[0]
+        rcode = flags & 0x000F
+        answers = struct.unpack("!H", response[6:8])[0]
+        self.details[device.id] = {"rcode": rcode, "answers": answers, "latency_ms": rtt * 1000}
+        return rtt if flags & 0x8000 and rcode in (0, 3) else None
+
+
+# Probe types by name
+PROBE_TYPES = {probe.name: probe for probe in (ICMPProbe, TCPProbe, HTTPProbe, DNSProbe)}
+
+
+def check_probe_target(probe_type, target) -> None:
+    """
+    Check that a device's probe target suits its probe type (ICMP if not set).
+
+    Raises:
+        ValueError: if the probe type is unknown or the target is invalid for it
+    """
+    probe = PROBE_TYPES.get(probe_type or "icmp")
+    if probe is None:
+        raise ValueError(f"Unknown probe type {probe_type!r}")
+    if target is not None:
+        probe.check_target(target)
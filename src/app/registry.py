@@ -0,0 +1,125 @@
+import logging
+import threading
+from app.db.database import SessionLocal
+from app.db.models import Device
+
+# Device attributes kept in memory for the monitor
+DEVICE_FIELDS = (
+    "id", "name", "ip", "type", "status", "packet_loss", "jitter", "uptime",
+    "check_interval", "probe_type", "probe_target", "agent"
+)
+
+
+class DeviceRecord:
+    """Compact in-memory copy of the monitored attributes of a device."""
+
+    __slots__ = DEVICE_FIELDS
+
+    def __init__(self, **fields):
+        for name in DEVICE_FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_model(cls, device: Device) -> "DeviceRecord":
+        return cls(**{name: getattr(device, name) for name in DEVICE_FIELDS})
+
+    def __repr__(self):
+        return f"DeviceRecord(id={self.id}, name={self.name!r}, ip={self.ip!r}, status={self.status!r})"
+
+
+class DeviceRegistry:
+    """
+    In-memory inventory of the monitored devices.
+
+    Loaded from the database once, then kept up to date by the device CRUD
+    functions (upsert/remove after each commit) and by the monitor (status
+    and metrics after each write-back). Listeners are called with
+    (device_id, record) on every inventory change, record being None for
+    a removed device; they run in the thread making the change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}
+        self._listeners = []
+        self.loaded = False
+
+    def load(self, force: bool = False):
+        """Load the devices from the database (once, unless forced) and return their records."""
+        with self._lock:
+            if force or not self.loaded:
+                db = SessionLocal()
+                try:
+                    rows = db.query(*(getattr(Device, name) for name in DEVICE_FIELDS)).all()
+                finally:
+                    db.close()
+                self._records = {row.id: DeviceRecord(**row._asdict()) for row in rows}
+                self.loaded = True
+            return list(self._records.values())
+
+    def records(self):
+        """Return the records of all devices."""
+        with self._lock:
+            return list(self._records.values())
+
+    def get(self, device_id: int):
+        return self._records.get(device_id)
+
+    def get_many(self, device_ids):
+        """Return a dictionary of the records of the given devices that exist."""
+        records = self._records
+        return {device_id: records[device_id] for device_id in device_ids if device_id in records}
+
+    def subscribe(self, listener) -> None:
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, device_id: int, record) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(device_id, record)
+            except Exception as e:
+                logging.error(f"Error notifying device change for device {device_id}: {e}")
+
+    def upsert(self, device: Device) -> None:
+        """Add or replace the record of a device just created or updated."""
+        record = DeviceRecord.from_model(device)
+        with self._lock:
+            if not self.loaded:
+                return
+            self._records[record.id] = record
+        self._notify(record.id, record)
+
+    def upsert_records(self, records) -> None:
+        """Add or replace the records of many devices at once (e.g. a bulk import)."""
+        with self._lock:
+            if not self.loaded:
+                return
+            for record in records:
+                self._records[record.id] = record
+        for record in records:
+            self._notify(record.id, record)
+
+    def remove(self, device_id: int) -> None:
+        """Remove the record of a device just deleted."""
+        with self._lock:
+            if not self.loaded or self._records.pop(device_id, None) is None:
+                return
+        self._notify(device_id, None)
+
+    def update_status(self, mappings) -> None:
+        """Apply the status and metrics written back by the monitor (bulk update mappings)."""
+        records = self._records
+        for mapping in mappings:
+            record = records.get(mapping["id"])
+            if record is not None:
+                for name, value in mapping.items():
+                    if name != "id":
+                        setattr(record, name, value)
+
+
+# Shared registry, loaded by the monitor and updated by app.db.crud
+device_registry = DeviceRegistry()
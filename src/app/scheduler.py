@@ -0,0 +1,147 @@
+import asyncio
+import heapq
+import random
+import time
+
+# Golden ratio conjugate, used to spread the first probes of the devices evenly
+_PHASE_STEP = 0.6180339887498949
+
+
+class ProbeScheduler:
+    """
+    Heap of devices keyed by the time their next probe is due.
+
+    Each device is probed every `interval` seconds (its own, or the default
+    one), randomly shifted by up to ±`jitter` of the interval. The first
+    probe of every device is placed at a deterministic phase of its
+    interval, so probes are spread evenly instead of being sent in bursts.
+    Times are taken from time.monotonic().
+    """
+
+    def __init__(self, default_interval: float, jitter: float = 0.1):
+        self.default_interval = default_interval
+        self.jitter = jitter
+        self._heap = []
+        self._devices = {}
+        self._due = {}
+        self._in_flight = set()
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __contains__(self, device_id):
+        return device_id in self._devices
+
+    def interval_for(self, device) -> float:
+        """Probe interval (in seconds) of a device."""
+        return device.check_interval or self.default_interval
+
+    def _push(self, device_id, due):
+        self._due[device_id] = due
+        heapq.heappush(self._heap, (due, device_id))
+
+    def add(self, device, now: float = None):
+        """Schedule a new device, or update the attributes of a scheduled one."""
+        now = time.monotonic() if now is None else now
+        device_id = device.id
+        previous = self._devices.get(device_id)
+        self._devices[device_id] = device
+        if previous is None:
+            phase = (device_id * _PHASE_STEP) % 1
+            self._push(device_id, now + phase * self.interval_for(device))
+        elif self.interval_for(previous) != self.interval_for(device):
+            # Apply a new interval right away instead of after the old one
+            self._push(device_id, min(self._due[device_id], now + self.interval_for(device)))
+
+    def set_default_interval(self, interval: float, now: float = None):
+        """Change the default interval, bringing forward the devices using it that are due later."""
+        now = time.monotonic() if now is None else now
+        self.default_interval = interval
+        for device_id, device in self._devices.items():
+            if not device.check_interval and self._due[device_id] > now + interval:
+                self._push(device_id, now + ((device_id * _PHASE_STEP) % 1) * interval)
+
+    def remove(self, device_id):
+        """Unschedule a device (its heap entries are discarded lazily)."""
+        self._devices.pop(device_id, None)
+        self._due.pop(device_id, None)
+
+    def sync(self, devices, now: float = None):
+        """Make the scheduled devices match `devices`, keeping the schedule of the known ones."""
+        now = time.monotonic() if now is None else now
+        current = {device.id for device in devices}
+        for device_id in [d for d in self._devices if d not in current]:
+            self.remove(device_id)
+        for device in devices:
+            self.add(device, now)
+
+    def reschedule(self, device_id, delay: float, now: float = None):
+        """Move the next probe of a device to `delay` seconds from now."""
+        now = time.monotonic() if now is None else now
+        if device_id in self._devices:
+            self._push(device_id, now + delay)
+
+    def pop_due(self, now: float = None):
+        """
+        Return the devices whose probe is due, and schedule their next one.
+
+        Devices whose previous probe is still running are skipped for this round.
+        """
+        now = time.monotonic() if now is None else now
+        due_devices = []
+        while self._heap and self._heap[0][0] <= now:
+            due, device_id = heapq.heappop(self._heap)
+            if self._due.get(device_id) != due:
+                continue  # Stale entry of a removed or rescheduled device
+            device = self._devices[device_id]
+            interval = self.interval_for(device)
+            next_due = due + interval * (1 + random.uniform(-self.jitter, self.jitter))
+            if next_due <= now:
+                # Fell behind (e.g. the process was suspended): don't probe in a burst to catch up
+                next_due = now + interval * random.random()
+            self._push(device_id, next_due)
+            if device_id in self._in_flight:
+                continue
+            self._in_flight.add(device_id)
+            due_devices.append(device)
+        return due_devices
+
+    def finished(self, device_id):
+        """Mark the probe of a device as completed."""
+        self._in_flight.discard(device_id)
+
+    def next_due(self):
+        """Monotonic time of the next due probe, or None if nothing is scheduled."""
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+
+class ProbeSlots:
+    """
+    Asyncio concurrency limiter for the probes, resizable while in use.
+
+    Shrinking it lets the running probes finish and only holds back new
+    ones until the number of active probes is below the new size.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.active = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.size)
+            self.active += 1
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    async def resize(self, size: int) -> None:
+        """Change the number of concurrent probes allowed."""
+        async with self._condition:
+            self.size = size
+            self._condition.notify_all()
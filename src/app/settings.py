@@ -0,0 +1,164 @@
+import time
+import logging
+import threading
+from app.db.database import SessionLocal
+from app.db import crud
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() == "true"
+
+
+# Setting definitions: key -> (type, default value, description)
+SETTING_DEFINITIONS = {
+    "ping_timeout": (int, 3, "Maximum time (in seconds) to wait for a ping response"),
+    "log_level": (str, "INFO", "Verbosity of system logs (DEBUG, INFO, WARN, ERROR)"),
+    "check_interval": (int, 30, "Default delay (in seconds) between two probes of a device"),
+    "retry_interval": (int, 1, "Waiting time (in seconds) between retry attempts"),
+    "max_retries": (int, 3, "Number of ping attempts before marking a device offline"),
+    "parallel_pings": (_parse_bool, True, "Enable parallel pinging of devices (True/False)"),
+    "ping_count": (int, 3, "Number of pings to send per device for metrics calculation"),
+    "cache_ttl": (int, 300, "Time to live (in seconds) for cached data"),
+}
+
+
+class SettingsSnapshot:
+    """
+    Immutable, typed view of the settings at a given version.
+
+    Settings are read as attributes (e.g. `settings.check_interval`); the
+    dictionary-style `get` is kept for settings stored in the database
+    without a definition.
+    """
+
+    __slots__ = tuple(SETTING_DEFINITIONS) + ("version", "_extra")
+
+    def __init__(self, version: int = 0, values: dict = None):
+        values = values or {}
+        for key, (_, default, _) in SETTING_DEFINITIONS.items():
+            object.__setattr__(self, key, values.get(key, default))
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "_extra", {k: v for k, v in values.items() if k not in SETTING_DEFINITIONS})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings snapshots are read-only")
+
+    def get(self, key: str, default=None):
+        if key in SETTING_DEFINITIONS:
+            return getattr(self, key)
+        return self._extra.get(key, default)
+
+    def as_dict(self) -> dict:
+        """Return the typed values of all settings."""
+        values = {key: getattr(self, key) for key in SETTING_DEFINITIONS}
+        values.update(self._extra)
+        return values
+
+    def replace(self, **changes) -> "SettingsSnapshot":
+        """Return a copy of the snapshot with some values overridden (same version)."""
+        return SettingsSnapshot(self.version, dict(self.as_dict(), **changes))
+
+
+def parse_settings(raw: dict) -> dict:
+    """Convert the string values stored in the database to their setting types."""
+    values = {}
+    for key, value in raw.items():
+        definition = SETTING_DEFINITIONS.get(key)
+        if definition is None:
+            values[key] = value
+            continue
+        convert, default, _ = definition
+        try:
+            values[key] = convert(value)
+        except (ValueError, TypeError):
+            logging.warning(f"Invalid value {value!r} for setting {key}, using {default!r}")
+            values[key] = default
+    return values
+
+
+class SettingsStore:
+    """
+    Single source of the application settings, shared by the API and the monitor.
+
+    The current SettingsSnapshot is replaced as a whole on every change, so
+    reading `store.current` needs no lock. Changes are written through to
+    the database before the new snapshot (with the next version number) is
+    swapped in; reloads pick up changes made by other processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = SettingsSnapshot()
+        self.loaded_at = 0
+
+    @property
+    def version(self) -> int:
+        return self.current.version
+
+    def _swap(self, values: dict) -> SettingsSnapshot:
+        """
+        Install new values (caller holds the lock), bumping the version if they changed.
+        Version 0 is the snapshot of the defaults, before the first load.
+        """
+        snapshot = SettingsSnapshot(self.current.version + 1, values)
+        if snapshot.as_dict() != self.current.as_dict() or not self.loaded_at:
+            self.current = snapshot
+        self.loaded_at = time.time()
+        return self.current
+
+    def load(self, db=None) -> SettingsSnapshot:
+        """
+        Reload the settings from the database, initializing the defaults on first run.
+
+        Returns:
+            The current snapshot (unchanged if the database is unreachable)
+        """
+        session = db or SessionLocal()
+        try:
+            with self._lock:
+                raw = crud.get_all_settings(session)
+                missing = {key: d for key, d in SETTING_DEFINITIONS.items() if key not in raw}
+                for key, (_, default, description) in missing.items():
+                    crud.upsert_setting(session, key, str(default), description)
+                    raw[key] = str(default)
+                return self._swap(parse_settings(raw))
+        except Exception as e:
+            logging.error(f"Error loading settings from database: {e}")
+            return self.current
+        finally:
+            if db is None:
+                session.close()
+
+    def publish(self, values: dict) -> SettingsSnapshot:
+        """Publish settings read from elsewhere than the database (e.g. by an agent, from its server)."""
+        with self._lock:
+            return self._swap(parse_settings(values))
+
+    def update(self, values: dict, db=None) -> SettingsSnapshot:
+        """
+        Write settings to the database and publish them.
+
+        Args:
+            values: Typed or string values of the settings to change
+            db: Database session, a new one is used if not given
+
+        Returns:
+            The new snapshot
+        """
+        session = db or SessionLocal()
+        try:
+            with self._lock:
+                for key, value in values.items():
+                    description = SETTING_DEFINITIONS[key][2] if key in SETTING_DEFINITIONS else ""
+                    crud.upsert_setting(session, key, str(value), description)
+                new_values = dict(self.current.as_dict(), **parse_settings({k: str(v) for k, v in values.items()}))
+                return self._swap(new_values)
+        finally:
+            if db is None:
+                session.close()
+
+
+# Shared settings store
+settings_store = SettingsStore()
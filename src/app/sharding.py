@@ -0,0 +1,304 @@
+import os
+import time
+import queue
+import bisect
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+from logging.handlers import QueueHandler
+from app.monitor import (
+    run_scheduler, write_results, clear_old_cache_entries, run_metrics_rollup, shutdown_event,
+    FLUSH_INTERVAL, SETTINGS_RELOAD_INTERVAL
+)
+from app.registry import DeviceRegistry, device_registry
+from app.settings import settings_store
+
+# Number of monitor worker processes (1 = monitor in the application process)
+MONITOR_WORKERS = int(os.getenv("NETWATCH_MONITOR_WORKERS", "1"))
+# Points of every worker on the hash ring
+RING_REPLICAS = 64
+# Delay (in seconds) before replacing a dead worker
+RESPAWN_DELAY = 5
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring assigning device IDs to workers.
+
+    Every worker is placed at `replicas` points of the ring, and a device
+    belongs to the worker of the first point following its hash. Adding or
+    removing a worker only moves the devices of that worker's segments.
+    """
+
+    def __init__(self, nodes=(), replicas: int = RING_REPLICAS):
+        self.replicas = replicas
+        self._points = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(set(self._nodes.values()))
+
+    def add(self, node) -> None:
+        for i in range(self.replicas):
+            point = _hash(f"{node}:{i}")
+            self._nodes[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node) -> None:
+        for i in range(self.replicas):
+            point = _hash(f"{node}:{i}")
+            if self._nodes.pop(point, None) is not None:
+                self._points.remove(point)
+
+    def node_for(self, device_id):
+        """Worker owning a device, or None if the ring is empty."""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(str(device_id))) % len(self._points)
+        return self._nodes[self._points[index]]
+
+
+# ---------------------------------------------------------------------------
+# Worker process
+# ---------------------------------------------------------------------------
+def _read_commands(worker_id, inbox, shard: DeviceRegistry):
+    """Apply the coordinator's commands to the shard of the worker, until stopped."""
+    parent = multiprocessing.parent_process()
+    while not shutdown_event.is_set():
+        try:
+            command, payload = inbox.get(timeout=1)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                logging.warning(f"Monitor worker {worker_id}: coordinator is gone, stopping")
+                shutdown_event.set()
+            continue
+        if command == "upsert":
+            shard.upsert_records(payload)
+        elif command == "remove":
+            for device_id in payload:
+                shard.remove(device_id)
+        elif command == "reload":
+            settings_store.load()
+        elif command == "stop":
+            shutdown_event.set()
+
+
+def run_worker(worker_id, inbox, outbox, log_level):
+    """
+    Entry point of a monitor worker process.
+
+    Probes the devices of its shard with the regular scheduler and sends
+    the result batches to the coordinator, which writes them back. Log
+    records are forwarded to the coordinator too.
+    """
+    root = logging.getLogger()
+    root.handlers[:] = [QueueHandler(outbox)]
+    root.setLevel(log_level)
+
+    shard = DeviceRegistry()
+    shard.loaded = True
+    threading.Thread(target=_read_commands, args=(worker_id, inbox, shard), daemon=True).start()
+
+    def send_results(results, settings):
+        outbox.put(("results", results))
+
+    logging.info(f"Monitor worker {worker_id} started (pid {os.getpid()})")
+    outbox.put(("ready", worker_id))
+    while not shutdown_event.is_set():
+        try:
+            asyncio.run(run_scheduler(shard, send_results))
+        except Exception as e:
+            logging.error(f"Error in monitor worker {worker_id}: {e}")
+            shutdown_event.wait(5)
+
+
+# ---------------------------------------------------------------------------
+# Coordinator
+# ---------------------------------------------------------------------------
+class ShardCoordinator:
+    """
+    Spread the monitored devices over worker processes.
+
+    Devices are assigned to the workers with a HashRing on Device.id and
+    followed through the device registry notifications. The workers send
+    their probe results back; the coordinator merges them and writes them
+    back (device status, alerts and metrics) every FLUSH_INTERVAL, so the
+    database is written by this process only. The shard of a dead worker
+    is reassigned to the others right away, and moves back to its
+    replacement once that one reports ready, so a worker failing at
+    startup doesn't take devices with it again.
+
+    A device moved to another worker loses its probe schedule and health
+    history (HealthTracker hysteresis and flapping state): the new owner
+    probes it right away and confirms its status from scratch, so a dead
+    worker costs its devices two such resets.
+    """
+
+    def __init__(self, workers: int = MONITOR_WORKERS):
+        self.size = workers
+        self._context = multiprocessing.get_context("spawn")
+        self._outbox = self._context.Queue()
+        self._workers = {}
+        self._dead = {}
+        self._starting = set()
+        self._ring = HashRing()
+        self._owners = {}
+        self._lock = threading.RLock()
+
+    def _start_worker(self, worker_id, join: bool = True) -> None:
+        """Start a worker process, adding it to the ring now or (join=False) once it reports ready."""
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=run_worker, args=(worker_id, inbox, self._outbox, logging.getLogger().level),
+            name=f"netwatch-monitor-{worker_id}", daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = (process, inbox)
+        if join:
+            self._ring.add(worker_id)
+        else:
+            self._starting.add(worker_id)
+
+    def _on_ready(self, worker_id) -> None:
+        """Add a replacement worker to the ring once it is running, moving its devices back."""
+        with self._lock:
+            if worker_id not in self._starting or worker_id not in self._workers:
+                return
+            self._starting.discard(worker_id)
+            self._ring.add(worker_id)
+            self._rebalance()
+
+    def _send(self, worker_id, command, payload=None) -> None:
+        worker = self._workers.get(worker_id)
+        if worker is not None:
+            worker[1].put((command, payload))
+
+    def _rebalance(self) -> None:
+        """Send every device to its owner on the ring, removing it from its previous one."""
+        with self._lock:
+            moves = {}
+            removals = {}
+            for record in device_registry.records():
+                owner = self._ring.node_for(record.id)
+                previous = self._owners.get(record.id)
+                if owner == previous:
+                    continue
+                if previous is not None:
+                    removals.setdefault(previous, []).append(record.id)
+                moves.setdefault(owner, []).append(record)
+                self._owners[record.id] = owner
+            for worker_id, device_ids in removals.items():
+                self._send(worker_id, "remove", device_ids)
+            for worker_id, records in moves.items():
+                self._send(worker_id, "upsert", records)
+        if moves:
+            logging.info(f"Assigned {sum(map(len, moves.values()))} devices to {len(moves)} monitor workers")
+
+    def on_device_change(self, device_id, record) -> None:
+        """Forward an inventory change to the worker owning the device."""
+        with self._lock:
+            if record is None:
+                self._send(self._owners.pop(device_id, None), "remove", [device_id])
+            else:
+                owner = self._owners[device_id] = self._ring.node_for(device_id)
+                self._send(owner, "upsert", [record])
+
+    def _check_workers(self, now: float) -> None:
+        """Reassign the shards of the dead workers, and replace them after RESPAWN_DELAY."""
+        for worker_id, (process, _) in list(self._workers.items()):
+            if not process.is_alive():
+                logging.error(f"Monitor worker {worker_id} died (exit code {process.exitcode}), reassigning its devices")
+                with self._lock:
+                    del self._workers[worker_id]
+                    self._starting.discard(worker_id)
+                    self._ring.remove(worker_id)
+                    self._rebalance()
+                self._dead[worker_id] = now + RESPAWN_DELAY
+        for worker_id, due in list(self._dead.items()):
+            if now >= due:
+                del self._dead[worker_id]
+                with self._lock:
+                    self._start_worker(worker_id, join=False)
+
+    def _receive(self, timeout: float):
+        """Collect the result batches (and log records) sent by the workers for up to `timeout` seconds."""
+        results = []
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                message = self._outbox.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return results
+            if isinstance(message, logging.LogRecord):
+                logging.getLogger(message.name).handle(message)
+            elif message[0] == "ready":
+                self._on_ready(message[1])
+            else:
+                results.extend(message[1])
+
+    def run(self) -> None:
+        """Run the workers and write back their results, until shutdown."""
+        settings = settings_store.load()
+        device_registry.load()
+        for worker_id in range(self.size):
+            self._start_worker(worker_id)
+        device_registry.subscribe(self.on_device_change)
+        self._rebalance()
+        next_reload = 0
+        try:
+            while not shutdown_event.is_set():
+                now = time.monotonic()
+                if now >= next_reload:
+                    settings_store.load()
+                    clear_old_cache_entries()
+                    next_reload = now + SETTINGS_RELOAD_INTERVAL
+                if settings_store.current.version != settings.version:
+                    settings = settings_store.current
+                    for worker_id in self._workers:
+                        self._send(worker_id, "reload")
+                    logging.info(f"Monitoring settings updated (version {settings.version})")
+                self._check_workers(now)
+
+                results = self._receive(FLUSH_INTERVAL)
+                if results:
+                    write_results(results, settings)
+        finally:
+            device_registry.unsubscribe(self.on_device_change)
+            self.stop(settings)
+
+    def stop(self, settings, timeout: float = 5) -> None:
+        """Stop the workers, writing back their last results."""
+        for worker_id in self._workers:
+            self._send(worker_id, "stop")
+        # Keep reading the results while the workers exit: a process can't exit with unsent queue data
+        results = []
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and any(process.is_alive() for process, _ in self._workers.values()):
+            results.extend(self._receive(0.1))
+        results.extend(self._receive(0.1))
+        for process, _ in self._workers.values():
+            if process.is_alive():
+                process.terminate()
+        if results:
+            write_results(results, settings)
+
+
+def start_sharded_monitor(workers: int = MONITOR_WORKERS):
+    """Start the device monitoring over `workers` processes (see start_monitor)."""
+    logging.info(f"Starting device monitoring with {workers} worker processes...")
+    threading.Thread(target=run_metrics_rollup, daemon=True).start()
+
+    while not shutdown_event.is_set():
+        try:
+            ShardCoordinator(workers).run()
+        except Exception as e:
+            logging.error(f"Error in monitor coordinator: {e}")
+            shutdown_event.wait(5)
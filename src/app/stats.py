@@ -0,0 +1,174 @@
+import os
+import logging
+import threading
+import numpy as np
+
+# Devices whose statistics are kept (rows of the ring buffers, allocated up front)
+STATS_MAX_DEVICES = int(os.getenv("NETWATCH_STATS_MAX_DEVICES", "65536"))
+# Probe results kept per device (columns of the ring buffers)
+STATS_WINDOW = 32
+# Gain of the RFC 3550 interarrival jitter estimate
+JITTER_GAIN = 1 / 16
+# Weight of the last RTT in the moving average (as in TCP's smoothed RTT)
+EWMA_ALPHA = 0.125
+
+
+class FleetStats:
+    """
+    Rolling probe statistics of the whole fleet, in preallocated NumPy arrays.
+
+    Every device owns a row of the (devices × window) ring buffers of its
+    RTT and packet loss, so the memory used is fixed: about capacity ×
+    (8 × window + 28) bytes (18 MiB by default), allocated in full with
+    the first batch (processes that only probe never use it). A batch of
+    probe results is folded in with one vectorized pass, which computes
+    for every device of the batch:
+      - jitter: RFC 3550 interarrival jitter of the RTT (ms)
+      - ewma_rtt: exponentially weighted moving average of the RTT (ms)
+      - rolling_loss: mean packet loss over the window (%)
+      - loss_slope: least-squares slope of the packet loss over the window
+        (% per probe), positive when the loss is increasing
+      - samples: number of results in the window
+    """
+
+    def __init__(self, capacity: int = STATS_MAX_DEVICES, window: int = STATS_WINDOW):
+        self.capacity = capacity
+        self.window = window
+        self.rtt = self.loss = None
+        self._rows = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._full_logged = False
+
+    def _allocate(self) -> None:
+        capacity = self.capacity
+        self.rtt = np.full((capacity, self.window), np.nan, dtype=np.float32)
+        self.loss = np.full((capacity, self.window), np.nan, dtype=np.float32)
+        self.head = np.zeros(capacity, dtype=np.int32)  # Column of the next result
+        self.last_rtt = np.full(capacity, np.nan)
+        self.jitter = np.full(capacity, np.nan)
+        self.ewma_rtt = np.full(capacity, np.nan)
+
+    def _row(self, device_id) -> int:
+        """Row of a device, allocated on first use (-1 when untracked or the buffers are full)."""
+        row = self._rows.get(device_id)
+        if row is None:
+            if device_id is None:
+                return -1
+            if not self._free:
+                if not self._full_logged:
+                    logging.warning(f"Statistics buffers full ({self.capacity} devices), new devices are not tracked")
+                    self._full_logged = True
+                return -1
+            row = self._rows[device_id] = self._free.pop()
+        return row
+
+    def forget(self, device_id) -> None:
+        """Release the row of a removed device."""
+        with self._lock:
+            row = self._rows.pop(device_id, None)
+            if row is not None:
+                self.rtt[row] = self.loss[row] = np.nan
+                self.head[row] = 0
+                self.last_rtt[row] = self.jitter[row] = self.ewma_rtt[row] = np.nan
+                self._free.append(row)
+
+    def _fold(self, rows, rtt, loss, jitter):
+        """Append one result to each of the (distinct) rows and update the running estimates."""
+        columns = self.head[rows]
+        self.rtt[rows, columns] = rtt
+        self.loss[rows, columns] = loss
+        self.head[rows] = (columns + 1) % self.window
+
+        valid = ~np.isnan(rtt)
+        first = valid & np.isnan(self.ewma_rtt[rows])
+        # Seeded with the jitter measured by the first probe
+        self.jitter[rows[first]] = np.nan_to_num(jitter[first])
+        self.ewma_rtt[rows[first]] = rtt[first]
+        # J += (|D| - J) / 16, D being the difference between two successive RTTs
+        next_rows = rows[valid & ~first]
+        next_rtt = rtt[valid & ~first]
+        self.jitter[next_rows] += (np.abs(next_rtt - self.last_rtt[next_rows]) - self.jitter[next_rows]) * JITTER_GAIN
+        self.ewma_rtt[next_rows] += (next_rtt - self.ewma_rtt[next_rows]) * EWMA_ALPHA
+        self.last_rtt[rows[valid]] = rtt[valid]
+
+    def _window_stats(self, rows) -> dict:
+        """Rolling loss and loss trend of the given rows."""
+        loss = self.loss[rows].astype(np.float64)
+        mask = ~np.isnan(loss)
+        samples = mask.sum(axis=1)
+        # Age of every column: 0 for the oldest result, window - 1 for the newest
+        ages = (np.arange(self.window)[None, :] - self.head[rows][:, None]) % self.window
+        loss = np.where(mask, loss, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rolling_loss = loss.sum(axis=1) / samples
+            mean_age = np.where(mask, ages, 0).sum(axis=1) / samples
+            age_deltas = np.where(mask, ages - mean_age[:, None], 0)
+            loss_slope = (age_deltas * (loss - rolling_loss[:, None])).sum(axis=1) / (age_deltas ** 2).sum(axis=1)
+        return {"rolling_loss": rolling_loss, "loss_slope": loss_slope, "samples": samples}
+
+    def update(self, device_ids, rtts, losses, jitters) -> dict:
+        """
+        Fold a batch of probe results in, and return the statistics of their devices.
+
+        Args:
+            device_ids: Device of every result (None to skip a result)
+            rtts: Average RTT (ms) of every result, None when unreachable
+            losses: Packet loss (%) of every result
+            jitters: Jitter (ms) measured by every result, used as the initial estimate
+
+        Returns:
+            Dictionary of arrays aligned with the results (see the class
+            docstring), NaN (or 0 samples) for the untracked devices
+        """
+        count = len(device_ids)
+        stats = {
+            "jitter": np.full(count, np.nan), "ewma_rtt": np.full(count, np.nan),
+            "rolling_loss": np.full(count, np.nan), "loss_slope": np.full(count, np.nan),
+            "samples": np.zeros(count, dtype=np.int64)
+        }
+        if not count:
+            return stats
+        rtt = np.array(rtts, dtype=np.float64)
+        loss = np.array(losses, dtype=np.float64)
+        jitter = np.array(jitters, dtype=np.float64)
+        with self._lock:
+            if self.rtt is None:
+                self._allocate()
+            # Several results of a device are folded in successive passes, in order
+            rows = np.empty(count, dtype=np.int64)
+            ranks = np.empty(count, dtype=np.int64)
+            seen = {}
+            for i, device_id in enumerate(device_ids):
+                rows[i] = row = self._row(device_id)
+                ranks[i] = seen[row] = seen.get(row, -1) + 1
+            tracked = rows >= 0
+            for rank in range(int(ranks[tracked].max(initial=-1)) + 1):
+                selected = np.flatnonzero(tracked & (ranks == rank))
+                self._fold(rows[selected], rtt[selected], loss[selected], jitter[selected])
+
+            tracked_rows = rows[tracked]
+            stats["jitter"][tracked] = self.jitter[tracked_rows]
+            stats["ewma_rtt"][tracked] = self.ewma_rtt[tracked_rows]
+            for name, values in self._window_stats(tracked_rows).items():
+                stats[name][tracked] = values
+        return stats
+
+    def snapshot(self, device_id):
+        """Current statistics of a device, or None if it is not tracked."""
+        with self._lock:
+            row = self._rows.get(device_id)
+            if row is None:
+                return None
+            window = self._window_stats(np.array([row]))
+            values = {
+                "jitter": self.jitter[row], "ewma_rtt": self.ewma_rtt[row],
+                "rolling_loss": window["rolling_loss"][0], "loss_slope": window["loss_slope"][0]
+            }
+            result = {name: None if np.isnan(value) else round(float(value), 3) for name, value in values.items()}
+            result["samples"] = int(window["samples"][0])
+            return result
+
+
+# Shared statistics of the fleet, updated by the monitor with every batch of results
+fleet_stats = FleetStats()
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Any, List, Optional, Tuple
+
+# Seconds without data after which SSE streams send a keep-alive comment
+KEEPALIVE_INTERVAL = 15
+# SSE comment line, ignored by EventSource clients
+KEEPALIVE_MESSAGE = ": keepalive\n\n"
+
+
+def format_event(text: str) -> str:
+    """
+    SSE message carrying `text`, with one data field per line.
+
+    EventSource joins the data fields of a message with newlines, so
+    multi-line text (e.g. tracebacks) reaches the client unchanged.
+    """
+    return "".join(f"data: {line}\n" for line in text.splitlines() or [""]) + "\n"
+
+
+class Broadcaster:
+    """
+    Fan out messages from a single producer to many SSE subscribers.
+
+    Every subscriber gets its own bounded asyncio queue. When a slow
+    subscriber's queue is full its oldest message is dropped, so one
+    stalled browser never blocks the producer or the other clients.
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self.latest: Optional[Any] = None
+        self._subscribers = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, replay_latest: bool = True) -> asyncio.Queue:
+        """Register a new subscriber, optionally primed with the latest message."""
+        queue = asyncio.Queue(self.maxsize)
+        if replay_latest and self.latest is not None:
+            queue.put_nowait(self.latest)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, message: Any) -> None:
+        """Push a message to every subscriber without blocking."""
+        self.latest = message
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+
+class EventHub:
+    """
+    Thread-safe pub/sub hub bridging producers in any thread to SSE subscribers.
+
+    Every published event gets a sequence number and is kept in a bounded
+    replay buffer, so that a reconnecting client can resume from the last
+    sequence number it received (the SSE Last-Event-ID). Delivery to the
+    subscribers happens on the event loop the hub is attached to, and is
+    skipped while there are none (they replay the buffer when subscribing).
+    """
+
+    def __init__(self, history: int = 1000, maxsize: int = 100):
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._history = deque(maxlen=history)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._broadcaster = Broadcaster(maxsize)
+
+    @property
+    def sequence(self) -> int:
+        """Sequence number of the last published event."""
+        return self._sequence
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Deliver events to subscribers on the given event loop."""
+        self._loop = loop
+
+    def publish(self, data: Any) -> int:
+        """
+        Publish an event from any thread.
+
+        Returns:
+            The sequence number assigned to the event
+        """
+        with self._lock:
+            self._sequence += 1
+            event = (self._sequence, data)
+            self._history.append(event)
+            loop = self._loop
+        if loop is not None and self._broadcaster.subscriber_count:
+            try:
+                loop.call_soon_threadsafe(self._broadcaster.publish, event)
+            except RuntimeError:
+                # The loop has been closed (application shutting down)
+                pass
+        return event[0]
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Tuple[asyncio.Queue, List[Tuple[int, Any]]]:
+        """
+        Subscribe to the events published from now on.
+
+        Args:
+            last_event_id: Sequence number of the last event the client received
+
+        Returns:
+            Tuple of (queue of (sequence, data) events, missed events to replay first).
+            The queue may also contain replayed events; skip those already sent.
+        """
+        queue = self._broadcaster.subscribe(replay_latest=False)
+        with self._lock:
+            missed = [event for event in self._history if last_event_id is not None and event[0] > last_event_id]
+        return queue, missed
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._broadcaster.unsubscribe(queue)
+
+    def snapshot(self) -> List[Tuple[int, Any]]:
+        """Return a copy of the events in the replay buffer, oldest first."""
+        with self._lock:
+            return list(self._history)
+
+
+async def next_message(queue: asyncio.Queue, timeout: float = KEEPALIVE_INTERVAL):
+    """Wait for the next message of a subscription, or return None after `timeout` seconds."""
+    try:
+        return await asyncio.wait_for(queue.get(), timeout)
+    except asyncio.TimeoutError:
+        return None
@@ -7,29 +7,48 @@ document.addEventListener("DOMContentLoaded", function () {
     // State variables
     let cancelEditButton = null;
     let editingDeviceId = null;
-    let devicesList = [];
+    let devicesList = [];       // Devices of the current page
+    let typeCounts = {};        // Number of devices of each type
+    let totalDevices = 0;
     let currentPage = 1;
+    let pageCursors = [null];   // Cursor of each page, filled in while paging forward
     const itemsPerPage = 10;
     
     // Sorting state
     let currentSortColumn = null;
     let currentSortDirection = 1; // 1: ascending, -1: descending
 
-    // Fetch devices from the API
-    async function fetchDevices() {
+    /**
+     * Fetch a page of devices from the API, sorted and paginated server-side
+     * @param {boolean} reset - Go back to the first page (on refresh or sort change)
+     */
+    async function fetchDevices(reset = true) {
+        if (reset) {
+            currentPage = 1;
+            pageCursors = [null];
+        }
+        const params = new URLSearchParams({ limit: itemsPerPage });
+        const cursor = pageCursors[currentPage - 1];
+        if (cursor) params.set("cursor", cursor);
+        if (currentSortColumn) {
+            params.set("sort", currentSortColumn);
+            params.set("order", currentSortDirection === 1 ? "asc" : "desc");
+        }
+        
         try {
-            const response = await fetch("/api/devices");
+            const response = await fetch(`/api/devices?${params}`);
             if (!response.ok) {
                 throw new Error(`HTTP error: ${response.status}`);
             }
             
             const data = await response.json();
             devicesList = data.devices;
-            currentPage = 1; // Reset pagination when data is refreshed
+            typeCounts = data.type_counts;
+            totalDevices = data.total;
+            pageCursors[currentPage] = data.next_cursor;
             
             updateSummaryWidget();
             renderDevicesTable();
-            setupSorting();
         } catch (error) {
             console.error("Error fetching devices:", error);
             showErrorNotification("Failed to load devices. Please try again.");
@@ -43,14 +62,14 @@ document.addEventListener("DOMContentLoaded", function () {
         if (!totalNumberEl || !categoriesContainer) return;
 
         // Update the total device count
-        totalNumberEl.textContent = devicesList.length;
+        totalNumberEl.textContent = totalDevices;
 
-        // Aggregate counts by device type
-        const summary = devicesList.reduce((acc, device) => {
-            const type = device.type || "Other";
-            acc[type] = (acc[type] || 0) + 1;
-            return acc;
-        }, {});
+        // Counts by device type, computed server-side
+        const summary = {};
+        Object.entries(typeCounts).forEach(([type, count]) => {
+            const category = type || "Other";
+            summary[category] = (summary[category] || 0) + count;
+        });
 
         // Clear previous category cards
         categoriesContainer.innerHTML = "";
@@ -105,31 +124,10 @@ document.addEventListener("DOMContentLoaded", function () {
         });
     }
 
-    // Render the devices table with pagination and sorting applied
+    // Render the current page of devices (already sorted by the server)
     function renderDevicesTable() {
-        // Apply sorting if active
-        let sortedDevices = [...devicesList];
-        if (currentSortColumn) {
-            sortedDevices.sort((a, b) => {
-                let valA = a[currentSortColumn] || "";
-                let valB = b[currentSortColumn] || "";
-                // For custom alerts, join arrays if necessary
-                if (Array.isArray(valA)) valA = valA.join(", ");
-                if (Array.isArray(valB)) valB = valB.join(", ");
-                if (typeof valA === "string") valA = valA.toLowerCase();
-                if (typeof valB === "string") valB = valB.toLowerCase();
-                if (valA < valB) return -1 * currentSortDirection;
-                if (valA > valB) return 1 * currentSortDirection;
-                return 0;
-            });
-        }
-
-        // Apply pagination logic
-        const startIndex = (currentPage - 1) * itemsPerPage;
-        const paginatedDevices = sortedDevices.slice(startIndex, startIndex + itemsPerPage);
-
         devicesTableBody.innerHTML = "";
-        paginatedDevices.forEach(device => {
+        devicesList.forEach(device => {
             // Format display values with fallbacks for empty fields
             const customAlertsDisplay = formatCustomAlerts(device.custom_alerts);
             const ownerDisplay = device.owner || createPlaceholder();
@@ -157,7 +155,7 @@ document.addEventListener("DOMContentLoaded", function () {
         });
 
         setupActionButtons();
-        renderPagination(sortedDevices.length);
+        renderPagination(totalDevices);
     }
 
     /**
@@ -374,7 +372,7 @@ document.addEventListener("DOMContentLoaded", function () {
                     icon.className = currentSortDirection === 1 ? "bx bx-sort-up" : "bx bx-sort-down";
                 }
                 
-                renderDevicesTable();
+                fetchDevices();
             });
         });
     }
@@ -386,7 +384,7 @@ document.addEventListener("DOMContentLoaded", function () {
     function renderPagination(totalItems) {
         if (!paginationContainer) return;
         
-        const totalPages = Math.ceil(totalItems / itemsPerPage);
+        const totalPages = Math.max(Math.ceil(totalItems / itemsPerPage), 1);
         paginationContainer.innerHTML = "";
 
         // Previous button
@@ -396,7 +394,7 @@ document.addEventListener("DOMContentLoaded", function () {
         prevButton.addEventListener("click", function () {
             if (currentPage > 1) {
                 currentPage--;
-                renderDevicesTable();
+                fetchDevices(false);
             }
         });
         paginationContainer.appendChild(prevButton);
@@ -409,16 +407,17 @@ document.addEventListener("DOMContentLoaded", function () {
         // Next button
         const nextButton = document.createElement("button");
         nextButton.textContent = "Next";
-        nextButton.disabled = currentPage === totalPages;
+        nextButton.disabled = !pageCursors[currentPage];
         nextButton.addEventListener("click", function () {
-            if (currentPage < totalPages) {
+            if (pageCursors[currentPage]) {
                 currentPage++;
-                renderDevicesTable();
+                fetchDevices(false);
             }
         });
         paginationContainer.appendChild(nextButton);
     }
 
     // Initialize the module
+    setupSorting();
     fetchDevices();
 });
\ No newline at end of file
@@ -10,7 +10,8 @@ function initLogStream() {
         autoScroll = atBottom;
     });
 
-    const evtSource = new EventSource("/stream");
+    // Filters in the page URL (e.g. /logs?device_id=3&level=warning) are applied server-side
+    const evtSource = new EventSource("/stream" + window.location.search);
 
     evtSource.onmessage = function (event) {
         if (event.data) {
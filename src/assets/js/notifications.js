@@ -20,6 +20,8 @@ document.addEventListener("DOMContentLoaded", function() {
 
     // Configura Server-Sent Events per gli alert in tempo reale
     let alertsEventSource = null;
+    // Ultimo evento ricevuto, per recuperare gli alert persi alla riconnessione
+    let lastAlertEventId = null;
     
     function setupSSE() {
         // Chiudi la connessione esistente se presente
@@ -28,7 +30,10 @@ document.addEventListener("DOMContentLoaded", function() {
         }
         
         // Crea una nuova connessione SSE
-        alertsEventSource = new EventSource('/stream/alerts');
+        const streamUrl = lastAlertEventId !== null
+            ? `/stream/alerts?last_event_id=${encodeURIComponent(lastAlertEventId)}`
+            : '/stream/alerts';
+        alertsEventSource = new EventSource(streamUrl);
         
         alertsEventSource.onopen = function() {
             console.log("Connessione SSE stabilita");
@@ -41,6 +46,9 @@ document.addEventListener("DOMContentLoaded", function() {
         };
         
         alertsEventSource.onmessage = function(event) {
+            if (event.lastEventId) {
+                lastAlertEventId = event.lastEventId;
+            }
             try {
                 const newAlerts = JSON.parse(event.data);
                 if (newAlerts && newAlerts.length > 0) {
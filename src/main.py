@@ -1,26 +1,44 @@
 import os
 import sys
 import json
+import gzip
+import hmac
+import math
+import zlib
+import base64
+import queue
+import shutil
 import logging
+import logging.handlers
 import threading
 import asyncio
 import time
 from contextlib import asynccontextmanager
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Literal
 from datetime import datetime, timedelta
 
 # Third-party imports
-from fastapi import FastAPI, Request, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Request, Depends, HTTPException, BackgroundTasks, Query, Header
 from fastapi.responses import StreamingResponse, HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
 from sqlalchemy.orm import Session
 
 # Local application imports
 sys.path.append(os.getenv("PYTHONPATH", "src"))
-from app.monitor import start_monitor, stop_monitor, load_settings, get_latest_alerts
-from app.db.database import SessionLocal, engine, Base
+from app.monitor import start_monitor, stop_monitor, get_latest_alerts, alert_hub, write_results
+from app.sharding import start_sharded_monitor, MONITOR_WORKERS
+from app.settings import settings_store
+from app.metrics import metrics_store
+from app.probe import check_probe_target
+from app.stats import fleet_stats
+from app.baseline import device_baselines
+from app.streaming import Broadcaster, next_message, format_event, KEEPALIVE_MESSAGE
+from app.logtail import LogTailer
+from app.logbuffer import log_buffer, LogFilter
+from app.bulk import parse_device_stream, format_csv_rows, BULK_BATCH_SIZE, EXPORT_COLUMNS, MAX_REPORTED_ERRORS
+from app.db.database import SessionLocal, engine, migrate_schema
 from app.db import models, crud
 
 
@@ -29,6 +47,13 @@ from app.db import models, crud
 # ---------------------------------------------------------------------------
 LOG_DIR = "logs"
 LOG_FILE = os.path.join(LOG_DIR, "netwatch.log")
+
+# Log rotation: by size (LOG_MAX_BYTES) unless a time interval is set in
+# NETWATCH_LOG_ROTATE_WHEN (e.g. "midnight", "H"), see TimedRotatingFileHandler
+LOG_MAX_BYTES = int(os.getenv("NETWATCH_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("NETWATCH_LOG_ROTATE_WHEN", "")
+LOG_BACKUP_COUNT = int(os.getenv("NETWATCH_LOG_BACKUP_COUNT", "5"))
+LOG_COMPRESS = os.getenv("NETWATCH_LOG_COMPRESS", "True").lower() == "true"
 TEMPLATES_DIR = os.path.join("src", "app", "templates")
 
 # Initialize Jinja2 templates for HTML rendering
@@ -37,14 +62,30 @@ templates = Jinja2Templates(directory=TEMPLATES_DIR)
 # Global event used to signal shutdown for background tasks
 shutdown_event = threading.Event()
 
+# Interval (in seconds) between two device status count refreshes
+DEVICE_STATUS_INTERVAL = 5
+
+# Shared producer of device status counts, fanned out to every SSE client
+device_status_broadcaster = Broadcaster(maxsize=10)
+
+# Number of past log lines sent to a client when it connects to /stream
+LOG_REPLAY_LINES = 1000
+
+# Shared reader of the log file, fanned out to every /stream client
+log_tailer = LogTailer(LOG_FILE)
+
+# Background thread writing the queued log records
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+# Shared secret of the remote agents (X-Agent-Token header), no check if empty
+AGENT_TOKEN = os.getenv("NETWATCH_AGENT_TOKEN", "")
+AGENT_TOKEN_WARNING = "NETWATCH_AGENT_TOKEN is not set: anyone can send probe results for the agents' devices"
+_agent_token_warned = False
+# Maximum size of a decompressed batch of agent results
+MAX_AGENT_BATCH_BYTES = 64 * 1024 * 1024
+
 # Cache for expensive operations
 _cache = {
-    'log_lines': [],
-    'log_last_modified': 0,
-    'device_status': {
-        'data': {'online': 0, 'offline': 0, 'unknown': 0},
-        'last_updated': 0
-    },
     'connected_clients': set()
 }
 
@@ -52,35 +93,91 @@ _cache = {
 # ---------------------------------------------------------------------------
 # Helper Functions and Dependencies
 # ---------------------------------------------------------------------------
+def _gzip_namer(name: str) -> str:
+    """Name rotated log files with a .gz suffix."""
+    return name + ".gz"
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    """Compress a rotated log file and remove the original."""
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def create_log_file_handler() -> logging.Handler:
+    """
+    Create the rotating handler writing LOG_FILE.
+    Rotates by time when LOG_ROTATE_WHEN is set, by size otherwise,
+    and optionally gzips the rotated files.
+    """
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    if LOG_COMPRESS:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    return handler
+
 def setup_logger() -> None:
     """
     Configure the logging system for the application.
     Loads settings from the database, ensures the logs directory exists,
-    clears the previous log file, and sets up logging handlers.
+    rotates the previous log file, and sets up logging handlers.
+    Log calls only enqueue records; a listener thread formats them and
+    writes them to the rotating file and the structured log buffer.
     """
-    settings = load_settings()
-    log_level = settings.get("log_level", "INFO").upper()
+    global _log_listener
+    settings = settings_store.load()
+    log_level = settings.log_level.upper()
 
     # Create logs directory if it does not exist
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
 
-    # Clear the log file on startup
-    with open(LOG_FILE, "w", encoding="utf-8") as log_file:
-        log_file.truncate(0)
+    file_handler = create_log_file_handler()
+    # Start every run with a fresh log file, keeping the previous one as a backup
+    if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > 0:
+        file_handler.doRollover()
+
+    formatter = logging.Formatter('[%(asctime)s] > %(message)s')
+    file_handler.setFormatter(formatter)
+    log_buffer.setFormatter(formatter)  # Structured records for server-side filtering
+
+    # Move formatting and disk writes off the calling threads
+    if _log_listener is not None:
+        _log_listener.stop()
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    _log_listener = logging.handlers.QueueListener(
+        log_queue, file_handler, log_buffer, respect_handler_level=True
+    )
+    _log_listener.start()
 
-    # Configure logging to file and console
+    # Configure logging through the queue
     logging.basicConfig(
         level=getattr(logging, log_level, logging.INFO),
-        format='[%(asctime)s] > %(message)s',
-        encoding="utf-8",
         handlers=[
-            logging.FileHandler(LOG_FILE),
+            queue_handler,
             #   logging.StreamHandler()
-        ]
+        ],
+        force=True
     )
     logging.info("Logger initialized with level %s", log_level)
 
+def stop_logger() -> None:
+    """
+    Flush the queued log records and stop the listener thread.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
 def get_db():
     """
     Dependency generator for creating and closing a database session.
@@ -91,6 +188,32 @@ def get_db():
     finally:
         db.close()
 
+def check_agent_token(x_agent_token: Optional[str] = Header(None)) -> None:
+    """
+    Dependency rejecting agent requests without the shared AGENT_TOKEN (when set).
+    Without a token, the first agent request logs a warning.
+    """
+    global _agent_token_warned
+    if not AGENT_TOKEN:
+        if not _agent_token_warned:
+            _agent_token_warned = True
+            logging.warning(AGENT_TOKEN_WARNING)
+        return
+    if not hmac.compare_digest(x_agent_token or "", AGENT_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid agent token")
+
+def warn_open_agent_endpoint() -> None:
+    """Log the missing agent token warning at startup, if devices are assigned to agents."""
+    global _agent_token_warned
+    db = SessionLocal()
+    try:
+        used = db.query(models.Device.id).filter(models.Device.agent.isnot(None)).first() is not None
+    finally:
+        db.close()
+    if used:
+        _agent_token_warned = True
+        logging.warning(AGENT_TOKEN_WARNING)
+
 def serialize_device(device: models.Device) -> dict:
     """
     Serialize a device instance into a dictionary.
@@ -106,113 +229,228 @@ def serialize_device(device: models.Device) -> dict:
         "packet_loss": device.packet_loss,
         "jitter": device.jitter,
         "uptime": device.uptime,
-        "custom_alerts": device.custom_alerts
+        "custom_alerts": device.custom_alerts,
+        "check_interval": device.check_interval,
+        "probe_type": device.probe_type or "icmp",
+        "probe_target": device.probe_target,
+        "agent": device.agent
     }
 
-def cache_log_content(force_refresh=False):
-    """Cache log content to reduce file reads."""
-    global _cache
-    
-    # Check if file has been modified since last read
+def serialize_alert(alert: models.Alert, include_resolution: bool = False) -> dict:
+    """
+    Serialize an alert instance, with the name of its device, into a dictionary.
+    The device must be loaded along with the alert to avoid a query per alert.
+    """
+    result = {
+        "id": alert.id,
+        "device_id": alert.device_id,
+        "device_name": alert.device.name if alert.device else "Unknown Device",
+        "timestamp": alert.timestamp.isoformat() if alert.timestamp else None,
+        "severity": alert.severity,
+        "type": alert.type,
+        "message": alert.message,
+        "description": alert.description,
+        "status": alert.status
+    }
+    if include_resolution:
+        result["resolved_at"] = alert.resolved_at.isoformat() if alert.resolved_at else None
+        result["duration"] = alert.duration
+        result["resolution_note"] = alert.resolution_note
+    return result
+
+def parse_alert_cursor(before: Optional[str]):
+    """
+    Parse an alert pagination cursor of the form "<ISO timestamp>,<id>".
+    Raises a 400 error if the cursor is malformed.
+    """
+    if not before:
+        return None
     try:
-        last_modified = os.path.getmtime(LOG_FILE)
-        if not force_refresh and last_modified <= _cache['log_last_modified']:
-            return _cache['log_lines']
-            
-        # File has been modified, read and cache it
-        with open(LOG_FILE, "r", encoding="utf-8") as f:
-            _cache['log_lines'] = f.readlines()
-            _cache['log_last_modified'] = last_modified
-            return _cache['log_lines']
-    except Exception as e:
-        logging.error(f"Error caching log content: {e}")
-        return []
+        timestamp, alert_id = before.rsplit(",", 1)
+        return datetime.fromisoformat(timestamp), int(alert_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor, expected '<timestamp>,<id>'")
 
-async def tail_log(file_path: str):
+def next_alert_cursor(alerts: list, limit: int) -> Optional[str]:
     """
-    Asynchronously stream log entries from the specified log file
-    using Server-Sent Events (SSE). Uses caching to reduce disk I/O.
+    Build the cursor of the page following `alerts`, or None if it was the last page.
+    """
+    if not alerts or len(alerts) < limit:
+        return None
+    last = alerts[-1]
+    return f"{last.timestamp.isoformat()},{last.id}"
+
+def parse_device_cursor(cursor: Optional[str]):
+    """
+    Parse a device pagination cursor (an opaque encoding of the sort value and ID).
+    Raises a 400 error if the cursor is malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        value, device_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(device_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def next_device_cursor(devices: list, limit: int, sort: str) -> Optional[str]:
+    """
+    Build the cursor of the page following `devices`, or None if it was the last page.
+    """
+    if not devices or len(devices) < limit:
+        return None
+    last = devices[-1]
+    return base64.urlsafe_b64encode(json.dumps([getattr(last, sort), last.id]).encode()).decode()
+
+async def tail_log():
+    """
+    Asynchronously stream log entries using Server-Sent Events (SSE).
+    Replays the last LOG_REPLAY_LINES lines, then streams the lines the
+    shared log tailer reads as they are appended.
     """
     client_id = id(asyncio.current_task())
     _cache['connected_clients'].add(client_id)
+    replay, queue = log_tailer.subscribe(LOG_REPLAY_LINES)
     
     try:
-        # Initial log content from cache
-        log_lines = cache_log_content(force_refresh=True)
-        for line in log_lines:
+        for line in replay:
             yield f"data: {line.rstrip()}\n\n"
         
-        # Track last line to avoid duplicates
-        last_line_index = len(log_lines) - 1 if log_lines else -1
-        
         # Stream new entries
         while not shutdown_event.is_set():
-            log_lines = cache_log_content()
-            
-            # If there are new lines, send them
-            if last_line_index < len(log_lines) - 1:
-                for i in range(last_line_index + 1, len(log_lines)):
-                    yield f"data: {log_lines[i].rstrip()}\n\n"
-                last_line_index = len(log_lines) - 1
-                
-            await asyncio.sleep(0.5)
+            lines = await next_message(queue)
+            if lines is None:
+                yield KEEPALIVE_MESSAGE
+                continue
+            for line in lines:
+                yield f"data: {line.rstrip()}\n\n"
     finally:
         # Remove client from connected set when connection closes
+        log_tailer.unsubscribe(queue)
         _cache['connected_clients'].discard(client_id)
 
-async def update_device_status_cache(background_tasks: BackgroundTasks):
-    """Update the device status cache in background."""
-    db = SessionLocal()
+async def stream_filtered_logs(filters: LogFilter):
+    """
+    Stream the structured log records matching `filters` using SSE.
+    Replays the last matching records of the in-memory log buffer, then
+    streams new matching records as they are logged.
+    """
+    client_id = id(asyncio.current_task())
+    _cache['connected_clients'].add(client_id)
+    queue, _ = log_buffer.hub.subscribe()
+    last_sent = log_buffer.hub.sequence
+    
     try:
-        devices = crud.get_devices(db)
-        online_count = sum(
-            1 for d in devices if d.status and "online" in d.status.lower()
-        )
-        offline_count = sum(
-            1 for d in devices if d.status and "offline" in d.status.lower()
-        )
-        total = len(devices)
-        unknown_count = total - online_count - offline_count
+        replay = [record for sequence, record in log_buffer.hub.snapshot() if sequence <= last_sent]
+        for record in [r for r in replay if filters.matches(r)][-LOG_REPLAY_LINES:]:
+            yield format_event(record['line'])
         
-        # Update cache
-        _cache['device_status']['data'] = {
-            "online": online_count,
-            "offline": offline_count,
-            "unknown": unknown_count,
-        }
-        _cache['device_status']['last_updated'] = time.time()
-    except Exception as exc:
-        logging.error(f"Error updating device status cache: {exc}")
+        while not shutdown_event.is_set():
+            event = await next_message(queue)
+            if event is None:
+                yield KEEPALIVE_MESSAGE
+                continue
+            sequence, record = event
+            if sequence > last_sent and filters.matches(record):
+                yield format_event(record['line'])
+            last_sent = max(last_sent, sequence)
+    finally:
+        log_buffer.hub.unsubscribe(queue)
+        _cache['connected_clients'].discard(client_id)
+
+def count_device_statuses() -> dict:
+    """
+    Count devices by status with a single GROUP BY query.
+    """
+    db = SessionLocal()
+    try:
+        counts = {"online": 0, "offline": 0, "unknown": 0}
+        for status, count in crud.count_devices_by_status(db).items():
+            status = (status or "").lower()
+            if "online" in status:
+                counts["online"] += count
+            elif "offline" in status:
+                counts["offline"] += count
+            else:
+                counts["unknown"] += count
+        return counts
     finally:
         db.close()
 
+async def device_status_producer():
+    """
+    Single background producer for /stream/device_status.
+    Recomputes the device status counts every DEVICE_STATUS_INTERVAL seconds
+    while there are subscribers, and publishes them only when they change.
+    """
+    while not shutdown_event.is_set():
+        if device_status_broadcaster.subscriber_count or device_status_broadcaster.latest is None:
+            try:
+                counts = await asyncio.to_thread(count_device_statuses)
+                if counts != device_status_broadcaster.latest:
+                    device_status_broadcaster.publish(counts)
+            except Exception as exc:
+                logging.error(f"Error updating device status counts: {exc}")
+        await asyncio.sleep(DEVICE_STATUS_INTERVAL)
+
 async def stream_device_status_impl():
     """Internal implementation of device status streaming."""
     client_id = id(asyncio.current_task())
     _cache['connected_clients'].add(client_id)
+    # The subscription starts with the latest counts, if already computed
+    queue = device_status_broadcaster.subscribe()
     
     try:
-        # Ensure we have fresh data at the start of a new connection
-        bg_tasks = BackgroundTasks()
-        await update_device_status_cache(bg_tasks)
-        
-        # Send initial data immediately after updating
-        yield f"data: {json.dumps(_cache['device_status']['data'])}\n\n"
-        
-        # Stream updates
         while not shutdown_event.is_set():
-            # Fetch update only if cache is stale (older than 5 seconds)
-            current_time = time.time()
-            if current_time - _cache['device_status']['last_updated'] > 5:
-                bg_tasks = BackgroundTasks()
-                await update_device_status_cache(bg_tasks)
-            
-            # Send current data regardless
-            yield f"data: {json.dumps(_cache['device_status']['data'])}\n\n"
-            await asyncio.sleep(5)  # Update every 5 seconds
+            counts = await next_message(queue)
+            if counts is None:
+                yield KEEPALIVE_MESSAGE
+            else:
+                yield f"data: {json.dumps(counts)}\n\n"
     finally:
         # Remove client from connected set
+        device_status_broadcaster.unsubscribe(queue)
+        _cache['connected_clients'].discard(client_id)
+
+async def stream_alerts_impl(last_event_id: Optional[int] = None):
+    """Internal implementation of alert streaming."""
+    client_id = id(asyncio.current_task())
+    _cache['connected_clients'].add(client_id)
+    
+    # A sequence number from before a server restart can't be resumed
+    if last_event_id is not None and last_event_id > alert_hub.sequence:
+        last_event_id = None
+    queue, missed = alert_hub.subscribe(last_event_id)
+    
+    try:
+        if last_event_id is None:
+            # Send the existing alerts immediately
+            last_sent = alert_hub.sequence
+            initial_alerts = get_latest_alerts()
+            if initial_alerts:
+                yield f"id: {last_sent}\ndata: {json.dumps(initial_alerts)}\n\n"
+        else:
+            # Replay the alerts missed since the last received event
+            last_sent = last_event_id
+            for sequence, alert in missed:
+                yield f"id: {sequence}\ndata: {json.dumps([alert])}\n\n"
+                last_sent = sequence
+        
+        while not shutdown_event.is_set():
+            event = await next_message(queue)
+            if event is None:
+                yield KEEPALIVE_MESSAGE
+                continue
+            sequence, alert = event
+            # Skip events already sent with the initial or replayed alerts
+            if sequence <= last_sent:
+                continue
+            last_sent = sequence
+            yield f"id: {sequence}\ndata: {json.dumps([alert])}\n\n"
+    finally:
+        alert_hub.unsubscribe(queue)
         _cache['connected_clients'].discard(client_id)
+        logging.info(f"Client SSE {client_id} disconnesso")
 
 # ---------------------------------------------------------------------------
 # Application Lifespan and Initialization
@@ -224,16 +462,25 @@ async def lifespan(app: FastAPI):
     Sets up logging, initializes the database, starts background monitoring,
     and handles graceful shutdown.
     """
-    # Create database tables if they do not exist
-    Base.metadata.create_all(bind=engine)
+    # Create database tables if they do not exist, along with the
+    # columns and indexes added to tables that already existed
+    migrate_schema(engine)
     setup_logger()
+    if not AGENT_TOKEN:
+        warn_open_agent_endpoint()
 
-    # Pre-cache device status at startup
-    background_tasks = BackgroundTasks()
-    await update_device_status_cache(background_tasks)
+    # Deliver the alerts and log records published by other threads on this event loop
+    alert_hub.attach(asyncio.get_running_loop())
+    log_buffer.hub.attach(asyncio.get_running_loop())
+    
+    # Start the shared device status producer and log tailer
+    status_task = asyncio.create_task(device_status_producer())
+    tail_task = asyncio.create_task(log_tailer.run())
 
-    # Start background monitoring as a daemon thread
-    monitor_thread = threading.Thread(target=start_monitor, daemon=True)
+    # Start background monitoring as a daemon thread, probing in worker processes if configured
+    monitor_thread = threading.Thread(
+        target=start_sharded_monitor if MONITOR_WORKERS > 1 else start_monitor, daemon=True
+    )
     monitor_thread.start()
     logging.info("Background monitoring started.")
 
@@ -244,8 +491,11 @@ async def lifespan(app: FastAPI):
     logging.info("Shutting down application...")
     stop_monitor()
     shutdown_event.set()  # Signal streaming functions to stop
+    status_task.cancel()
+    tail_task.cancel()
     monitor_thread.join(timeout=3)
     logging.info("Application shutdown complete.")
+    stop_logger()
 
 # Create the FastAPI app with lifespan management
 app = FastAPI(lifespan=lifespan)
@@ -275,6 +525,42 @@ class DeviceCreate(BaseModel):
     mac_address: Optional[str] = None
     owner: Optional[str] = None
     custom_alerts: Optional[List[str]] = []
+    check_interval: Optional[int] = Field(None, ge=1)
+    probe_type: Optional[Literal["icmp", "tcp", "http", "dns"]] = None
+    probe_target: Optional[str] = None
+    agent: Optional[str] = None
+
+    @field_validator("probe_target")
+    @classmethod
+    def empty_target_is_default(cls, value):
+        return value or None
+
+    @model_validator(mode="after")
+    def probe_target_suits_type(self):
+        # Port for tcp, http(s):// URL or /path for http, host name for dns
+        check_probe_target(self.probe_type, self.probe_target)
+        return self
+
+
+class AgentResult(BaseModel):
+    device_id: int
+    ip: str
+    status: Literal["online", "offline"]
+    packet_loss: Optional[float] = None
+    jitter: Optional[float] = None
+    rtt_min: Optional[float] = None
+    rtt_avg: Optional[float] = None
+    rtt_max: Optional[float] = None
+    timestamp: float
+    confirmed: bool = True
+    flapping: bool = False
+    interval: Optional[float] = None
+    flap_change: Optional[bool] = None
+
+
+class AgentResults(BaseModel):
+    agent: str
+    results: List[AgentResult]
 
 
 class AlertResponse(BaseModel):
@@ -355,59 +641,82 @@ async def alerts_page(request: Request):
 # API Endpoints
 # ---------------------------------------------------------------------------
 @app.get("/api/settings")
-async def get_api_settings(db: Session = Depends(get_db)):
+async def get_api_settings():
     """
-    Retrieve application settings from the database.
+    Retrieve the application settings, with typed values.
     """
-    try:
-        settings_data = crud.get_all_settings(db)
-        if not settings_data:
-            # If no settings exist, load defaults
-            settings_data = load_settings(force_refresh=True)
-        return settings_data
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving settings: {str(e)}")
+    settings = settings_store.current
+    if not settings.version:
+        # Not loaded yet: load them (initializing the defaults on first run)
+        settings = await asyncio.to_thread(settings_store.load)
+    return settings.as_dict()
 
 
 @app.post("/api/settings")
-async def update_api_settings(settings: Settings, db: Session = Depends(get_db)):
+def update_api_settings(settings: Settings, db: Session = Depends(get_db)):
     """
     Update application settings in the database.
+    The change is written through the shared settings store, so the API
+    and the running monitor see the new values right away.
     """
     try:
-        # Get descriptions from existing settings if available
-        existing_settings = db.query(models.Setting).all()
-        descriptions = {s.key: s.description for s in existing_settings}
-        
-        # Update each setting in the database
-        for key, value in settings.dict().items():
-            description = descriptions.get(key, "")
-            # Convert boolean to string
-            if isinstance(value, bool):
-                value = str(value)
-            crud.upsert_setting(db, key, str(value), description)
-        
-        # Force refresh of cached settings
-        load_settings(force_refresh=True)
+        new_settings = settings_store.update(settings.dict(), db)
+        log_level = new_settings.log_level.upper()
+        logging.getLogger().setLevel(getattr(logging, log_level, logging.INFO))
         
-        return {"message": "Settings updated successfully"}
+        return {"message": "Settings updated successfully", "version": new_settings.version}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating settings: {str(e)}")
 
 
 @app.get("/api/devices")
-def get_devices(db: Session = Depends(get_db)):
+def get_devices(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: str = "name",
+    order: str = "asc",
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    owner: Optional[str] = None,
+    ip_prefix: Optional[str] = None,
+    agent: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Retrieve all devices from the database.
+    Retrieve devices, filtered by status, type, owner, IP prefix and agent, and
+    sorted by any column (including packet_loss, jitter and uptime).
+    Filtering, sorting and pagination all happen in SQL. When `limit` is
+    given, pass the returned `next_cursor` as `cursor` to fetch the next
+    page. `total` is the number of devices matching the filters and
+    `type_counts` the number of devices of each type.
     """
-    devices = crud.get_devices(db)
-    return {"devices": [serialize_device(device) for device in devices]}
+    if sort not in crud.DEVICE_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort column, expected one of: {', '.join(crud.DEVICE_SORT_COLUMNS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Invalid order, expected 'asc' or 'desc'")
+    filters = {"status": status, "device_type": type, "owner": owner, "ip_prefix": ip_prefix, "agent": agent}
+    descending = order == "desc"
+
+    if limit is None:
+        devices = crud.get_devices_page(db, limit=None, sort=sort, descending=descending, **filters)
+        total = len(devices)
+        next_cursor = None
+    else:
+        after = parse_device_cursor(cursor)
+        devices = crud.get_devices_page(db, limit=limit, sort=sort, descending=descending, after=after, **filters)
+        total = crud.count_devices(db, **filters)
+        next_cursor = next_device_cursor(devices, limit, sort)
+    return {
+        "devices": [serialize_device(device) for device in devices],
+        "total": total,
+        "next_cursor": next_cursor,
+        "type_counts": crud.count_devices_by_type(db)
+    }
 
 
-@app.post("/api/devices")
-def add_device(device: DeviceCreate, db: Session = Depends(get_db)):
+def new_device_data(device: DeviceCreate) -> dict:
     """
-    Create a new device in the database.
+    Build the attributes of a new device from its validated creation data.
     """
     device_data = device.dict()
     # Convert custom_alerts list to a comma-separated string
@@ -421,10 +730,115 @@ def add_device(device: DeviceCreate, db: Session = Depends(get_db)):
     device_data["packet_loss"] = 0.0
     device_data["jitter"] = 0.0
     device_data["uptime"] = 0.0
-    new_device = crud.create_device(db, device_data)
+    return device_data
+
+
+@app.post("/api/devices")
+def add_device(device: DeviceCreate, db: Session = Depends(get_db)):
+    """
+    Create a new device in the database.
+    """
+    new_device = crud.create_device(db, new_device_data(device))
     return new_device
 
 
+def import_device_batch(batch: list, summary: dict) -> None:
+    """
+    Insert a batch of validated (line number, device data) rows in one
+    transaction, recording the created count and the per-row errors.
+    """
+    db = SessionLocal()
+    try:
+        created, errors = crud.create_devices(db, [data for _, data in batch])
+    except Exception as e:
+        db.rollback()
+        created, errors = 0, {index: f"Database error: {e}" for index in range(len(batch))}
+    finally:
+        db.close()
+    summary["created"] += created
+    for index, error in errors.items():
+        add_import_error(summary, batch[index][0], error)
+
+
+def add_import_error(summary: dict, line: int, error: str) -> None:
+    summary["failed"] += 1
+    if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+        summary["errors"].append({"line": line, "error": error})
+
+
+@app.post("/api/devices/bulk")
+async def bulk_import_devices(request: Request, format: Optional[str] = None):
+    """
+    Create many devices from a CSV (with a header line) or NDJSON request body.
+    The body is parsed as it is received, validated row by row and inserted
+    in batches of BULK_BATCH_SIZE devices, one transaction per batch.
+    Invalid rows are skipped and reported with their line number.
+    The format is taken from the `format` parameter ("csv" or "ndjson"),
+    or else from the Content-Type header.
+    """
+    content_type = request.headers.get("content-type", "")
+    fmt = (format or ("ndjson" if "json" in content_type else "csv")).lower()
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Unsupported format, expected 'csv' or 'ndjson'")
+
+    summary = {"created": 0, "failed": 0, "errors": []}
+    batch = []
+    async for line, record, error in parse_device_stream(request.stream(), fmt):
+        if error is None:
+            try:
+                batch.append((line, new_device_data(DeviceCreate(**record))))
+            except ValidationError as e:
+                error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        if error is not None:
+            add_import_error(summary, line, error)
+        if len(batch) >= BULK_BATCH_SIZE:
+            await asyncio.to_thread(import_device_batch, batch, summary)
+            batch = []
+    if batch:
+        await asyncio.to_thread(import_device_batch, batch, summary)
+
+    summary["errors"].sort(key=lambda error: error["line"])
+    logging.info(f"Bulk import: {summary['created']} devices created, {summary['failed']} rows rejected")
+    return summary
+
+
+def export_devices(fmt: str):
+    """
+    Generate the devices as CSV or NDJSON text, batch by batch.
+    """
+    db = SessionLocal()
+    try:
+        rows = []
+        header = fmt == "csv"
+        for device in crud.iter_devices(db, BULK_BATCH_SIZE):
+            data = serialize_device(device)
+            rows.append([data[column] for column in EXPORT_COLUMNS] if fmt == "csv" else data)
+            if len(rows) >= BULK_BATCH_SIZE:
+                yield format_csv_rows(rows, header) if fmt == "csv" else "".join(json.dumps(row) + "\n" for row in rows)
+                rows, header = [], False
+        if rows or header:
+            yield format_csv_rows(rows, header) if fmt == "csv" else "".join(json.dumps(row) + "\n" for row in rows)
+    finally:
+        db.close()
+
+
+@app.get("/api/devices/export")
+def export_api_devices(format: str = "csv"):
+    """
+    Stream all devices as CSV or NDJSON, without loading the whole table in memory.
+    The CSV export can be imported back with POST /api/devices/bulk.
+    """
+    fmt = format.lower()
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Unsupported format, expected 'csv' or 'ndjson'")
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_devices(fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=devices.{fmt}"}
+    )
+
+
 @app.put("/api/devices/{device_id}")
 def edit_device(device_id: int, device: DeviceCreate, db: Session = Depends(get_db)):
     """
@@ -436,6 +850,22 @@ def edit_device(device_id: int, device: DeviceCreate, db: Session = Depends(get_
         if device_data.get("custom_alerts")
         else ""
     )
+    # Keep the current probe settings unless explicitly given
+    for field in ("check_interval", "probe_type", "probe_target", "agent"):
+        if field not in device.model_fields_set:
+            device_data.pop(field)
+    if ("probe_type" in device_data) != ("probe_target" in device_data):
+        # The kept setting must suit the new one, e.g. no URL left as the target of a TCP probe
+        current = crud.get_device(db, device_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="Device not found")
+        try:
+            check_probe_target(
+                device_data.get("probe_type", current.probe_type),
+                device_data.get("probe_target", current.probe_target)
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
     updated_device = crud.update_device(db, device_id, device_data)
     if updated_device is None:
         raise HTTPException(status_code=404, detail="Device not found")
@@ -449,15 +879,57 @@ def remove_device(device_id: int, db: Session = Depends(get_db)):
     """
     if not crud.delete_device(db, device_id):
         raise HTTPException(status_code=404, detail="Device not found")
+    metrics_store.delete(device_id)
     return {"message": "Device deleted successfully"}
 
 
 @app.get("/stream")
-async def stream_logs():
+async def stream_logs(
+    level: Optional[str] = None,
+    device_id: Optional[int] = None,
+    ip: Optional[str] = None,
+    event: Optional[str] = None,
+    q: Optional[str] = None
+):
     """
     Stream the log file content as a Server-Sent Events (SSE) stream.
+    When any filter is given (minimum level, device, IP, event kind or text),
+    only the matching records are streamed, filtered server-side.
+    """
+    filters = LogFilter(level=level, device_id=device_id, ip=ip, event=event, text=q)
+    if filters.active:
+        return StreamingResponse(stream_filtered_logs(filters), media_type="text/event-stream")
+    return StreamingResponse(tail_log(), media_type="text/event-stream")
+
+
+@app.get("/api/logs")
+def get_api_logs(
+    level: Optional[str] = None,
+    device_id: Optional[int] = None,
+    ip: Optional[str] = None,
+    event: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = 500
+):
     """
-    return StreamingResponse(tail_log(LOG_FILE), media_type="text/event-stream")
+    Query the recent structured log records, filtered server-side by
+    minimum level, device, IP, event kind and text.
+    """
+    filters = LogFilter(level=level, device_id=device_id, ip=ip, event=event, text=q)
+    records = log_buffer.query(filters, limit=limit)
+    return {
+        "logs": [
+            {
+                "timestamp": datetime.fromtimestamp(record["timestamp"]).isoformat(),
+                "level": record["level"],
+                "device_id": record["device_id"],
+                "ip": record["ip"],
+                "event": record["event"],
+                "message": record["message"]
+            }
+            for record in records
+        ]
+    }
 
 
 @app.get("/stream/device_status")
@@ -469,43 +941,17 @@ async def stream_device_status(background_tasks: BackgroundTasks):
 
 
 @app.get("/stream/alerts")
-async def stream_alerts():
+async def stream_alerts(request: Request, last_event_id: Optional[int] = None):
     """
     Stream real-time alerts as a Server-Sent Events (SSE) stream.
-    Using the alert queue from monitor module instead of querying the database.
+    Alerts are pushed by the monitor through the alert hub as they are created.
+    Clients can resume with the Last-Event-ID header (or `last_event_id`) to
+    receive the alerts they missed while disconnected.
     """
-    client_id = id(asyncio.current_task())
-    _cache['connected_clients'].add(client_id)
-    
-    try:
-        # Invia immediatamente gli alert esistenti
-        initial_alerts = get_latest_alerts()
-        if initial_alerts:
-            yield f"data: {json.dumps(initial_alerts)}\n\n"
-        
-        # Function to yield latest alerts
-        async def generate():
-            last_sent_time = time.time()
-            
-            while not shutdown_event.is_set():
-                # Get latest alerts from the queue
-                alerts = get_latest_alerts()
-                new_alerts = [a for a in alerts if a['timestamp'] > last_sent_time]
-                
-                if new_alerts:
-                    # Update last sent time
-                    last_sent_time = time.time()
-                    yield f"data: {json.dumps(new_alerts)}\n\n"
-                
-                await asyncio.sleep(1)
-                
-        # Genera il flusso SSE
-        async for data in generate():
-            yield data
-            
-    finally:
-        _cache['connected_clients'].discard(client_id)
-        logging.info(f"Client SSE {client_id} disconnesso")
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    return StreamingResponse(stream_alerts_impl(last_event_id), media_type="text/event-stream")
 
 
 @app.get("/api/alerts")
@@ -514,37 +960,22 @@ def get_api_alerts(
     limit: int = 100, 
     status: Optional[str] = None,
     exclude_resolved: bool = False,
+    before: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
     Retrieve alerts with optional filtering and pagination.
+    Pass the returned `next_cursor` as `before` to fetch the next page
+    (keyset pagination, as cheap for deep pages as for the first one).
     """
+    cursor = parse_alert_cursor(before)
     try:
-        alerts = crud.get_alerts(db, skip=skip, limit=limit, status=status, exclude_resolved=exclude_resolved)
+        alerts = crud.get_alerts(db, skip=skip, limit=limit, status=status, exclude_resolved=exclude_resolved, before=cursor)
         
-        # Format the alerts with device names
-        result = []
-        for alert in alerts:
-            # Get the device name
-            device = crud.get_device(db, alert.device_id)
-            device_name = device.name if device else "Unknown Device"
-            
-            # Format the timestamp
-            timestamp = alert.timestamp.isoformat() if alert.timestamp else None
-            
-            result.append({
-                "id": alert.id,
-                "device_id": alert.device_id,
-                "device_name": device_name,
-                "timestamp": timestamp,
-                "severity": alert.severity,
-                "type": alert.type,
-                "message": alert.message,
-                "description": alert.description,
-                "status": alert.status
-            })
+        # Format the alerts with device names (loaded by the same query)
+        result = [serialize_alert(alert) for alert in alerts]
         
-        return {"alerts": result}
+        return {"alerts": result, "next_cursor": next_alert_cursor(alerts, limit)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving alerts: {str(e)}")
 
@@ -598,6 +1029,9 @@ def get_device_metrics(device_id: int, timeframe: str = "1h", db: Session = Depe
     """
     Get historical metrics for a device.
     Timeframe can be '1h', '24h', '7d' to specify how far back to look.
+    `statistics` are the rolling statistics of the recent probes (see
+    FleetStats), null until the device has been probed, and `baseline`
+    its usual values at this time of day (see BaselineEngine).
     """
     try:
         # Get the device to ensure it exists
@@ -615,8 +1049,9 @@ def get_device_metrics(device_id: int, timeframe: str = "1h", db: Session = Depe
         
         from_time = time_ranges.get(timeframe, now - timedelta(hours=1))
         
-        # This would typically query a time-series database or logs
-        # For now, return current metrics
+        # Read the range from the coarsest metrics tier that covers it
+        resolution, history = metrics_store.query(device_id, from_time.timestamp())
+        
         return {
             "device_id": device_id,
             "name": device.name,
@@ -626,9 +1061,11 @@ def get_device_metrics(device_id: int, timeframe: str = "1h", db: Session = Depe
                 "jitter": device.jitter,
                 "uptime": device.uptime
             },
+            "statistics": fleet_stats.snapshot(device_id),
+            "baseline": device_baselines.snapshot(device_id),
             "timeframe": timeframe,
-            # In a real implementation, this would come from historical data
-            "history": []
+            "resolution": resolution,
+            "history": history
         }
     except HTTPException:
         raise
@@ -636,32 +1073,83 @@ def get_device_metrics(device_id: int, timeframe: str = "1h", db: Session = Depe
         raise HTTPException(status_code=500, detail=f"Error retrieving device metrics: {str(e)}")
 
 
+def write_agent_results(batch: AgentResults, clock_offset: float = 0.0) -> int:
+    """
+    Write back the results of an agent for the devices assigned to it.
+
+    Args:
+        batch: Results sent by the agent
+        clock_offset: Seconds added to the agent's timestamps to bring them to the server clock
+
+    Returns:
+        The number of results accepted
+    """
+    db = SessionLocal()
+    try:
+        device_ids = {row.id for row in crud.filter_devices(db.query(models.Device.id), agent=batch.agent)}
+    finally:
+        db.close()
+    results = [
+        dict(result.dict(), timestamp=result.timestamp + clock_offset)
+        for result in batch.results if result.device_id in device_ids
+    ]
+    if results:
+        write_results(results, settings_store.current)
+    return len(results)
+
+
+@app.post("/api/agent/results", dependencies=[Depends(check_agent_token)])
+async def ingest_agent_results(request: Request):
+    """
+    Ingest a batch of probe results sent by a remote agent (see app.agent).
+    The body is JSON, optionally gzip-compressed (Content-Encoding: gzip):
+    {"agent": name, "results": [...]}. Results are written back like the
+    local monitor's, status, alerts and metrics history, and only for the
+    devices assigned to that agent; the others are counted as rejected.
+    The X-Agent-Time header (the agent's clock when sending, in seconds
+    since the epoch) moves the result timestamps to the server clock.
+    """
+    clock_offset = 0.0
+    sent_at = request.headers.get("x-agent-time")
+    if sent_at is not None:
+        try:
+            clock_offset = time.time() - float(sent_at)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid X-Agent-Time header")
+        if not math.isfinite(clock_offset):
+            raise HTTPException(status_code=400, detail="Invalid X-Agent-Time header")
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, MAX_AGENT_BATCH_BYTES)
+        except zlib.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+        if decompressor.unconsumed_tail:
+            raise HTTPException(status_code=413, detail="Batch of results too large")
+    try:
+        batch = AgentResults(**json.loads(body))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch of results: {e}")
+
+    accepted = await asyncio.to_thread(write_agent_results, batch, clock_offset)
+    rejected = len(batch.results) - accepted
+    logging.debug(f"Agent {batch.agent}: {accepted} results ingested, {rejected} rejected")
+    return {"accepted": accepted, "rejected": rejected}
+
+
 @app.post("/api/refresh_monitoring")
 async def refresh_monitoring():
     """
-    Restart the monitoring system to apply setting changes immediately.
-    This will stop the current monitoring thread and start a new one.
+    Apply setting changes to the running monitor immediately.
+    The settings are reloaded from the database into the settings store;
+    the scheduler applies a new version at its next scheduling decision
+    without being restarted.
     """
     try:
-        # Import shutdown_event directly to be able to reset it
-        from app.monitor import shutdown_event
-        
-        # Stop the current monitoring
-        stop_monitor()
-        logging.info("Monitoring stopped for refresh")
-        
-        # Small delay to ensure clean shutdown
-        await asyncio.sleep(1)
-        
-        # Reset the shutdown event so the new thread won't exit immediately
-        shutdown_event.clear()
-        
-        # Start a new monitoring thread
-        monitor_thread = threading.Thread(target=start_monitor, daemon=True)
-        monitor_thread.start()
-        logging.info("Monitoring restarted after settings change")
-        
-        return {"message": "Monitoring system refreshed successfully"}
+        settings = await asyncio.to_thread(settings_store.load)
+        logging.info(f"Monitoring settings refreshed (version {settings.version})")
+        return {"message": "Monitoring system refreshed successfully", "version": settings.version}
     except Exception as e:
         logging.error(f"Error refreshing monitoring: {e}")
         raise HTTPException(status_code=500, detail=f"Error refreshing monitoring: {str(e)}")
@@ -672,41 +1160,21 @@ def get_api_alert_history(
     days: int = 30,
     skip: int = 0, 
     limit: int = 100,
+    before: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
     Retrieve alert history with optional filtering and pagination.
+    Pass the returned `next_cursor` as `before` to fetch the next page.
     """
+    cursor = parse_alert_cursor(before)
     try:
-        alerts = crud.get_alert_history(db, days_back=days, skip=skip, limit=limit)
+        alerts = crud.get_alert_history(db, days_back=days, skip=skip, limit=limit, before=cursor)
         
-        # Format the alerts with device names and calculated data
-        result = []
-        for alert in alerts:
-            # Get the device name
-            device = crud.get_device(db, alert.device_id)
-            device_name = device.name if device else "Unknown Device"
-            
-            # Format timestamps
-            timestamp = alert.timestamp.isoformat() if alert.timestamp else None
-            resolved_at = alert.resolved_at.isoformat() if alert.resolved_at else None
-            
-            result.append({
-                "id": alert.id,
-                "device_id": alert.device_id,
-                "device_name": device_name,
-                "timestamp": timestamp,
-                "severity": alert.severity,
-                "type": alert.type,
-                "message": alert.message,
-                "description": alert.description,
-                "status": alert.status,
-                "resolved_at": resolved_at,
-                "duration": alert.duration,
-                "resolution_note": alert.resolution_note
-            })
+        # Format the alerts with device names (loaded by the same query) and resolution data
+        result = [serialize_alert(alert, include_resolution=True) for alert in alerts]
         
-        return {"alerts": result}
+        return {"alerts": result, "next_cursor": next_alert_cursor(alerts, limit)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving alert history: {str(e)}")
 
@@ -721,29 +1189,8 @@ def get_alert_by_id(alert_id: int, db: Session = Depends(get_db)):
         if not alert:
             raise HTTPException(status_code=404, detail="Alert not found")
             
-        # Get the device name
-        device = crud.get_device(db, alert.device_id)
-        device_name = device.name if device else "Unknown Device"
-        
-        # Format timestamps
-        timestamp = alert.timestamp.isoformat() if alert.timestamp else None
-        resolved_at = alert.resolved_at.isoformat() if alert.resolved_at else None
-        
         # Format the response
-        result = {
-            "id": alert.id,
-            "device_id": alert.device_id,
-            "device_name": device_name,
-            "timestamp": timestamp,
-            "severity": alert.severity,
-            "type": alert.type,
-            "message": alert.message,
-            "description": alert.description,
-            "status": alert.status,
-            "resolved_at": resolved_at,
-            "duration": alert.duration,
-            "resolution_note": alert.resolution_note
-        }
+        result = serialize_alert(alert, include_resolution=True)
         
         return result
     except HTTPException:
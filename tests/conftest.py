@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Run the application against a throwaway SQLite database (set before the app modules are imported)
+_data_dir = tempfile.mkdtemp(prefix="netwatch-tests-")
+os.environ.setdefault("NETWATCH_DATABASE_URL", f"sqlite:///{os.path.join(_data_dir, 'netwatch.db')}")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from app.db.database import Base, SessionLocal, engine, migrate_schema  # noqa: E402
+from app.db import models  # noqa: E402,F401
+from app.metrics import metrics_store  # noqa: E402
+
+# Keep the metrics history of the tests out of the application data directory
+metrics_store.directory = os.path.join(_data_dir, "metrics")
+
+
+@pytest.fixture
+def db():
+    """Session on an up-to-date, empty database."""
+    migrate_schema(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        with engine.begin() as connection:
+            for table in reversed(Base.metadata.sorted_tables):
+                connection.execute(table.delete())
@@ -0,0 +1,134 @@
+import gzip
+import json
+import socket
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.agent import Agent, ResultSpool
+from app.db.models import Device
+from app.metrics import metrics_store
+from app.monitor import make_result
+import main
+from main import app, MAX_AGENT_BATCH_BYTES
+
+
+def closed_port_url():
+    """URL of a localhost port nothing listens on: the server is down."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def make_agent(tmp_path):
+    server = TestClient(app)
+    for name, ip, agent in (("branch-router", "10.1.0.1", "branch"), ("core-router", "10.0.0.1", None)):
+        server.post("/api/devices", json={"name": name, "ip": ip, "type": "router", "agent": agent})
+    agent = Agent(name="branch", spool=ResultSpool(str(tmp_path / "spool")))
+    agent.client = server
+    return agent
+
+
+def status_of(db, ip):
+    db.expire_all()
+    return db.query(Device).filter(Device.ip == ip).one().status
+
+
+def test_agent_syncs_its_devices_and_reports_their_status(db, tmp_path):
+    agent = make_agent(tmp_path)
+
+    agent.sync()
+    records = agent.inventory.records()
+    assert [record.ip for record in records] == ["10.1.0.1"]
+
+    agent.collect([make_result(records[0], "online", 0.0, 0.5, [0.010, 0.012])], None)
+    agent.ship()
+    assert status_of(db, "10.1.0.1") == "online"
+    assert status_of(db, "10.0.0.1") == "Unknown"
+
+
+def test_agent_spools_results_while_the_server_is_down(db, tmp_path):
+    agent = make_agent(tmp_path)
+    agent.sync()
+    server, record = agent.client, agent.inventory.records()[0]
+
+    agent.client = httpx.Client(base_url=closed_port_url())
+    agent.collect([make_result(record, "offline", 100.0)], None)
+    agent.ship()
+    assert len(agent.spool.pending()) == 1
+    assert status_of(db, "10.1.0.1") == "Unknown"
+
+    agent.client = server
+    agent.ship()
+    assert agent.spool.pending() == []
+    assert status_of(db, "10.1.0.1") == "offline"
+
+
+def test_agent_drops_batches_the_server_rejects(db, tmp_path, caplog):
+    agent = make_agent(tmp_path)
+    agent.spool.save(b"not gzip")                                       # 400: invalid body
+    agent.spool.save(gzip.compress(b" " * (MAX_AGENT_BATCH_BYTES + 1)))  # 413: too large once decompressed
+    agent.spool.save(gzip.compress(json.dumps({"agent": "branch", "results": []}).encode()))
+
+    agent.ship()
+
+    assert agent.spool.pending() == []
+    rejected = [record.message for record in caplog.records if "rejected a batch" in record.message]
+    assert [message[:len("Server rejected a batch of results (400)")] for message in rejected] == [
+        "Server rejected a batch of results (400)", "Server rejected a batch of results (413)"
+    ]
+
+
+def post_results(server, results, sent_at):
+    body = gzip.compress(json.dumps({"agent": "branch", "results": results}).encode())
+    return server.post("/api/agent/results", content=body, headers={
+        "Content-Type": "application/json", "Content-Encoding": "gzip", "X-Agent-Time": repr(sent_at)
+    })
+
+
+def test_agent_timestamps_are_moved_to_the_server_clock(db, tmp_path):
+    agent = make_agent(tmp_path)
+    agent.sync()
+    record = agent.inventory.records()[0]
+    metrics_store.delete(record.id)
+    skew = 3600                                                         # Agent clock one hour ahead
+    now = time.time()
+
+    result = dict(make_result(record, "online", 0.0, 0.5, [0.010]), timestamp=now + skew - 10)
+    assert post_results(agent.client, [result], now + skew).json() == {"accepted": 1, "rejected": 0}
+
+    assert len(metrics_store.read(record.id, 0, now + 2 * skew)) == 1
+    assert len(metrics_store.read(record.id, now - 15, now)) == 1
+
+
+def test_out_of_order_agent_results_are_dropped(db, tmp_path, caplog):
+    agent = make_agent(tmp_path)
+    agent.sync()
+    record = agent.inventory.records()[0]
+    metrics_store.delete(record.id)
+    now = time.time()
+
+    for timestamp in (now - 10, now - 20):
+        result = dict(make_result(record, "online", 0.0, 0.5, [0.010]), timestamp=timestamp)
+        assert post_results(agent.client, [result], now).status_code == 200
+
+    assert len(metrics_store.read(record.id, 0, now + 60)) == 1
+    assert any("Dropped 1 metrics samples" in record.message for record in caplog.records)
+
+
+def test_invalid_agent_time_is_rejected(db, tmp_path):
+    agent = make_agent(tmp_path)
+
+    assert post_results(agent.client, [], "soon").status_code == 400
+    assert post_results(agent.client, [], float("nan")).status_code == 400
+
+
+def test_missing_agent_token_is_reported_once(db, tmp_path, caplog, monkeypatch):
+    monkeypatch.setattr(main, "_agent_token_warned", False)
+    agent = make_agent(tmp_path)
+
+    post_results(agent.client, [], time.time())
+    post_results(agent.client, [], time.time())
+
+    assert [record.message for record in caplog.records].count(main.AGENT_TOKEN_WARNING) == 1
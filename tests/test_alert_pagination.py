@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.db import crud
+from app.db.database import engine, migrate_schema
+from main import app
+
+
+def fetch_all_pages(client, limit):
+    """IDs of the alerts of every page, following next_cursor (bounded, in case it loops)."""
+    pages, cursor = [], None
+    for _ in range(20):
+        params = {"limit": limit}
+        if cursor:
+            params["before"] = cursor
+        body = client.get("/api/alerts", params=params).json()
+        pages.append([alert["id"] for alert in body["alerts"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+    raise AssertionError(f"Pagination did not end: {pages}")
+
+
+def test_pages_alerts_created_in_the_same_second(db):
+    device = crud.create_device(db, {"name": "router", "ip": "10.0.0.1", "type": "router"})
+    same_second = datetime(2026, 1, 1, 12, 0, 0)
+    ids = [
+        crud.create_alert(db, {
+            "device_id": device.id, "timestamp": same_second, "severity": "warning",
+            "type": "Connectivity", "message": f"Alert {i}"
+        }).id
+        for i in range(6)
+    ]
+
+    pages = fetch_all_pages(TestClient(app), limit=4)
+
+    assert pages == [ids[:1:-1], ids[1::-1]]
+
+
+def test_pages_alerts_stamped_by_the_database(db):
+    device = crud.create_device(db, {"name": "router", "ip": "10.0.0.1", "type": "router"})
+    with engine.begin() as connection:
+        for i in range(5):
+            connection.execute(text(
+                "INSERT INTO alerts (device_id, timestamp, severity, type, message, status) "
+                "VALUES (:device_id, CURRENT_TIMESTAMP, 'warning', 'Connectivity', :message, 'active')"
+            ), {"device_id": device.id, "message": f"Alert {i}"})
+        connection.exec_driver_sql("PRAGMA user_version = 0")  # A database from before the migration
+    migrate_schema(engine)
+
+    pages = fetch_all_pages(TestClient(app), limit=2)
+
+    assert sum(pages, []) == sorted(sum(pages, []), reverse=True)
+    assert len(sum(pages, [])) == 5
+
+
+def test_timestamps_are_padded_once(db):
+    device = crud.create_device(db, {"name": "router", "ip": "10.0.0.1", "type": "router"})
+    insert = text(
+        "INSERT INTO alerts (device_id, timestamp, severity, type, message, status) "
+        "VALUES (:device_id, '2026-01-01 12:00:00', 'warning', 'Connectivity', 'Alert', 'active')"
+    )
+    with engine.begin() as connection:
+        connection.execute(insert, {"device_id": device.id})
+
+    migrate_schema(engine)  # Already migrated by the fixture: no table scan
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT timestamp FROM alerts")).scalar() == "2026-01-01 12:00:00"
@@ -0,0 +1,104 @@
+import time
+
+from app.baseline import (
+    BaselineEngine, DeviceBaseline, ALL_HOURS, ANOMALY_ADAPTATION, ANOMALY_PERSISTENCE, MAX_COUNT, MIN_SAMPLES,
+    bucket_of
+)
+
+
+def at(hour, minute=0):
+    """Timestamp of a local time of day."""
+    return time.mktime((2026, 1, 5, hour, minute, 0, 0, 0, -1))
+
+
+def learn(engine, value, count=100, hour=3, device_id=1):
+    for i in range(count):
+        assert engine.observe(device_id, {"latency": value}, at(hour, i % 60)) == []
+
+
+def test_hours_without_enough_samples_use_the_all_hours_baseline():
+    engine = BaselineEngine()
+    learn(engine, 10.0, MIN_SAMPLES, hour=3)
+
+    assert engine.snapshot(1, at(3))["latency"]["samples"] == MIN_SAMPLES
+    assert engine.snapshot(1, at(20))["latency"]["samples"] == MIN_SAMPLES
+
+    learn(engine, 14.0, MIN_SAMPLES - 1, hour=20)
+    assert engine.snapshot(1, at(20))["latency"]["samples"] == 2 * MIN_SAMPLES - 1
+
+    learn(engine, 14.0, 1, hour=20)
+    evening = engine.snapshot(1, at(20))["latency"]
+    assert evening["samples"] == MIN_SAMPLES and evening["median"] > engine.snapshot(1, at(3))["latency"]["median"]
+
+
+def test_nothing_is_reported_while_learning():
+    engine = BaselineEngine()
+    learn(engine, 10.0, MIN_SAMPLES - 1)
+
+    assert engine.snapshot(1, at(3))["latency"] is None
+    assert engine.observe(1, {"latency": 500.0}, at(3)) == []
+
+
+def test_anomalies_are_reported_once_they_persist():
+    engine = BaselineEngine()
+    learn(engine, 10.0)
+
+    reports = [engine.observe(1, {"latency": 200.0}, at(3)) for _ in range(ANOMALY_PERSISTENCE + 2)]
+
+    assert reports[:ANOMALY_PERSISTENCE - 1] == [[]] * (ANOMALY_PERSISTENCE - 1)
+    (name, value, median, upper), = reports[ANOMALY_PERSISTENCE - 1]
+    assert (name, value) == ("latency", 200.0) and median <= upper < 200.0 / 1.5
+    assert reports[ANOMALY_PERSISTENCE:] == [[], []]
+
+
+def test_a_normal_sample_breaks_the_streak():
+    engine = BaselineEngine()
+    learn(engine, 10.0)
+
+    for value in [200.0] * (ANOMALY_PERSISTENCE - 1) + [10.0] + [200.0] * (ANOMALY_PERSISTENCE - 1):
+        assert engine.observe(1, {"latency": value}, at(3)) == []
+
+
+def test_lasting_anomalies_become_the_new_normal():
+    engine = BaselineEngine()
+    learn(engine, 10.0)
+
+    for _ in range(ANOMALY_ADAPTATION - 1):
+        engine.observe(1, {"latency": 200.0}, at(3))
+    assert engine.snapshot(1, at(3))["latency"]["samples"] == 100
+
+    for _ in range(10):
+        engine.observe(1, {"latency": 200.0}, at(3))
+    baseline = engine.snapshot(1, at(3))["latency"]
+    assert baseline["samples"] == 110 and baseline["upper"] >= 200.0
+    assert engine._devices[1].streaks[0] == 0
+
+
+def test_counts_are_halved_at_the_limit():
+    engine = BaselineEngine()
+    baseline = engine._devices[1] = DeviceBaseline()
+    full, other = bucket_of(10.0), bucket_of(1.0)
+    baseline.counts[0, 3, full] = baseline.counts[0, ALL_HOURS, full] = MAX_COUNT
+    baseline.counts[0, 3, other] = baseline.counts[0, ALL_HOURS, other] = 10
+
+    engine.observe(1, {"latency": 10.0}, at(3))
+
+    for hour in (3, ALL_HOURS):
+        assert baseline.counts[0, hour, full] == MAX_COUNT // 2 + 1
+        assert baseline.counts[0, hour, other] == 5
+
+
+def test_median_below_the_first_bucket_is_zero():
+    engine = BaselineEngine()
+    learn(engine, 0.0)
+
+    assert engine.snapshot(1, at(3))["latency"]["median"] == 0.0
+
+
+def test_packet_loss_has_no_baseline():
+    engine = BaselineEngine()
+    for _ in range(100):
+        engine.observe(1, {"packet_loss": 0.0}, at(3))
+
+    assert [engine.observe(1, {"packet_loss": 100.0}, at(3)) for _ in range(ANOMALY_PERSISTENCE)] == [[]] * 3
+    assert "packet_loss" not in engine.snapshot(1, at(3))
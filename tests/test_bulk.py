@@ -0,0 +1,116 @@
+import asyncio
+import csv
+import io
+import json
+
+from fastapi.testclient import TestClient
+
+from app.bulk import parse_device_stream
+from app.db import crud
+from main import app
+
+
+def parse(text, fmt="csv", chunk_size=7):
+    """Parse a body delivered in small chunks, so lines span several chunks."""
+    async def chunks():
+        data = text.encode()
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    async def collect():
+        return [row async for row in parse_device_stream(chunks(), fmt)]
+
+    return asyncio.run(collect())
+
+
+def test_csv_rows_are_parsed_with_the_header():
+    rows = parse("Name,IP,Type,Custom_Alerts\r\ncore,10.0.0.1,router,\"cpu, disk\"\r\n\r\nedge,10.0.0.2,switch,\n")
+
+    assert rows == [
+        (2, {"name": "core", "ip": "10.0.0.1", "type": "router", "custom_alerts": ["cpu", "disk"]}, None),
+        (4, {"name": "edge", "ip": "10.0.0.2", "type": "switch"}, None),
+    ]
+
+
+def test_csv_rows_with_too_many_fields_are_rejected():
+    rows = parse("name,ip,type\ncore,10.0.0.1,router,extra\n")
+
+    assert rows == [(2, None, "Expected at most 3 fields, got 4")]
+
+
+def test_invalid_ndjson_lines_are_reported():
+    rows = parse('{"name": "core", "ip": "10.0.0.1", "type": "router"}\n{"name": \n[1, 2]\n', "ndjson")
+
+    assert rows[0] == (1, {"name": "core", "ip": "10.0.0.1", "type": "router"}, None)
+    assert rows[1][0] == 2 and rows[1][1] is None and rows[1][2].startswith("Invalid JSON")
+    assert rows[2] == (3, None, "Expected a JSON object")
+
+
+def test_duplicate_ips_are_skipped(db):
+    crud.create_device(db, {"name": "core", "ip": "10.0.0.1", "type": "router"})
+
+    created, errors = crud.create_devices(db, [
+        {"name": "dup", "ip": "10.0.0.1", "type": "router"},
+        {"name": "edge", "ip": "10.0.0.2", "type": "switch"},
+        {"name": "edge-again", "ip": "10.0.0.2", "type": "switch"},
+    ])
+
+    assert created == 1
+    assert sorted(errors) == [0, 2]
+    assert "10.0.0.1" in errors[0] and "10.0.0.2" in errors[2]
+
+
+def test_constraint_violation_falls_back_to_one_device_at_a_time(db):
+    created, errors = crud.create_devices(db, [
+        {"name": "core", "ip": "10.0.0.1", "type": "router"},
+        {"name": "broken", "ip": "10.0.0.2", "type": None},
+        {"name": "edge", "ip": "10.0.0.3", "type": "switch"},
+    ])
+
+    assert created == 2
+    assert list(errors) == [1] and errors[1].startswith("Constraint violation")
+    assert sorted(device.name for device in crud.get_devices(db)) == ["core", "edge"]
+
+
+def test_bulk_import_reports_invalid_rows(db):
+    client = TestClient(app)
+    body = "name,ip,type\ncore,10.0.0.1,router\nbad,,router\ncore-2,10.0.0.1,router\n"
+
+    summary = client.post("/api/devices/bulk", content=body, headers={"content-type": "text/csv"}).json()
+
+    assert (summary["created"], summary["failed"]) == (1, 2)
+    assert [error["line"] for error in summary["errors"]] == [3, 4]
+
+
+def test_export_can_be_imported_back(db):
+    client = TestClient(app)
+    client.post("/api/devices", json={"name": "core", "ip": "10.0.0.1", "type": "router", "owner": "noc",
+                                      "custom_alerts": ["cpu", "disk"], "check_interval": 60})
+    client.post("/api/devices", json={"name": "web", "ip": "10.0.0.2", "type": "server",
+                                      "probe_type": "http", "probe_target": "/health"})
+    exported = client.get("/api/devices/export?format=csv").text
+    for device in crud.get_devices(db):
+        crud.delete_device(db, device.id)
+
+    summary = client.post("/api/devices/bulk?format=csv", content=exported).json()
+    reexported = client.get("/api/devices/export?format=csv").text
+
+    assert (summary["created"], summary["failed"]) == (2, 0)
+    columns = ("name", "ip", "type", "owner", "custom_alerts", "check_interval", "probe_type", "probe_target")
+    before, after = (
+        [{column: row[column] for column in columns} for row in csv.DictReader(io.StringIO(text))]
+        for text in (exported, reexported)
+    )
+    assert len(before) == 2 and after == before
+    assert before[0]["custom_alerts"] == "cpu,disk"
+
+
+def test_ndjson_export_lists_every_device(db):
+    client = TestClient(app)
+    client.post("/api/devices/bulk?format=ndjson", content="".join(
+        json.dumps({"name": f"sw-{i}", "ip": f"10.0.1.{i}", "type": "switch"}) + "\n" for i in range(5)
+    ))
+
+    lines = client.get("/api/devices/export?format=ndjson").text.splitlines()
+
+    assert [json.loads(line)["ip"] for line in lines] == [f"10.0.1.{i}" for i in range(5)]
@@ -0,0 +1,13 @@
+from sqlalchemy import inspect
+
+from app.db.crud import DEVICE_SORT_COLUMNS
+from app.db.database import engine
+
+
+def test_every_sort_column_is_indexed(db):
+    inspector = inspect(engine)
+    leading = {tuple(index["column_names"][:2]) for index in inspector.get_indexes("devices")}
+    unique = {constraint["column_names"][0] for constraint in inspector.get_unique_constraints("devices")}
+
+    for name, column in DEVICE_SORT_COLUMNS.items():
+        assert column.primary_key or column.name in unique or (column.name, "id") in leading, name
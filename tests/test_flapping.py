@@ -0,0 +1,40 @@
+from app import monitor
+from app.db import crud
+from app.db.models import Alert
+
+
+def write(device, status, **flags):
+    result = monitor.make_result(device, status, packet_loss=0.0 if status == "online" else 100.0, jitter=0.0)
+    monitor.update_devices_status([{**result, "confirmed": True, **flags}])
+
+
+def alerts_of(db, device):
+    db.expire_all()
+    return {(alert.message, alert.status) for alert in db.query(Alert).filter(Alert.device_id == device.id)}
+
+
+def start_flapping(db):
+    device = crud.create_device(db, {"name": "edge", "ip": "10.0.0.2", "type": "router", "status": "online"})
+    write(device, "offline", flapping=True, flap_change=True)
+    assert alerts_of(db, device) == {("Device edge is flapping", "active")}
+    return device
+
+
+def test_link_settling_offline_is_reported_offline(db):
+    device = start_flapping(db)
+
+    write(device, "offline", flapping=False, flap_change=False)
+
+    assert alerts_of(db, device) == {
+        ("Device edge is flapping", "resolved"),
+        ("Device edge is offline", "active"),
+    }
+
+
+def test_link_settling_online_resolves_the_flapping_alert(db):
+    device = start_flapping(db)
+    write(device, "online", flapping=True)
+
+    write(device, "online", flapping=False, flap_change=False)
+
+    assert alerts_of(db, device) == {("Device edge is flapping", "resolved")}
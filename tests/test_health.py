@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from app.health import HealthTracker
+from app.monitor import apply_health, make_result
+
+
+def device(status="online"):
+    return SimpleNamespace(id=1, name="router", ip="10.0.0.1", status=status)
+
+
+def probe(health, router, status, now=0):
+    result = make_result(router, status, 0.0 if status == "online" else 100.0, 0.0)
+    return apply_health(health, router, result, 30, now)
+
+
+def test_unconfirmed_failures_are_not_written_back():
+    health, router = HealthTracker(), device()
+
+    assert probe(health, router, "offline") is None
+    confirmed = probe(health, router, "offline")
+
+    assert confirmed["status"] == "offline" and confirmed["packet_loss"] == 100.0
+    assert confirmed["confirmed"] and confirmed["interval"] == 30
+
+
+def test_a_single_failure_leaves_nothing_behind():
+    health, router = HealthTracker(), device()
+
+    assert probe(health, router, "offline") is None
+    result = probe(health, router, "online")
+
+    assert result["status"] == "online" and result["packet_loss"] == 0.0
+
+
+def test_flapping_ends_on_a_confirmed_outcome():
+    health, router = HealthTracker(flap_threshold=2, flap_window=100), device()
+    for t, status in enumerate(["offline", "offline", "online", "online"]):
+        result = probe(health, router, status, now=t)
+    assert result["flap_change"] is True
+
+    assert probe(health, router, "offline", now=200) is None   # Unconfirmed: still flapping
+    assert health.get(router).flapping
+    result = probe(health, router, "online", now=201)
+    assert result["flap_change"] is False and not result["flapping"]
@@ -0,0 +1,17 @@
+import pytest
+
+from app import monitor
+from app.db import crud
+from app.metrics import metrics_store
+
+
+def test_device_and_metrics_history_record_the_same_jitter(db):
+    device = crud.create_device(db, {"name": "switch", "ip": "10.0.0.3", "type": "switch"})
+    for ping_times, probe_jitter in (([0.010, 0.012], 1.0), ([0.030, 0.034], 2.0), ([0.011, 0.013], 1.0)):
+        result = monitor.make_result(device, "online", 0.0, probe_jitter, ping_times)
+        monitor.write_results([result], None)
+
+    db.refresh(device)
+    recorded = metrics_store.read(device.id)[-1]["jitter"]
+    assert device.jitter != 1.0  # The rolling RFC 3550 jitter, not the last probe's
+    assert recorded == pytest.approx(device.jitter, rel=1e-6)  # Stored as float32
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+from unittest import mock
+
+from app.logbuffer import LogBufferHandler, LogFilter
+
+
+def make_logger(handler):
+    logger = logging.getLogger(f"netwatch-test-{id(handler)}")
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def test_records_skip_the_event_loop_without_subscribers():
+    handler = LogBufferHandler(capacity=10)
+    loop = asyncio.new_event_loop()
+    try:
+        handler.hub.attach(loop)
+        with mock.patch.object(loop, "call_soon_threadsafe") as call_soon:
+            make_logger(handler).info("Device %s is online", "router", extra={"device_id": 3, "event": "status"})
+        call_soon.assert_not_called()
+    finally:
+        loop.close()
+
+    [record] = handler.query(LogFilter(device_id=3))
+    assert record["message"] == "Device router is online" and record["event"] == "status"
+
+
+def test_records_reach_the_subscribers():
+    handler = LogBufferHandler(capacity=10)
+
+    async def run():
+        handler.hub.attach(asyncio.get_running_loop())
+        queue, _ = handler.hub.subscribe()
+        make_logger(handler).warning("Device router is offline")
+        return await asyncio.wait_for(queue.get(), 1)
+
+    sequence, record = asyncio.run(run())
+    assert sequence == 1 and record["level"] == "WARNING"
@@ -0,0 +1,132 @@
+import os
+
+import pytest
+
+from app.metrics import MetricsStore, RECORD, RAW_RETENTION, COMPACTION_SLACK
+
+
+def sample(timestamp, status="online", device_id=1, **values):
+    return {"device_id": device_id, "timestamp": timestamp, "status": status, "packet_loss": 0.0,
+            "jitter": 1.0, "rtt_min": 9.0, "rtt_avg": 10.0, "rtt_max": 11.0, **values}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MetricsStore(str(tmp_path / "metrics"))
+
+
+def test_directories_are_created_on_first_write(store):
+    assert not os.path.exists(store.directory)
+    store.rollup(now=1000)
+    assert not os.path.exists(store.directory)
+
+    store.append([sample(1000)])
+
+    assert os.path.getsize(os.path.join(store.directory, "1.bin")) == RECORD.size
+
+
+def test_samples_round_trip_through_the_packed_format(store):
+    store.append([sample(1000.5, packet_loss=25.0), sample(1001, "offline", rtt_min=None, rtt_avg=None, rtt_max=None)])
+
+    online, offline = store.read(1, 0, 2000)
+    assert online["status"] == "online" and online["packet_loss"] == 25.0
+    assert (online["rtt_min"], online["rtt_avg"], online["rtt_max"], online["jitter"]) == (9.0, 10.0, 11.0, 1.0)
+    assert offline["status"] == "offline" and offline["rtt_avg"] == 0.0
+
+
+def test_range_reads_are_inclusive(store):
+    store.append([sample(t) for t in range(1000, 1010)])
+
+    assert len(store.read(1, 1002, 1005)) == 4
+    assert store.read(1, 1010, 2000) == []
+    assert store.read(2, 0, 2000) == []
+
+
+def test_out_of_order_samples_are_dropped(store):
+    store.append([sample(1002), sample(1000)])           # Sorted within a batch
+    store.append([sample(1001), sample(1003)])           # Older than the last sample: dropped
+
+    fresh = MetricsStore(store.directory)                # Last timestamps read back from the files
+    fresh.append([sample(1002.5), sample(1004)])
+
+    timestamps = [row[0] for row in RECORD.iter_unpack(open(os.path.join(store.directory, "1.bin"), "rb").read())]
+    assert timestamps == [1000, 1002, 1003, 1004]
+
+
+def test_raw_samples_expire_once_past_the_compaction_slack(store):
+    now = 10 * RAW_RETENTION
+    store.append([sample(now - RAW_RETENTION - 60), sample(now - 60)])
+
+    store.rollup(now=now)
+    assert len(store.read(1, 0, now)) == 2              # Expired, but within the slack
+
+    store.rollup(now=now + RAW_RETENTION * COMPACTION_SLACK)
+    assert len(store.read(1, 0, now)) == 1
+
+
+def test_delete_removes_every_tier(store):
+    store.append([sample(t * 60) for t in range(1, 200)])
+    store.rollup(now=200 * 60)
+
+    store.delete(1)
+
+    assert store.read(1, 0, 10 ** 6) == [] and store.read(1, 0, 10 ** 6, tier="1m") == []
+    store.append([sample(30)])                           # The order restarts after a delete
+    assert len(store.read(1, 0, 100)) == 1
+
+
+DAY = 86400
+T0 = 100 * DAY  # Aligned on every bucket size
+
+
+def three_days(store):
+    """Samples every 10 minutes over 3 days, offline every third hour."""
+    store.append([
+        sample(t, "offline" if t // 3600 % 3 == 0 else "online", packet_loss=100.0 if t // 3600 % 3 == 0 else 0.0)
+        for t in range(T0, T0 + 3 * DAY, 600)
+    ])
+    store.rollup(now=T0 + 3 * DAY)
+
+
+def test_rollup_aggregates_every_tier(store):
+    three_days(store)
+
+    minutes, hours, days = (store.read(1, 0, T0 + 3 * DAY, tier=name) for name in ("1m", "1h", "1d"))
+    assert (len(minutes), len(hours), len(days)) == (432, 72, 3)
+    assert [hour["samples"] for hour in hours] == [6] * 72
+    assert [day["samples"] for day in days] == [144] * 3
+
+    offline_hour, online_hour = hours[0], hours[1]
+    assert offline_hour["availability"] == 0.0 and offline_hour["packet_loss"] == 100.0
+    assert offline_hour["rtt_avg"] == 0.0              # RTTs only count the reachable samples
+    assert online_hour["availability"] == 100.0 and online_hour["rtt_avg"] == pytest.approx(10.0)
+    assert days[0]["availability"] == pytest.approx(200 / 3, rel=1e-5)
+    assert days[0]["rtt_min"] == 9.0 and days[0]["rtt_max"] == 11.0
+
+
+def test_rollup_only_adds_complete_buckets(store):
+    store.append([sample(T0 + 10), sample(T0 + 70)])
+    store.rollup(now=T0 + 100)
+    assert [row["samples"] for row in store.read(1, 0, T0 + DAY, tier="1m")] == [1]
+
+    store.rollup(now=T0 + 130)                          # Not rolled up twice, the next minute once complete
+    assert [row["samples"] for row in store.read(1, 0, T0 + DAY, tier="1m")] == [1, 1]
+
+
+@pytest.mark.parametrize("span, tier", [
+    (1800, "raw"), (2 * 3600, "1m"), (DAY, "1m"), (5 * DAY, "1h"), (100 * DAY, "1d"),
+])
+def test_query_serves_the_coarsest_tier_with_enough_points(store, span, tier):
+    assert store.query(1, T0 - span, T0)[0] == tier
+
+
+def test_rollup_tiers_are_compacted_past_the_slack(store):
+    three_days(store)
+
+    store.rollup(now=T0 + 8.5 * DAY)                    # Past the 8 day retention, within the slack
+    assert len(store.read(1, 0, T0 + 3 * DAY, tier="1m")) == 432
+
+    store.rollup(now=T0 + 8.9 * DAY)                    # Past the slack: compacted to the retention
+    minutes = store.read(1, 0, T0 + 3 * DAY, tier="1m")
+    assert len(minutes) == 432 - 130                   # The buckets before T0 + 0.9 day
+    assert len(store.read(1, 0, T0 + 3 * DAY, tier="1h")) == 72
@@ -0,0 +1,113 @@
+import asyncio
+import struct
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.probe import TCPProbe, HTTPProbe, DNSProbe
+from main import app
+
+LOOPBACK = "127.0.0.1"
+
+
+def device(probe_target=None):
+    return SimpleNamespace(id=1, ip=LOOPBACK, probe_target=probe_target)
+
+
+async def measure(probe, target, count=2):
+    await probe.open()
+    try:
+        return await probe.measure(device(target), count=count, timeout=1, interval=0)
+    finally:
+        await probe.close()
+
+
+def test_tcp_probe():
+    async def run():
+        server = await asyncio.start_server(lambda reader, writer: writer.close(), LOOPBACK, 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reachable = await measure(TCPProbe(), str(port))
+        closed = await measure(TCPProbe(), str(port))
+        return reachable, closed
+
+    reachable, closed = asyncio.run(run())
+    assert len(reachable) == 2 and all(rtt > 0 for rtt in reachable)
+    assert closed == []
+
+
+def test_http_probe():
+    async def handle(reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        status = b"200 OK" if request.startswith(b"GET /health ") else b"404 Not Found"
+        writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(handle, LOOPBACK, 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            probe = HTTPProbe()
+            healthy = await measure(probe, f"http://{LOOPBACK}:{port}/health")
+            missing = await measure(probe, f"http://{LOOPBACK}:{port}/missing", count=1)
+        return healthy, missing, probe.details[1]
+
+    healthy, missing, details = asyncio.run(run())
+    assert len(healthy) == 2
+    assert missing == [] and details["status"] == 404
+
+
+class DNSServer(asyncio.DatagramProtocol):
+    """Answer every query without records: REFUSED for refused.test, NXDOMAIN for any other name."""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        rcode = 5 if b"\x07refused" in data else 3
+        flags = 0x8180 | rcode  # Response, recursion desired and available
+        self.transport.sendto(data[:2] + struct.pack("!HHHHH", flags, 1, 0, 0, 0) + data[12:], addr)
+
+
+def test_dns_probe():
+    async def run():
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(DNSServer, local_addr=(LOOPBACK, 0))
+        probe = DNSProbe()
+        probe.port = transport.get_extra_info("sockname")[1]
+        try:
+            answered = await measure(probe, "netwatch.invalid")
+            refused = await measure(probe, "refused.test", count=1)
+        finally:
+            transport.close()
+        return answered, refused, probe.details[1]
+
+    answered, refused, details = asyncio.run(run())
+    assert len(answered) == 2
+    assert refused == [] and details["rcode"] == 5
+
+
+@pytest.mark.parametrize("probe_type, probe_target", [
+    ("tcp", "http://10.0.0.5/"), ("tcp", "70000"), ("http", "10.0.0.5"), ("http", "ftp://10.0.0.5/"),
+    ("dns", "not a host"), ("dns", "http://example.com"),
+])
+def test_invalid_probe_targets_are_rejected(db, probe_type, probe_target):
+    response = TestClient(app).post("/api/devices", json={
+        "name": "web", "ip": "10.0.0.5", "type": "server", "probe_type": probe_type, "probe_target": probe_target
+    })
+
+    assert response.status_code == 422
+
+
+def test_probe_type_change_keeping_an_invalid_target_is_rejected(db):
+    client = TestClient(app)
+    device = {"name": "web", "ip": "10.0.0.5", "type": "server"}
+    device_id = client.post("/api/devices", json={
+        **device, "probe_type": "http", "probe_target": "https://10.0.0.5/health"
+    }).json()["id"]
+
+    assert client.put(f"/api/devices/{device_id}", json={**device, "probe_type": "tcp"}).status_code == 422
+    assert client.put(f"/api/devices/{device_id}", json={
+        **device, "probe_type": "tcp", "probe_target": "443"
+    }).status_code == 200
@@ -0,0 +1,65 @@
+import pytest
+
+from app.db import crud
+from app.registry import device_registry
+
+
+@pytest.fixture
+def registry(db):
+    device_registry.load(force=True)
+    changes = []
+    listener = lambda device_id, record: changes.append((device_id, record))
+    device_registry.subscribe(listener)
+    yield changes
+    device_registry.unsubscribe(listener)
+    device_registry.loaded = False
+
+
+def test_create_update_and_delete_keep_the_registry_in_sync(db, registry):
+    device = crud.create_device(db, {"name": "core", "ip": "10.0.0.1", "type": "router"})
+
+    record = device_registry.get(device.id)
+    assert (record.name, record.ip, record.type) == ("core", "10.0.0.1", "router")
+    assert registry == [(device.id, record)]
+
+    crud.update_device(db, device.id, {"name": "core-1", "check_interval": 60})
+
+    record = device_registry.get(device.id)
+    assert (record.name, record.check_interval) == ("core-1", 60)
+    assert registry[-1] == (device.id, record)
+
+    assert crud.delete_device(db, device.id)
+
+    assert device_registry.get(device.id) is None
+    assert registry[-1] == (device.id, None)
+    assert len(registry) == 3
+
+
+def test_bulk_create_notifies_once_per_device(db, registry):
+    created, errors = crud.create_devices(db, [
+        {"name": "a", "ip": "10.0.0.1", "type": "router"},
+        {"name": "b", "ip": "10.0.0.2", "type": "switch"},
+    ])
+
+    assert (created, errors) == (2, {})
+    assert sorted(record.name for record in device_registry.records()) == ["a", "b"]
+    assert sorted(record.name for _, record in registry) == ["a", "b"]
+
+
+def test_missing_devices_do_not_notify(db, registry):
+    assert crud.update_device(db, 999, {"name": "ghost"}) is None
+    assert not crud.delete_device(db, 999)
+    assert registry == []
+
+
+def test_unloaded_registry_ignores_changes(db):
+    device_registry.loaded = False
+    changes = []
+    listener = lambda device_id, record: changes.append(device_id)
+    device_registry.subscribe(listener)
+    try:
+        crud.create_device(db, {"name": "core", "ip": "10.0.0.1", "type": "router"})
+    finally:
+        device_registry.unsubscribe(listener)
+
+    assert changes == []
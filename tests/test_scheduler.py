@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.scheduler import ProbeScheduler, ProbeSlots
+
+
+def device(device_id, check_interval=None):
+    return SimpleNamespace(id=device_id, check_interval=check_interval)
+
+
+def ids(devices):
+    return [d.id for d in devices]
+
+
+def test_first_probes_are_spread_over_the_interval():
+    scheduler = ProbeScheduler(default_interval=60, jitter=0)
+    scheduler.sync([device(i) for i in range(1, 101)], now=0)
+
+    due = sorted(scheduler._due.values())
+    gaps = [b - a for a, b in zip(due, due[1:])]
+    assert 0 <= due[0] and due[-1] < 60
+    assert max(gaps) < 3 * 60 / 100                      # Golden ratio phases: no burst, no big hole
+
+
+def test_devices_come_due_in_order_and_are_rescheduled():
+    scheduler = ProbeScheduler(default_interval=60, jitter=0)
+    scheduler.add(device(1, check_interval=10), now=0)
+    scheduler.add(device(2, check_interval=30), now=0)
+    first = {device_id: due for device_id, due in scheduler._due.items()}
+
+    assert ids(scheduler.pop_due(now=max(first.values()))) == sorted(first, key=first.get)
+    scheduler.finished(1)
+    scheduler.finished(2)
+    assert scheduler._due == {1: first[1] + 10, 2: first[2] + 30}
+    assert scheduler.next_due() == first[1] + 10
+
+
+def test_removed_and_rescheduled_devices_leave_stale_entries_behind():
+    scheduler = ProbeScheduler(default_interval=60, jitter=0)
+    scheduler.sync([device(1), device(2)], now=0)
+
+    scheduler.remove(1)
+    scheduler.reschedule(2, 100, now=0)
+
+    assert ids(scheduler.pop_due(now=99)) == []
+    assert scheduler.next_due() == 100
+    assert ids(scheduler.pop_due(now=100)) == [2]
+    assert 1 not in scheduler and len(scheduler) == 1
+
+
+def test_devices_still_probing_are_skipped():
+    scheduler = ProbeScheduler(default_interval=10, jitter=0)
+    scheduler.add(device(1), now=0)
+
+    assert ids(scheduler.pop_due(now=10)) == [1]
+    assert ids(scheduler.pop_due(now=20)) == []          # Previous probe still running
+    scheduler.finished(1)
+    assert ids(scheduler.pop_due(now=30)) == [1]
+
+
+def test_interval_changes_apply_right_away():
+    scheduler = ProbeScheduler(default_interval=600, jitter=0)
+    scheduler.add(device(1), now=0)
+    scheduler.add(device(2, check_interval=600), now=0)
+
+    scheduler.set_default_interval(10, now=0)
+    scheduler.add(device(2, check_interval=5), now=0)
+
+    assert scheduler._due[1] < 10 and scheduler._due[2] <= 5
+
+
+def test_a_late_scheduler_does_not_catch_up_in_a_burst():
+    scheduler = ProbeScheduler(default_interval=10, jitter=0)
+    scheduler.add(device(1), now=0)
+
+    assert ids(scheduler.pop_due(now=1000)) == [1]
+    assert 1000 <= scheduler._due[1] < 1010
+
+
+def test_slots_limit_and_resize():
+    async def run():
+        slots = ProbeSlots(2)
+        release = asyncio.Event()
+        peak = []
+
+        async def probe():
+            async with slots:
+                peak.append(slots.active)
+                await release.wait()
+
+        tasks = [asyncio.create_task(probe()) for _ in range(5)]
+        await asyncio.sleep(0)
+        started_before = len(peak)
+        await slots.resize(4)
+        await asyncio.sleep(0)
+        started_after = len(peak)
+        release.set()
+        await asyncio.gather(*tasks)
+        return started_before, started_after, max(peak), slots.active
+
+    assert asyncio.run(run()) == (2, 4, 4, 0)
+
+
+def test_shrunk_slots_hold_back_new_probes_only():
+    async def run():
+        slots = ProbeSlots(3)
+        await asyncio.gather(*(slots.__aenter__() for _ in range(3)))
+        await slots.resize(1)
+        waiting = asyncio.create_task(slots.__aenter__())
+        await asyncio.sleep(0)
+        held_back = [not waiting.done()]
+        await slots.__aexit__(None, None, None)
+        await asyncio.sleep(0)
+        held_back.append(not waiting.done())             # 2 still active: above the new size
+        await slots.__aexit__(None, None, None)
+        await slots.__aexit__(None, None, None)
+        await asyncio.wait_for(waiting, 1)
+        return held_back, slots.active
+
+    assert asyncio.run(run()) == ([True, True], 1)
@@ -0,0 +1,68 @@
+import pytest
+
+from app.db import crud
+from app.settings import SETTING_DEFINITIONS, SettingsSnapshot, SettingsStore, parse_settings
+
+
+def test_values_are_parsed_to_their_types():
+    values = parse_settings({"check_interval": "60", "parallel_pings": "False", "log_level": "DEBUG", "theme": "dark"})
+
+    assert values == {"check_interval": 60, "parallel_pings": False, "log_level": "DEBUG", "theme": "dark"}
+
+
+def test_invalid_values_fall_back_to_the_default():
+    assert parse_settings({"ping_timeout": "soon"}) == {"ping_timeout": 3}
+
+
+def test_snapshot_defaults_and_extra_settings():
+    snapshot = SettingsSnapshot(1, {"max_retries": 5, "theme": "dark"})
+
+    assert snapshot.max_retries == 5
+    assert snapshot.check_interval == SETTING_DEFINITIONS["check_interval"][1]
+    assert snapshot.get("theme") == "dark" and snapshot.get("missing", "x") == "x"
+
+
+def test_snapshots_are_read_only():
+    snapshot = SettingsSnapshot(1, {"max_retries": 5})
+
+    with pytest.raises(AttributeError):
+        snapshot.max_retries = 1
+    copy = snapshot.replace(max_retries=1)
+
+    assert (snapshot.max_retries, copy.max_retries) == (5, 1)
+    assert copy.version == snapshot.version
+
+
+def test_load_initializes_the_defaults(db):
+    store = SettingsStore()
+
+    snapshot = store.load(db)
+
+    assert snapshot.version == 1
+    assert snapshot.as_dict() == {key: default for key, (_, default, _) in SETTING_DEFINITIONS.items()}
+    assert crud.get_all_settings(db)["check_interval"] == "30"
+
+
+def test_publish_bumps_the_version_only_on_change():
+    store = SettingsStore()
+    first = store.publish({"check_interval": "60"})
+
+    assert first.version == 1 and first.check_interval == 60
+    assert store.publish({"check_interval": "60"}) is first
+    second = store.publish({"check_interval": "90"})
+
+    assert second.version == 2 and store.current is second
+    assert first.check_interval == 60
+
+
+def test_update_writes_through_and_bumps_the_version(db):
+    store = SettingsStore()
+    loaded = store.load(db)
+
+    updated = store.update({"max_retries": 5, "parallel_pings": False}, db)
+
+    assert updated.version == loaded.version + 1
+    assert (updated.max_retries, updated.parallel_pings) == (5, False)
+    assert (loaded.max_retries, loaded.parallel_pings) == (3, True)
+    assert crud.get_all_settings(db)["max_retries"] == "5"
+    assert SettingsStore().load(db).max_retries == 5
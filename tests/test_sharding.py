@@ -0,0 +1,157 @@
+import queue
+from collections import Counter
+
+import pytest
+
+from app.db import crud
+from app.registry import device_registry
+from app.sharding import HashRing, ShardCoordinator, RESPAWN_DELAY
+
+
+class FakeProcess:
+    """Stands in for a worker process: started and killed by the test."""
+
+    def __init__(self, target, args, name, daemon):
+        self.alive = False
+        self.exitcode = None
+
+    def start(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def kill(self):
+        self.alive, self.exitcode = False, -9
+
+
+class FakeContext:
+    Queue = queue.Queue
+    Process = FakeProcess
+
+
+class Coordinator(ShardCoordinator):
+    """Coordinator of fake workers, keeping track of the devices each one was sent."""
+
+    def __init__(self, workers):
+        super().__init__(workers)
+        self._context = FakeContext()
+        self.shards = {}
+
+    def _start_worker(self, worker_id, join=True):
+        super()._start_worker(worker_id, join)
+        self.shards[worker_id] = set()
+
+    def shard(self, worker_id):
+        """Device IDs held by a worker, after applying the commands it was sent."""
+        inbox = self._workers[worker_id][1]
+        while not inbox.empty():
+            command, payload = inbox.get()
+            if command == "upsert":
+                self.shards[worker_id].update(record.id for record in payload)
+            elif command == "remove":
+                self.shards[worker_id].difference_update(payload)
+        return set(self.shards[worker_id])
+
+
+def test_ring_spreads_devices_over_all_nodes():
+    ring = HashRing(range(4))
+
+    counts = Counter(ring.node_for(device_id) for device_id in range(10000))
+
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 1500
+    other = HashRing(range(4))
+    assert all(ring.node_for(device_id) == other.node_for(device_id) for device_id in range(1000))
+
+
+def test_ring_only_moves_the_devices_of_a_removed_node():
+    ring = HashRing(range(4))
+    before = {device_id: ring.node_for(device_id) for device_id in range(10000)}
+
+    ring.remove(2)
+    after = {device_id: ring.node_for(device_id) for device_id in range(10000)}
+
+    moved = {device_id for device_id in before if before[device_id] != after[device_id]}
+    assert moved == {device_id for device_id, node in before.items() if node == 2}
+    assert 2 not in after.values() and len(ring) == 3
+
+    ring.add(2)
+    assert {device_id: ring.node_for(device_id) for device_id in range(10000)} == before
+
+
+def test_empty_ring_owns_nothing():
+    assert HashRing().node_for(1) is None
+
+
+@pytest.fixture
+def coordinator(db):
+    for i in range(60):
+        crud.create_device(db, {"name": f"sw-{i}", "ip": f"10.0.0.{i}", "type": "switch"})
+    device_registry.load(force=True)
+    coordinator = Coordinator(3)
+    for worker_id in range(3):
+        coordinator._start_worker(worker_id)
+    device_registry.subscribe(coordinator.on_device_change)
+    coordinator._rebalance()
+    yield coordinator
+    device_registry.unsubscribe(coordinator.on_device_change)
+    device_registry.loaded = False
+
+
+def shards(coordinator):
+    return {worker_id: coordinator.shard(worker_id) for worker_id in coordinator._workers}
+
+
+def test_every_device_is_sent_to_one_worker(coordinator):
+    held = shards(coordinator)
+
+    assert all(held.values())
+    assert sorted(device_id for devices in held.values() for device_id in devices) == \
+        sorted(record.id for record in device_registry.records())
+
+
+def test_device_changes_go_to_the_owner(db, coordinator):
+    shards(coordinator)
+    device = crud.create_device(db, {"name": "new", "ip": "10.0.1.1", "type": "router"})
+    owner = coordinator._owners[device.id]
+
+    assert device.id in coordinator.shard(owner)
+    crud.delete_device(db, device.id)
+    assert device.id not in coordinator.shard(owner) and device.id not in coordinator._owners
+
+
+def test_dead_worker_shard_is_reassigned_then_moved_back(coordinator):
+    before = shards(coordinator)
+    coordinator._workers[1][0].kill()
+
+    coordinator._check_workers(now=100)
+
+    during = shards(coordinator)
+    assert 1 not in during
+    assert during[0] | during[2] == before[0] | before[1] | before[2]
+    assert before[0] <= during[0] and before[2] <= during[2]
+
+    coordinator._check_workers(now=100 + RESPAWN_DELAY)
+    assert coordinator._workers[1][0].is_alive()
+    assert shards(coordinator)[1] == set()
+
+    coordinator._on_ready(1)
+    after = shards(coordinator)
+    assert after == before
+    assert all(coordinator._owners[device_id] == worker_id
+               for worker_id, devices in after.items() for device_id in devices)
+
+
+def test_replacement_dying_before_ready_takes_no_devices(coordinator):
+    before = shards(coordinator)
+    coordinator._workers[1][0].kill()
+    coordinator._check_workers(now=100)
+    coordinator._check_workers(now=100 + RESPAWN_DELAY)
+    during = shards(coordinator)
+
+    coordinator._workers[1][0].kill()
+    coordinator._check_workers(now=101 + RESPAWN_DELAY)
+
+    assert shards(coordinator) == {0: during[0], 2: during[2]}
+    assert during[0] | during[2] == before[0] | before[1] | before[2]
@@ -0,0 +1,22 @@
+from app.streaming import format_event
+
+
+def parse_event(message):
+    """Data of an SSE message, as EventSource delivers it."""
+    assert message.endswith("\n\n")
+    lines = message[:-2].split("\n")
+    assert all(line.startswith("data: ") for line in lines)
+    return "\n".join(line[len("data: "):] for line in lines)
+
+
+def test_multi_line_records_keep_their_lines():
+    line = ("[2026-01-01 12:00:00,000] > Error updating device status: (sqlite3.OperationalError) locked\n"
+            "[SQL: UPDATE devices SET status=? WHERE devices.id = ?]\n"
+            "(Background on this error at: https://sqlalche.me/e/20/e3q8)")
+
+    assert parse_event(format_event(line)) == line
+
+
+def test_single_line_and_empty_records():
+    assert format_event("Device 10.0.0.1 is online") == "data: Device 10.0.0.1 is online\n\n"
+    assert parse_event(format_event("")) == ""